@@ -0,0 +1,551 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import netscan_pro
+
+# --- Recorded Banners ---
+# (port, response) pairs captured from real services, used to time the fingerprint database.
+BANNER_CORPUS = [
+    (22, b"SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.6\r\n"),
+    (22, b"SSH-2.0-OpenSSH_9.6\r\n"),
+    (22, b"SSH-2.0-OpenSSH_7.4\r\n"),
+    (2222, b"SSH-2.0-dropbear_2020.81\r\n"),
+    (22, b"SSH-1.99-Cisco-1.25\r\n"),
+    (22, b"SSH-2.0-libssh_0.9.6\r\n"),
+    (22, b"SSH-2.0-Go\r\n"),
+    (21, b"220 (vsFTPd 3.0.3)\r\n"),
+    (21, b"220 ProFTPD 1.3.5e Server (Debian) [::ffff:10.0.0.5]\r\n"),
+    (21, b"220---------- Welcome to Pure-FTPd [privsep] [TLS] ----------\r\n"),
+    (21, b"220-FileZilla Server 1.7.3\r\n220 Please visit https://filezilla-project.org/\r\n"),
+    (21, b"220 Microsoft FTP Service\r\n"),
+    (25, b"220 mail.example.com ESMTP Postfix (Ubuntu)\r\n"),
+    (25, b"220 mx1.example.org ESMTP Exim 4.96 Mon, 06 May 2024 10:00:00 +0000\r\n"),
+    (587, b"220 smtp.example.net ESMTP Sendmail 8.15.2/8.15.2; Mon, 6 May 2024\r\n"),
+    (25, b"220 EXCH01.corp.local Microsoft ESMTP MAIL Service ready at Mon, 6 May 2024\r\n"),
+    (110, b"+OK Dovecot (Ubuntu) ready.\r\n"),
+    (143, b"* OK [CAPABILITY IMAP4rev1 SASL-IR LOGIN-REFERRALS ID ENABLE IDLE LITERAL+ STARTTLS AUTH=PLAIN] Dovecot (Ubuntu) ready.\r\n"),
+    (5900, b"RFB 003.008\n"),
+    (3306, b"J\x00\x00\x00\x0a8.0.36-0ubuntu0.22.04.1\x00\x08\x00\x00\x00abcdefgh\x00"),
+    (3306, b"Y\x00\x00\x00\x0a5.5.5-10.6.16-MariaDB-0ubuntu0.22.04.1\x00\x1a\x00\x00\x00"),
+    (23, b"\xff\xfd\x18\xff\xfd\x20\xff\xfd\x23\xff\xfd\x27"),
+    (6379, b"+PONG\r\n"),
+    (6379, b"-NOAUTH Authentication required.\r\n"),
+    (80, b"HTTP/1.1 200 OK\r\nDate: Mon, 06 May 2024 10:00:00 GMT\r\nServer: nginx/1.18.0 (Ubuntu)\r\nContent-Type: text/html\r\n\r\n"),
+    (80, b"HTTP/1.1 301 Moved Permanently\r\nServer: nginx\r\nLocation: https://example.com/\r\n\r\n"),
+    (8080, b"HTTP/1.1 404 Not Found\r\nDate: Mon, 06 May 2024 10:00:00 GMT\r\nServer: Apache/2.4.41 (Ubuntu)\r\n\r\n"),
+    (80, b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nServer: Microsoft-IIS/10.0\r\nX-Powered-By: ASP.NET\r\n\r\n"),
+    (8000, b"HTTP/1.0 200 OK\r\nServer: SimpleHTTP/0.6 Python/3.11.4\r\nDate: Mon, 06 May 2024 10:00:00 GMT\r\n\r\n"),
+    (8080, b"HTTP/1.1 200 OK\r\nServer: Jetty(9.4.51.v20230217)\r\n\r\n"),
+    (3000, b"HTTP/1.1 302 Found\r\nX-Powered-By: Express\r\nLocation: /login\r\n\r\n"),
+    (443, b"\x16\x03\x03\x00\x5a\x02\x00\x00\x56\x03\x03"),
+    (443, b"\x15\x03\x03\x00\x02\x02\x46"),
+    (8443, b"HTTP/1.1 400 Bad Request\r\nServer: nginx\r\n\r\nThe plain HTTP request was sent to HTTPS port"),
+    (9999, b"\x00\x00\x00\x10unknown-protocol"),
+]
+
+
+def linear_match(db, probe, data):
+    """Reference matcher: the same probes in the same order as ServiceFingerprintDB.match(),
+    but every regex is tried instead of just the response's first-byte bucket."""
+    if not data:
+        return None
+    probe = probe or db.null_probe
+    for candidate_probe in (probe, db.null_probe) if probe is not db.null_probe else (probe,):
+        for matcher in candidate_probe.matchers:
+            found = matcher["regex"].match(data)
+            if found:
+                return {
+                    "service": matcher["service"],
+                    "product": netscan_pro._expand_template(matcher["product"], found),
+                    "version": netscan_pro._expand_template(matcher["version"], found),
+                    "info": netscan_pro._expand_template(matcher["info"], found),
+                }
+    return None
+
+
+def pad_database(db, count, seed=1):
+    """Scatters `count` filler matchers through the NULL probe, anchored on every first byte
+    in turn, to model a database the size of nmap's (thousands of matchers per probe).
+    None of them match anything in BANNER_CORPUS."""
+    rng = random.Random(seed)
+    for i in range(count):
+        pattern = "^" + re.escape(chr(i % 256)) + f"netscan-filler-{i} ([\\d.]+)"
+        db.null_probe.matchers.insert(rng.randint(0, len(db.null_probe.matchers)), {
+            "order": 0, "regex": re.compile(pattern.encode("latin-1"), re.S),
+            "first_bytes": netscan_pro._regex_first_bytes(pattern),
+            "service": "filler", "product": "", "version": "", "info": ""})
+    order = 0
+    for probe in db.probes:
+        for matcher in probe.matchers:
+            matcher["order"] = order
+            order += 1
+        probe.build_index()
+
+
+def bench_fingerprint(args):
+    """Matches per second of the indexed fingerprint database vs. a linear scan of every matcher."""
+    db = netscan_pro.ServiceFingerprintDB.load(args.probe_db)
+    if args.pad:
+        pad_database(db, args.pad)
+    print(f"[*] {len(db.probes)} probes, {db.matcher_count()} matchers ({args.pad} filler), {len(BANNER_CORPUS)} recorded banners")
+    corpus = [(db.probe_for_port(port), data) for port, data in BANNER_CORPUS]
+
+    indexed_hits = 0
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for probe, data in corpus:
+            if db.match(probe, data):
+                indexed_hits += 1
+    indexed_elapsed = time.perf_counter() - start
+
+    linear_hits = 0
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for probe, data in corpus:
+            if linear_match(db, probe, data):
+                linear_hits += 1
+    linear_elapsed = time.perf_counter() - start
+
+    total = args.rounds * len(BANNER_CORPUS)
+    print(f"    indexed: {total / indexed_elapsed:12,.0f} matches/s ({indexed_hits // args.rounds}/{len(BANNER_CORPUS)} identified)")
+    print(f"    linear : {total / linear_elapsed:12,.0f} matches/s ({linear_hits // args.rounds}/{len(BANNER_CORPUS)} identified)")
+    print(f"[+] Speedup: {linear_elapsed / indexed_elapsed:.1f}x")
+
+    if args.verbose:
+        for port, data in BANNER_CORPUS:
+            match = db.match(db.probe_for_port(port), data)
+            print(f"    {port:>5} {(match['service'] if match else '-').ljust(8)} {netscan_pro.format_version(match) if match else ''}")
+
+
+# --- Simulated Network ---
+# A target farm on loopback: every address in 127/8 is local on Linux, so each farm host
+# gets its own 127.77.x.y address. Open ports are listeners that send a greeting and hang
+# up, closed ports have nothing bound (the kernel answers RST), and black-holed ports are
+# listeners with a full accept queue, which makes the kernel drop further SYNs unanswered.
+# The same ports exist over UDP: open ones echo, black-holed ones are bound but silent.
+# Latency and loss need netem, applied to lo inside a private network namespace.
+
+FARM_NETWORK = "127.77.0.0" # Port scan targets
+SWEEP_NETWORK = "127.78.0.0" # Discovery targets; all of them are up
+FARM_BANNER = b"SSH-2.0-OpenSSH_9.6 netscan-farm\r\n"
+SCAN_ENGINES = ("thread", "async", "syn-raw", "workers", "udp")
+DISCOVERY_MODES = ("icmp", "tcp")
+DEFAULT_RESULTS_FILE = "netscan_bench_results.jsonl"
+
+
+class FarmLayout:
+    """Which state every (host, port) of the farm is in, drawn from a seeded RNG so the
+    same parameters always give the same farm. Picklable: benchmark cases get a copy."""
+
+    def __init__(self, hosts, ports, open_ratio, blackhole_ratio, base_port, seed):
+        first = netscan_pro.ip_to_int(FARM_NETWORK) + 1
+        self.hosts = [netscan_pro.int_to_ip(first + i) for i in range(hosts)]
+        self.ports = netscan_pro.IntRangeSet()
+        self.ports.add(base_port, base_port + ports - 1)
+        rng = random.Random(seed)
+        self.open = set()
+        self.blackholed = set()
+        for host in self.hosts:
+            for port in range(base_port, base_port + ports):
+                draw = rng.random()
+                if draw < open_ratio:
+                    self.open.add((host, port))
+                elif draw < open_ratio + blackhole_ratio:
+                    self.blackholed.add((host, port))
+
+    def expected(self, host, port, proto="tcp"):
+        if (host, port) in self.open:
+            return "open"
+        if (host, port) in self.blackholed:
+            return "open|filtered" if proto == "udp" else "filtered"
+        return "closed"
+
+    def pair_count(self):
+        return len(self.hosts) * len(self.ports)
+
+
+class TargetFarm:
+    """Runs a FarmLayout: binds its listeners and serves the open ones from one thread."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        netscan_pro._raise_fd_limit(2 * len(layout.open) + 3 * len(layout.blackholed) + 4096)
+        self._selector = selectors.DefaultSelector()
+        self._sockets = []
+        for host, port in sorted(layout.open):
+            listener = self._listen(host, port, 128)
+            listener.setblocking(False)
+            self._selector.register(listener, selectors.EVENT_READ, "tcp")
+            self._selector.register(self._bind_udp(host, port), selectors.EVENT_READ, "udp")
+        for host, port in sorted(layout.blackholed):
+            self._bind_udp(host, port)
+            self._listen(host, port, 0)
+            filler = socket.socket() # Occupies the single accept queue slot for good
+            self._sockets.append(filler)
+            filler.setblocking(False)
+            filler.connect_ex((host, port))
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="target-farm", daemon=True)
+        self._thread.start()
+
+    def _listen(self, host, port, backlog):
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen(backlog)
+        self._sockets.append(listener)
+        return listener
+
+    def _bind_udp(self, host, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        sock.setblocking(False)
+        self._sockets.append(sock)
+        return sock
+
+    def _serve(self):
+        while self._running:
+            for key, _ in self._selector.select(timeout=0.2):
+                if key.data == "udp":
+                    try:
+                        _, address = key.fileobj.recvfrom(2048)
+                        key.fileobj.sendto(FARM_BANNER, address)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    conn, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                try:
+                    conn.send(FARM_BANNER)
+                except OSError:
+                    pass
+                conn.close()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self._selector.close()
+        for sock in self._sockets:
+            sock.close()
+
+
+def netem_supported():
+    """Whether tc can attach netem here (tried in a throwaway namespace)."""
+    if not (shutil.which("tc") and shutil.which("unshare")) or os.geteuid() != 0:
+        return False
+    probe = subprocess.run(["unshare", "--net", "tc", "qdisc", "add", "dev", "lo", "root", "netem", "delay", "1ms"],
+                           capture_output=True)
+    return probe.returncode == 0
+
+
+def apply_netem(latency, loss):
+    """Delays (ms, each direction) and drops (%) packets on lo. Only call inside a private namespace."""
+    subprocess.run(["ip", "link", "set", "lo", "up"], check=True)
+    subprocess.run(["tc", "qdisc", "add", "dev", "lo", "root", "netem", "delay", f"{latency}ms", "loss", f"{loss}%"], check=True)
+
+
+# --- Benchmark Cases ---
+
+def _peak_rss_kib():
+    """Peak resident set size of this process and any children it waited for (KiB on Linux)."""
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def _scan_case(engine, layout, options):
+    scan = {"syn-raw": "syn", "udp": "udp"}.get(engine, "connect")
+    config = {"engine": "async" if engine == "workers" else engine, "scan": scan,
+              "timeout": options["timeout"], "threads": options["threads"], "concurrency": options["concurrency"],
+              "max_per_host": netscan_pro.DEFAULT_MAX_PER_HOST}
+    rtt = netscan_pro.RttTracker(options["timeout"])
+    if engine == "workers":
+        results = netscan_pro.multiprocess_scan(layout.hosts, layout.ports, options["workers"], config, rtt)
+    else:
+        pairs = netscan_pro.interleave_pairs(layout.hosts, netscan_pro.iter_values(layout.ports))
+        results = netscan_pro.open_engine(config, pairs, rtt)
+    mismatches = {}
+    targets = correct = 0
+    for host, port, state in results:
+        targets += 1
+        expected = layout.expected(host, port, "udp" if engine == "udp" else "tcp")
+        if state.split(" ", 1)[0] == expected:
+            correct += 1
+        else:
+            key = f"{expected}->{state}"
+            mismatches[key] = mismatches.get(key, 0) + 1
+    return targets, correct, mismatches
+
+
+def _discovery_case(mode, options):
+    first = netscan_pro.ip_to_int(SWEEP_NETWORK) + 1
+    hosts = [netscan_pro.int_to_ip(first + i) for i in range(options["sweep_hosts"])]
+    rtt = netscan_pro.RttTracker(options["timeout"])
+    if mode == "icmp":
+        results = netscan_pro.ping_sweep(hosts, options["timeout"], options["threads"], rtt)
+    else:
+        ports = netscan_pro.parse_ports(netscan_pro.DEFAULT_DISCOVERY_PORTS)
+        results = netscan_pro.tcp_ping_sweep(hosts, ports, options["timeout"], options["concurrency"], rtt)
+    targets = correct = 0
+    for host, alive, _ in results:
+        targets += 1
+        correct += bool(alive)
+    mismatches = {"up->down": targets - correct} if targets > correct else {}
+    return targets, correct, mismatches
+
+
+def run_case(case, layout, options, conn):
+    """Process entry point for one benchmark case, so each gets a clean heap to measure."""
+    try:
+        start = time.perf_counter()
+        if case in DISCOVERY_MODES:
+            targets, correct, mismatches = _discovery_case(case, options)
+        else:
+            targets, correct, mismatches = _scan_case(case, layout, options)
+        elapsed = time.perf_counter() - start
+        conn.send({"targets": targets, "correct": correct, "mismatches": mismatches, "seconds": round(elapsed, 3),
+                   "rate": round(targets / elapsed, 1) if elapsed else 0.0, "peak_rss_kib": _peak_rss_kib()})
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+
+
+def available_cases(requested):
+    cases = []
+    for case in requested:
+        if case == "syn-raw" and not netscan_pro.raw_sockets_available():
+            print("[i] Skipping syn-raw: raw sockets need root.")
+        elif case == "icmp" and not netscan_pro.icmp_sweep_available():
+            print("[i] Skipping icmp: raw ICMP sockets need root.")
+        else:
+            cases.append(case)
+    return cases
+
+
+# --- Stored Results ---
+
+def _git_revision():
+    """(short commit, whether netscan_pro.py has uncommitted changes), or (None, False) outside git."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "netscan_pro.py"], cwd=here, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+def load_previous(path, scenario):
+    """Latest stored record for the same scenario, or None."""
+    previous = None
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("scenario") == scenario:
+                    previous = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def compare_runs(previous, runs, threshold):
+    """Regressions against a previous record: slower by more than `threshold`, or less accurate."""
+    regressions = []
+    for case, run in runs.items():
+        old = previous["runs"].get(case)
+        if not old or "error" in old or "error" in run:
+            continue
+        if run["rate"] < old["rate"] * (1 - threshold):
+            regressions.append(f"{case}: {run['rate']:,.0f}/s vs {old['rate']:,.0f}/s")
+        if run["correct"] / max(1, run["targets"]) < old["correct"] / max(1, old["targets"]):
+            regressions.append(f"{case}: accuracy {run['correct']}/{run['targets']} vs {old['correct']}/{old['targets']}")
+    return regressions
+
+
+def bench_network(args):
+    """Every scan engine and discovery mode against a simulated network: targets per second,
+    accuracy and peak memory, stored per commit so regressions show up."""
+    if (args.latency or args.loss) and not args.in_netns:
+        if not netem_supported():
+            print("[!] --latency/--loss need root, unshare and the sch_netem qdisc (tc qdisc ... netem).")
+            sys.exit(1)
+        # Re-run in a private network namespace so netem never touches the host's lo
+        sys.exit(subprocess.run(["unshare", "--net", sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--in-netns"]).returncode)
+    if args.in_netns:
+        apply_netem(args.latency, args.loss)
+
+    scenario = {"hosts": args.hosts, "ports": args.ports, "open": args.open, "blackhole": args.blackhole,
+                "latency_ms": args.latency, "loss_pct": args.loss, "sweep_hosts": args.sweep_hosts, "seed": args.seed,
+                "timeout": args.timeout, "threads": args.threads, "concurrency": args.concurrency, "workers": args.workers}
+    layout = FarmLayout(args.hosts, args.ports, args.open, args.blackhole, args.base_port, args.seed)
+    farm = TargetFarm(layout)
+    print(f"[*] Farm: {args.hosts} host(s) x {args.ports} port(s) from {layout.hosts[0]}: {len(layout.open)} open, "
+          f"{len(layout.blackholed)} black-holed, the rest closed. Latency {args.latency}ms, loss {args.loss}%.")
+
+    options = {"timeout": args.timeout, "threads": args.threads, "concurrency": args.concurrency,
+               "workers": args.workers, "sweep_hosts": args.sweep_hosts}
+    ctx = multiprocessing.get_context("spawn")
+    runs = {}
+    print(f"    {'case'.ljust(8)} {'targets/s':>10} {'accuracy':>13} {'peak RSS':>9} {'time':>7}")
+    try:
+        for case in available_cases(args.cases):
+            receiver, sender = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=run_case, args=(case, layout, options, sender), name=f"bench-{case}")
+            process.start()
+            sender.close()
+            try:
+                run = receiver.recv()
+            except EOFError:
+                run = {"error": f"exited with code {process.exitcode}"}
+            process.join()
+            runs[case] = run
+            if "error" in run:
+                print(f"    {case.ljust(8)} [!] {run['error']}")
+                continue
+            accuracy = f"{run['correct']}/{run['targets']}"
+            print(f"    {case.ljust(8)} {run['rate']:>10,.0f} {accuracy:>13} {run['peak_rss_kib'] / 1024:>7.1f}MB {run['seconds']:>6.2f}s")
+            if args.verbose and run["mismatches"]:
+                print(f"             mismatches: {', '.join(f'{k} x{v}' for k, v in sorted(run['mismatches'].items()))}")
+    finally:
+        farm.close()
+
+    previous = load_previous(args.results, scenario)
+    commit, dirty = _git_revision()
+    with open(args.results, "a") as f:
+        f.write(json.dumps({"time": datetime.now().isoformat(timespec="seconds"), "commit": commit, "dirty": dirty,
+                            "scenario": scenario, "runs": runs}) + "\n")
+    print(f"[+] Results appended to {args.results} (commit {commit or 'unknown'}{', modified' if dirty else ''})")
+    if previous:
+        regressions = compare_runs(previous, runs, args.threshold)
+        for regression in regressions:
+            print(f"[!] Regression since {previous['commit'] or previous['time']}: {regression}")
+        if not regressions:
+            print(f"[+] No regressions since {previous['commit'] or previous['time']} (threshold {args.threshold:.0%}).")
+        if regressions and args.check:
+            sys.exit(1)
+
+
+# --- Startup Cost ---
+
+SCANNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "netscan_pro.py")
+STARTUP_MODES = { # Short runs against a closed port, so startup and imports dominate
+    "import": ["-c", "import netscan_pro"],
+    "help": [SCANNER, "--help"],
+    "connect": [SCANNER, "-t", "127.0.0.1", "-p", "1", "-sT"],
+    "async": [SCANNER, "-t", "127.0.0.1", "-p", "1", "-sT", "--engine", "async"],
+    "udp": [SCANNER, "-t", "127.0.0.1", "-p", "1", "-sU"],
+    "syn": [SCANNER, "-t", "127.0.0.1", "-p", "1", "-sS"],
+    "ping": [SCANNER, "-t", "127.0.0.1", "-sn"],
+    "arp": [SCANNER, "--arp-scan", "127.0.0.1/32"],
+}
+
+
+def _startup_run(argv):
+    """One fresh interpreter under -X importtime: (wall seconds, import ms, modules, whether
+    Scapy was imported, or an import of it attempted)."""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=os.path.dirname(SCANNER),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    imports = [line.split("|") for line in process.stderr.splitlines() if line.startswith("import time:") and "[us]" not in line]
+    top_level = sum(int(cumulative) for _, cumulative, name in imports if not name.startswith("  "))
+    return elapsed, top_level / 1000, len(imports), any(name.strip().startswith("scapy") for _, _, name in imports)
+
+
+def bench_startup(args):
+    """Cold-start cost of each scan mode: wall time of a trivial run in a new interpreter,
+    time spent importing and how many modules got loaded."""
+    scenario = {"benchmark": "startup", "repeat": args.repeat, "python": sys.version.split()[0]}
+    runs = {}
+    print(f"    {'mode'.ljust(8)} {'wall':>8} {'imports':>9} {'modules':>8}  scapy")
+    for mode in args.modes:
+        _startup_run(STARTUP_MODES[mode]) # Warm-up: byte-compiles and fills the page cache
+        samples = sorted(_startup_run(STARTUP_MODES[mode]) for _ in range(args.repeat))
+        seconds, import_ms, modules, scapy = samples[len(samples) // 2] # Median by wall time
+        runs[mode] = {"seconds": round(seconds, 4), "import_ms": round(import_ms, 1), "modules": modules, "scapy": scapy}
+        print(f"    {mode.ljust(8)} {seconds * 1000:>6.0f}ms {import_ms:>7.0f}ms {modules:>8}  {'yes' if scapy else 'no'}")
+
+    previous = load_previous(args.results, scenario)
+    commit, dirty = _git_revision()
+    with open(args.results, "a") as f:
+        f.write(json.dumps({"time": datetime.now().isoformat(timespec="seconds"), "commit": commit, "dirty": dirty,
+                            "scenario": scenario, "runs": runs}) + "\n")
+    print(f"[+] Results appended to {args.results} (commit {commit or 'unknown'}{', modified' if dirty else ''})")
+    if previous:
+        regressions = [f"{mode}: {run['seconds'] * 1000:.0f}ms vs {previous['runs'][mode]['seconds'] * 1000:.0f}ms"
+                       for mode, run in runs.items()
+                       if mode in previous["runs"] and run["seconds"] > previous["runs"][mode]["seconds"] * (1 + args.threshold)]
+        for regression in regressions:
+            print(f"[!] Regression since {previous['commit'] or previous['time']}: {regression}")
+        if not regressions:
+            print(f"[+] No regressions since {previous['commit'] or previous['time']} (threshold {args.threshold:.0%}).")
+        if regressions and args.check:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for netscan_pro internals.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fingerprint = subparsers.add_parser("fingerprint", help="Service fingerprint matching throughput")
+    fingerprint.add_argument("--probe-db", metavar="FILE", default=netscan_pro.SERVICE_PROBES_FILE, help="Fingerprint database to load")
+    fingerprint.add_argument("--rounds", type=int, default=2000, help="Passes over the banner corpus (default: 2000)")
+    fingerprint.add_argument("--pad", type=int, default=0, metavar="N",
+                             help="Add N filler matchers to the database first; the shipped one is too small for the index to matter much, "
+                                  "nmap's has thousands (default: 0)")
+    fingerprint.add_argument("-v", "--verbose", action="store_true", help="Print what each recorded banner matched")
+    fingerprint.set_defaults(func=bench_fingerprint)
+
+    network = subparsers.add_parser("network", help="Scan engines and discovery modes against a simulated network")
+    network.add_argument("--cases", nargs="+", choices=SCAN_ENGINES + DISCOVERY_MODES, default=list(SCAN_ENGINES + DISCOVERY_MODES),
+                         help="What to run (default: all, skipping what needs privileges we lack)")
+    network.add_argument("--hosts", type=int, default=8, help="Farm hosts (default: 8)")
+    network.add_argument("--ports", type=int, default=2000, help="Ports per farm host (default: 2000)")
+    network.add_argument("--base-port", type=int, default=20000, help="First farm port (default: 20000)")
+    network.add_argument("--open", type=float, default=0.05, help="Share of open ports (default: 0.05)")
+    network.add_argument("--blackhole", type=float, default=0.02, help="Share of ports that drop SYNs (default: 0.02)")
+    network.add_argument("--latency", type=float, default=0, metavar="MS", help="Delay per packet and direction, via netem (default: 0)")
+    network.add_argument("--loss", type=float, default=0, metavar="PERCENT", help="Packet loss, via netem (default: 0)")
+    network.add_argument("--sweep-hosts", type=int, default=4096, help="Hosts swept by the discovery cases (default: 4096)")
+    network.add_argument("--seed", type=int, default=1, help="Farm layout seed (default: 1)")
+    network.add_argument("--timeout", type=float, default=0.5, help="Initial probe timeout (default: 0.5)")
+    network.add_argument("--threads", type=int, default=netscan_pro.DEFAULT_THREADS, help=f"Thread engine pool size (default: {netscan_pro.DEFAULT_THREADS})")
+    network.add_argument("--concurrency", type=int, default=netscan_pro.DEFAULT_CONCURRENCY, help=f"Async engine concurrency (default: {netscan_pro.DEFAULT_CONCURRENCY})")
+    network.add_argument("--workers", type=int, default=2, help="Processes for the workers case (default: 2)")
+    network.add_argument("--results", metavar="FILE", default=DEFAULT_RESULTS_FILE, help=f"JSON lines file results are appended to (default: {DEFAULT_RESULTS_FILE})")
+    network.add_argument("--threshold", type=float, default=0.1, help="Slowdown against the previous run of the same scenario that counts as a regression (default: 0.1)")
+    network.add_argument("--check", action="store_true", help="Exit with status 1 on a regression")
+    network.add_argument("-v", "--verbose", action="store_true", help="Break down wrong results")
+    network.add_argument("--in-netns", action="store_true", help=argparse.SUPPRESS) # Set on the re-run inside unshare
+    network.set_defaults(func=bench_network)
+
+    startup = subparsers.add_parser("startup", help="Interpreter start and import cost per scan mode")
+    startup.add_argument("--modes", nargs="+", choices=list(STARTUP_MODES), default=list(STARTUP_MODES), help="What to run (default: all)")
+    startup.add_argument("--repeat", type=int, default=5, help="Runs per mode; the median is reported (default: 5)")
+    startup.add_argument("--results", metavar="FILE", default=DEFAULT_RESULTS_FILE, help=f"JSON lines file results are appended to (default: {DEFAULT_RESULTS_FILE})")
+    startup.add_argument("--threshold", type=float, default=0.2, help="Slowdown against the previous run that counts as a regression (default: 0.2)")
+    startup.add_argument("--check", action="store_true", help="Exit with status 1 on a regression")
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
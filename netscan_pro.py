@@ -1,25 +1,87 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
+import bisect
+import errno
+import hashlib
+import heapq
+import importlib.util
+import os
+import queue
+import random
+import re
+import select
+import signal
 import socket
+import struct
 import sys
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from ipaddress import ip_network, ip_address
-from datetime import datetime
-
-# Scapy imports - will require root/admin for some operations
-try:
-    from scapy.all import IP, TCP, ICMP, sr1, Ether, ARP, srp
-    SCAPY_AVAILABLE = True
-except ImportError:
-    SCAPY_AVAILABLE = False
-    print("[!] Scapy is not installed. Some features (SYN scan, ICMP Ping, ARP scan) will be unavailable.")
-    print("[!] Please install it with: pip install scapy")
+import threading
+import time
+from array import array
+from collections import deque
+from functools import partial
+from itertools import accumulate, chain, islice
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from ipaddress import ip_network, ip_address, IPv6Address
+from math import gcd
+from datetime import datetime, timedelta
+
+# --- Deferred Imports ---
+# Most runs are plain connect or UDP scans that never touch Scapy, asyncio, the HTTP server
+# or SQLite, so those are loaded on first use instead of at startup. Modules needed by a
+# single function are imported inside it; asyncio is used all over the async engines and
+# becomes a lazy module that finishes importing on first attribute access.
+
+def _lazy_module(name):
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+asyncio = sys.modules.get("asyncio") or _lazy_module("asyncio")
+
+_scapy = None
+_scapy_checked = False
+_scapy_lock = threading.Lock()
+
+def load_scapy():
+    """Imports Scapy (seconds, hundreds of modules) the first time a SYN, ICMP or ARP
+    fallback needs it. Returns the scapy.all module, or None if it isn't installed.
+    Safe to call from worker threads."""
+    global _scapy, _scapy_checked
+    with _scapy_lock:
+        if not _scapy_checked:
+            _scapy_checked = True
+            try:
+                import scapy.all as _scapy # Scapy operations will require root/admin
+            except ImportError:
+                print("[!] Scapy is not installed. Some features (SYN scan, ICMP Ping, ARP scan) will be unavailable.")
+                print("[!] Please install it with: pip install scapy")
+    return _scapy
 
 # --- Configuration ---
 DEFAULT_TIMEOUT = 1
 DEFAULT_THREADS = 20
+DEFAULT_CONCURRENCY = 1000 # In-flight connects for --engine async
+DEFAULT_MAX_PER_HOST = 256 # In-flight probes allowed against any single host
+DEFAULT_WORKERS = 1 # Scan processes for --workers
+MAX_STATE_MATRIX = 256 * 1024 * 1024 # Bytes of per-port states ResultStore keeps before it only counts them
+DEFAULT_BANNER_THREADS = 32 # Worker pool for the -sV banner grabbing stage
+DEFAULT_ENRICH_PER_HOST = 4 # TLS/HTTP enrichment connections open at once against one host
+DEFAULT_DNS_THREADS = 32 # Concurrent hostname lookups
+DEFAULT_DNS_TTL = 300 # Seconds a cached lookup stays valid (the system resolver doesn't report record TTLs)
+DEFAULT_RATE = 1000 # Default --max-rate (probes per second) for SYN and UDP scans; connect scans are unlimited unless asked
+DEFAULT_DISCOVERY_PORTS = "80,443,22" # Ports raced per host by TCP discovery (-PS, or when ICMP needs privileges we lack)
+DEFAULT_DIFF_SAMPLE = 0.1 # Share of not-known-open ports probed by --diff-since
+DEFAULT_MIN_RTT_TIMEOUT = 0.1 # Floor for adaptive per-host timeouts
+DEFAULT_MAX_RTT_TIMEOUT = 10.0 # Ceiling for adaptive per-host timeouts
+PROGRESS_INTERVAL = 0.25 # Seconds between progress line redraws
+MAX_IPV6_EXPANSION = 65536 # IPv6 prefixes/ranges up to this size are scanned in full, larger ones sampled
+DEFAULT_IPV6_SAMPLE = 1024 # Addresses drawn from each IPv6 prefix too large to enumerate
 COMMON_TCP_PORTS = { # For simple reference, not fully used in --top-ports yet
     20: "FTP-Data", 21: "FTP", 22: "SSH", 23: "Telnet", 25: "SMTP",
     53: "DNS", 80: "HTTP", 110: "POP3", 111: "RPCBind", 135: "MS RPC",
@@ -27,188 +89,3619 @@ COMMON_TCP_PORTS = { # For simple reference, not fully used in --top-ports yet
     993: "IMAPS", 995: "POP3S", 1723: "PPTP", 3306: "MySQL", 3389: "RDP",
     5900: "VNC", 8080: "HTTP-Alt"
 }
+COMMON_UDP_PORTS = {
+    53: "DNS", 67: "DHCP", 69: "TFTP", 111: "RPCBind", 123: "NTP", 137: "NetBIOS-NS",
+    161: "SNMP", 500: "IKE", 1900: "SSDP", 5353: "mDNS", 11211: "Memcached"
+}
+
+# --- Helper Functions ---
+
+def resolve_target(target_str, family=socket.AF_INET):
+    """Resolves a hostname to an IP address of `family` (AF_INET, AF_INET6 or AF_UNSPEC)."""
+    try:
+        return socket.getaddrinfo(target_str, None, family, socket.SOCK_STREAM)[0][4][0]
+    except (socket.gaierror, IndexError):
+        print(f"[!] Could not resolve hostname: {target_str}")
+        return None
+
+def address_family(host):
+    """AF_INET6 for an IPv6 address string, AF_INET otherwise."""
+    return socket.AF_INET6 if ":" in host else socket.AF_INET
+
+class IntRangeSet:
+    """Set of integers stored as sorted, merged inclusive ranges. Used for target
+    addresses and ports so a /16 or 'all' ports costs a couple of ints, not a list."""
+
+    def __init__(self, values=()):
+        self._starts = []
+        self._ends = []
+        self._len = 0
+        self._offsets = None # Position of each range's first value, built on first lookup
+        for v in values:
+            self.add(v)
+
+    def add(self, start, end=None):
+        """Adds the inclusive range start..end (a single value if end is None)."""
+        end = start if end is None else end
+        if end < start:
+            return
+        # Every stored range that overlaps or touches [start, end] gets merged into it
+        lo = bisect.bisect_left(self._ends, start - 1)
+        hi = bisect.bisect_right(self._starts, end + 1)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+            self._len -= sum(e - s + 1 for s, e in zip(self._starts[lo:hi], self._ends[lo:hi]))
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+        self._len += end - start + 1
+        self._offsets = None
+
+    def ranges(self):
+        return zip(self._starts, self._ends)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, value):
+        i = bisect.bisect_right(self._starts, value) - 1
+        return i >= 0 and value <= self._ends[i]
+
+    def __iter__(self):
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end + 1)
+
+    def _range_offsets(self):
+        if self._offsets is None:
+            self._offsets = list(accumulate((e - s + 1 for s, e in self.ranges()), initial=0))
+        return self._offsets
+
+    def __getitem__(self, index):
+        """The index-th smallest value, without iterating (used for random ordering)."""
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("IntRangeSet index out of range")
+        offsets = self._range_offsets()
+        i = bisect.bisect_right(offsets, index) - 1
+        return self._starts[i] + index - offsets[i]
+
+    def index(self, value):
+        """Position of `value` among the set's values: the inverse of set[i]."""
+        i = bisect.bisect_right(self._starts, value) - 1
+        if i < 0 or value > self._ends[i]:
+            raise ValueError(f"{value} is not in the set")
+        return self._range_offsets()[i] + value - self._starts[i]
+
+    def __repr__(self):
+        return f"IntRangeSet({', '.join(f'{s}-{e}' if s != e else str(s) for s, e in self.ranges())})"
+
+
+def permuted_indices(n, seed=None):
+    """Yields 0..n-1 in a pseudo-random order with O(1) memory, using the affine
+    permutation i -> (a*i + c) mod n with a coprime to n."""
+    if n <= 0:
+        return
+    rng = random.Random(seed)
+    a = rng.randrange(1, n) if n > 2 else 1
+    while gcd(a, n) != 1:
+        a += 1
+    c = rng.randrange(n)
+    for i in range(n):
+        yield (a * i + c) % n
+
+
+def iter_values(int_set, randomize=False):
+    """Iterates an IntRangeSet in ascending or pseudo-random order."""
+    if not randomize:
+        return iter(int_set)
+    return (int_set[i] for i in permuted_indices(len(int_set)))
+
+
+# Target sets hold IPv4 addresses as their 32-bit value and IPv6 addresses offset by
+# IPV6_BASE, so both families share one IntRangeSet without colliding.
+IPV6_BASE = 1 << 32
+
+def ip_to_int(ip_str):
+    if ":" in ip_str:
+        return IPV6_BASE + int(IPv6Address(ip_str))
+    return struct.unpack("!I", socket.inet_aton(ip_str))[0]
+
+
+def int_to_ip(value):
+    if value >= IPV6_BASE:
+        return str(IPv6Address(value - IPV6_BASE))
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+def iter_ips(targets, randomize=False):
+    """Yields address strings for an IntRangeSet of targets (see ip_to_int), created lazily."""
+    for value in iter_values(targets, randomize):
+        yield int_to_ip(value)
+
+
+def ipv6_candidates(first, last, sample, seed):
+    """Addresses worth probing in an IPv6 range too large to enumerate: the lowest 256
+    (routers and hand-numbered hosts), then `sample` more drawn at random, half of them
+    with a low interface ID (::1-::ff) in a random /64 and half anywhere. The draw is
+    seeded by the range, so reruns and --resume see the same targets."""
+    yield from range(first + 1, min(first + 256, last) + 1) # first is the subnet-router anycast address
+    rng = random.Random(seed)
+    for i in range(sample):
+        if i % 2 and last - first >= 1 << 64:
+            subnet = rng.randrange(first >> 64, (last >> 64) + 1) << 64
+            yield subnet | rng.randrange(1, 256)
+        else:
+            yield rng.randrange(first, last + 1)
+
+
+def add_address_range(targets, version, first, last, ipv6_sample=DEFAULT_IPV6_SAMPLE):
+    """Adds first..last (ip_address integers of IP `version`) to `targets`, sampling IPv6
+    ranges larger than MAX_IPV6_EXPANSION instead of enumerating them."""
+    if version == 4:
+        targets.add(first, last)
+    elif last - first + 1 <= MAX_IPV6_EXPANSION:
+        targets.add(IPV6_BASE + first, IPV6_BASE + last)
+    else:
+        for value in ipv6_candidates(first, last, ipv6_sample, f"{first}-{last}"):
+            targets.add(IPV6_BASE + value)
+
+
+def expand_targets(targets_str, targets=None, family=socket.AF_INET, ipv6_sample=DEFAULT_IPV6_SAMPLE, resolver=None):
+    """Expands target strings (single IP, CIDR, IP range, hostname) into an IntRangeSet
+    of IPv4 and IPv6 addresses. Duplicates and overlapping networks collapse automatically;
+    hostnames resolve to an address of `family`. With a Resolver, hostnames are only
+    submitted to it: their addresses come out of resolver.completed() as lookups finish."""
+    if targets is None:
+        targets = IntRangeSet()
+    for t_str in targets_str.split(','):
+        t_str = t_str.strip()
+        if not t_str:
+            continue
+        if '/' in t_str: # CIDR
+            try:
+                network = ip_network(t_str, strict=False)
+                first, last = int(network.network_address), int(network.broadcast_address)
+                if network.version == 4 and network.prefixlen < 31: # Same hosts as network.hosts(): skip network/broadcast
+                    first, last = first + 1, last - 1
+                add_address_range(targets, network.version, first, last, ipv6_sample)
+            except ValueError:
+                print(f"[!] Invalid CIDR notation: {t_str}")
+        elif '-' in t_str and (t_str.count('.') >= 3 or ':' in t_str): # IP range, e.g. 192.168.1.1-192.168.1.10 or fd00::1-fd00::ff
+            start_str, end_str = t_str.split('-', 1)
+            try:
+                start, end = ip_address(start_str.strip()), ip_address(end_str.strip())
+                if start.version != end.version:
+                    raise ValueError
+                add_address_range(targets, start.version, int(start), int(end), ipv6_sample)
+            except ValueError:
+                print(f"[!] Invalid IP range: {t_str}")
+        else: # Single IP or hostname
+            try:
+                # Check if it's an IP address directly
+                targets.add(ip_to_int(str(ip_address(t_str))))
+            except ValueError:
+                # Not a direct IP, try to resolve as hostname
+                if resolver is not None:
+                    resolver.submit(t_str, family)
+                    continue
+                resolved_ip = resolve_target(t_str, family)
+                if resolved_ip:
+                    targets.add(ip_to_int(resolved_ip))
+    return targets
+
+def parse_ports(ports_str, top_n=None, common_ports=COMMON_TCP_PORTS):
+    """Parses port strings (e.g., "22,80,443", "1-1024", "all") into an IntRangeSet."""
+    if not ports_str and top_n:
+        return IntRangeSet(sorted(common_ports.keys())[:top_n])
+    ports = IntRangeSet()
+    if ports_str.lower() == "all":
+        ports.add(1, 65535)
+        return ports
+
+    parts = ports_str.split(',')
+    for part in parts:
+        part = part.strip()
+        try:
+            if '-' in part:
+                start, end = map(int, part.split('-'))
+                ports.add(max(start, 1), min(end, 65535))
+            else:
+                port = int(part)
+                if not 1 <= port <= 65535:
+                    raise ValueError(part)
+                ports.add(port)
+        except ValueError:
+            print(f"[!] Invalid port specified: {part}")
+    return ports
+
+
+# --- Name Resolution ---
+
+class Resolver:
+    """Concurrent hostname and reverse (PTR) lookups with an in-memory cache. getaddrinfo
+    blocks, so lookups run on a thread pool and a list of thousands of names costs about
+    its slowest lookups instead of their sum. The system resolver doesn't expose record
+    TTLs, so answers are kept for a fixed `ttl` and failures for NEGATIVE_TTL. With
+    `cache_file`, the cache is read at start and written back by close()."""
+
+    NEGATIVE_TTL = 60
+
+    def __init__(self, threads=DEFAULT_DNS_THREADS, ttl=DEFAULT_DNS_TTL, cache_file=None):
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self._cache = {} # (kind, name, family) -> (address or hostname, or None if it failed; expires at, wall clock)
+        self._lookups = {} # Same key -> Future of a lookup in flight
+        self._submitted = {} # (name, family) -> Future, for submit()/completed()
+        self._lock = threading.Lock()
+        self._executor = worker_pool(threads, "resolver")
+        self.cached = 0 # Lookups answered from the cache
+        if cache_file:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f).get("entries", [])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"[!] Ignoring unreadable DNS cache {self.cache_file}: {e}")
+            return
+        now = time.time()
+        for kind, name, family, value, expires in entries:
+            if expires > now:
+                self._cache[(kind, name, family)] = (value, expires)
+
+    def _lookup(self, key):
+        kind, name, family = key
+        try:
+            if kind == "PTR":
+                value = socket.gethostbyaddr(name)[0]
+            else:
+                value = socket.getaddrinfo(name, None, family, socket.SOCK_STREAM)[0][4][0]
+        except (OSError, IndexError): # gaierror and herror included
+            value = None
+        with self._lock:
+            self._cache[key] = (value, time.time() + (self.ttl if value else self.NEGATIVE_TTL))
+            del self._lookups[key]
+        return value
+
+    def _get(self, key):
+        """Future for a lookup: already done on a cache hit, shared if one is in flight."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.cached += 1
+                future = Future()
+                future.set_result(entry[0])
+                return future
+            future = self._lookups.get(key)
+            if future is None:
+                future = self._lookups[key] = self._executor.submit(self._lookup, key)
+            return future
+
+    def resolve(self, name, family=socket.AF_INET):
+        """Future resolving to an address of `family` for `name`, or None."""
+        return self._get(("A", name, family))
+
+    def reverse(self, address):
+        """Future resolving to the PTR name of `address`, or None."""
+        return self._get(("PTR", address, 0))
+
+    def submit(self, name, family=socket.AF_INET):
+        """Starts resolving `name` in the background; the result comes out of completed()."""
+        if (name, family) not in self._submitted: # Listed twice: resolve and report it once
+            self._submitted[(name, family)] = self.resolve(name, family)
+
+    def pending(self):
+        return len(self._submitted)
+
+    def completed(self):
+        """Yields (name, address or None) for every submitted name as its lookup finishes."""
+        futures = {future: key[0] for key, future in self._submitted.items()}
+        self._submitted = {}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if not self.cache_file:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[*key, value, expires] for key, (value, expires) in self._cache.items() if expires > now]
+        try:
+            with open(self.cache_file + ".tmp", "w") as f:
+                json.dump({"version": 1, "entries": entries}, f)
+            os.replace(self.cache_file + ".tmp", self.cache_file) # Never leave a half-written cache behind
+        except OSError as e:
+            print(f"[!] Could not save DNS cache to {self.cache_file}: {e}")
+
+
+# --- Adaptive Timeouts ---
+
+RTT_SAMPLE_STATES = ("open", "closed") # States that mean a full round trip completed
+TIMEOUT_STATES = ("filtered (timeout)", "filtered") # No answer before the deadline
+
+class RttTracker:
+    """Per-host smoothed RTT and RTT variance, updated TCP-style (RFC 6298), from which
+    per-host probe timeouts are derived. Hosts without samples use the initial timeout."""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_timeout, min_timeout=DEFAULT_MIN_RTT_TIMEOUT, max_timeout=DEFAULT_MAX_RTT_TIMEOUT):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max(max_timeout, min_timeout)
+        self._stats = {} # host -> [srtt, rttvar]
+        self._lock = threading.Lock()
+        self.listener = None # Called with every sample, e.g. ScanMetrics.observe_rtt
+
+    def observe(self, host, rtt):
+        """Feeds one measured round trip (seconds) for `host`."""
+        if self.listener is not None:
+            self.listener(rtt)
+        with self._lock:
+            stats = self._stats.get(host)
+            if stats is None:
+                self._stats[host] = [rtt, rtt / 2]
+            else:
+                srtt, rttvar = stats
+                stats[1] = (1 - self.BETA) * rttvar + self.BETA * abs(srtt - rtt)
+                stats[0] = (1 - self.ALPHA) * srtt + self.ALPHA * rtt
+
+    def __getstate__(self): # Picklable, so --workers processes start from the parent's estimates
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["listener"] = None # Metrics stay in the parent
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def srtt(self, host):
+        stats = self._stats.get(host)
+        return stats[0] if stats else None
+
+    def timeout(self, host):
+        """Probe timeout for `host`: SRTT + K*RTTVAR, clamped to [min, max]."""
+        stats = self._stats.get(host)
+        if stats is None:
+            return self.initial_timeout
+        return min(max(stats[0] + self.K * stats[1], self.min_timeout), self.max_timeout)
+
+    def retry_timeout(self, host):
+        """Backed-off timeout for the single retry of a probe that timed out."""
+        return min(self.timeout(host) * 2, self.max_timeout)
+
+
+def probe_with_retry(scan_function, host, port, timeout, rtt=None, limiter=None):
+    """Runs one blocking probe. With an RttTracker the timeout follows the host's measured RTT,
+    completed round trips feed the tracker, and a timeout is retried once with a backed-off value.
+    With a RateLimiter every attempt waits for a token and reports how it went."""
+    if limiter is not None:
+        scan_function = limiter.paced(scan_function)
+    if rtt is None:
+        return scan_function(host, port, timeout)
+    start = time.monotonic()
+    state = scan_function(host, port, rtt.timeout(host))
+    if state in RTT_SAMPLE_STATES:
+        rtt.observe(host, time.monotonic() - start)
+    elif state in TIMEOUT_STATES:
+        start = time.monotonic()
+        state = scan_function(host, port, rtt.retry_timeout(host))
+        if state in RTT_SAMPLE_STATES:
+            rtt.observe(host, time.monotonic() - start)
+    return state
+
+
+# --- Rate Limiting ---
+
+class RateLimiter:
+    """Global token bucket shared by every probing stage, with AIMD congestion control on top.
+    Probes report their outcome through observe(); once per window the timeout ratio is
+    compared with its running baseline. A spike halves the rate (down to min_rate), a
+    healthy window adds back a slice of max_rate. Comparing against the baseline rather
+    than an absolute threshold keeps networks that simply drop most ports from pinning
+    the rate at the floor. Thread-safe."""
+
+    WINDOW = 1.0 # Seconds between rate adjustments
+    MIN_SAMPLES = 20 # Outcomes needed before a window counts
+    SPIKE = 0.1 # Timeout ratio above the baseline that counts as loss
+    DECREASE = 0.5 # Multiplicative decrease on loss
+    INCREASE = 0.05 # Additive increase per healthy window, as a fraction of max_rate
+    BASELINE_GAIN = 1 / 8
+    BURST = 0.05 # Bucket depth, in seconds' worth of tokens
+
+    def __init__(self, max_rate, min_rate=None, clock=time.monotonic):
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min(min_rate, max_rate)) if min_rate else max(1.0, self.max_rate / 10)
+        self.rate = self.max_rate
+        self.decreases = 0
+        self._lock = threading.Lock()
+        self._pace_lock = threading.Lock() # Only one thread sleeps on the bucket, the rest queue behind it
+        self._clock = clock
+        self._tokens = self._depth()
+        self._refilled_at = clock()
+        self._window_start = self._refilled_at
+        self._replies = 0
+        self._timeouts = 0
+        self._baseline = None # Smoothed timeout ratio of past windows
+
+    def _depth(self):
+        return max(1.0, self.rate * self.BURST)
+
+    def reserve(self):
+        """Takes one token and returns how long to wait before using it (0 if one was ready).
+        Tokens may go into debt, so callers must actually wait; acquire() does that."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._depth(), self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self):
+        """Blocks until the calling thread may send one probe."""
+        with self._pace_lock:
+            delay = self.reserve()
+            if delay > 0:
+                time.sleep(delay)
+
+    def observe(self, state):
+        """Feeds one probe outcome (a port state) to the congestion controller."""
+        if state in TIMEOUT_STATES:
+            timed_out = True
+        elif state.startswith("error"):
+            return # Local failure, says nothing about the network
+        else:
+            timed_out = False # Any answer, even a refusal or an ICMP error
+        with self._lock:
+            if timed_out:
+                self._timeouts += 1
+            else:
+                self._replies += 1
+            now = self._clock()
+            total = self._replies + self._timeouts
+            if now - self._window_start < self.WINDOW or total < self.MIN_SAMPLES:
+                return
+            ratio = self._timeouts / total
+            if self._baseline is None:
+                self._baseline = ratio
+            elif ratio > self._baseline + self.SPIKE:
+                self.rate = max(self.min_rate, self.rate * self.DECREASE)
+                self.decreases += 1
+            else:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.INCREASE)
+            self._baseline += self.BASELINE_GAIN * (ratio - self._baseline)
+            self._tokens = min(self._tokens, self._depth())
+            self._window_start = now
+            self._replies = self._timeouts = 0
+
+    def paced(self, probe_function):
+        """Wraps a blocking probe(host, port, timeout) -> state so each call takes a token first
+        and reports its outcome."""
+        def probe(host, port, timeout):
+            self.acquire()
+            state = probe_function(host, port, timeout)
+            self.observe(state)
+            return state
+        return probe
+
+
+# --- Metrics ---
+
+class ScanMetrics:
+    """Port scan counters: results per state, probes/sec over a sliding window, probes in
+    flight, an RTT histogram and an ETA. Results are recorded from the main thread; the
+    metrics endpoint reads a consistent copy through snapshot()."""
+
+    RATE_WINDOW = 5.0 # Seconds of history behind probes/sec
+    RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds, Prometheus "le"
+
+    def __init__(self, total=0, limiter=None):
+        self.limiter = limiter
+        self.dispatched = None # Pairs handed to the engine, when the engine is local (see track())
+        self.states = {}
+        self.rtt_counts = [0] * (len(self.RTT_BUCKETS) + 1) # Last slot is +Inf
+        self.rtt_sum = 0.0
+        self._lock = threading.Lock()
+        self.begin(total)
+
+    def begin(self, total, already_done=0):
+        """Starts the clock on `total` probes, `already_done` of them finished by a previous
+        run: those count toward progress but not toward the rate."""
+        with self._lock:
+            self.total = total
+            self.completed = self.resumed = already_done
+            self.started = time.monotonic()
+            self._marks = deque([(self.started, already_done)]) # (time, completed) samples for the rate window
+
+    def track(self, pairs):
+        """Passes pairs through to an engine, counting the ones it has taken."""
+        self.dispatched = 0
+        for pair in pairs:
+            self.dispatched += 1
+            yield pair
+
+    def record(self, state):
+        """Counts one finished probe. States are grouped by their first word ("filtered
+        (timeout)" counts as "filtered") to keep the label set small."""
+        now = time.monotonic()
+        with self._lock:
+            key = state.split(" ", 1)[0]
+            self.states[key] = self.states.get(key, 0) + 1
+            self.completed += 1
+            if now - self._marks[-1][0] >= 0.5:
+                self._marks.append((now, self.completed))
+                while len(self._marks) > 2 and now - self._marks[1][0] >= self.RATE_WINDOW:
+                    self._marks.popleft()
+
+    def observe_rtt(self, seconds):
+        with self._lock:
+            self.rtt_counts[bisect.bisect_left(self.RTT_BUCKETS, seconds)] += 1
+            self.rtt_sum += seconds
+
+    def rate(self):
+        """Probes per second over the last RATE_WINDOW seconds."""
+        now = time.monotonic()
+        start, done = self._marks[0]
+        return (self.completed - done) / (now - start) if now > start else 0.0
+
+    def in_flight(self):
+        return None if self.dispatched is None else max(0, self.dispatched - (self.completed - self.resumed))
+
+    def eta(self):
+        """Seconds until the remaining probes finish at the current rate, or None."""
+        rate = self.rate()
+        return (self.total - self.completed) / rate if rate > 0 and self.total else None
+
+    def progress_line(self):
+        percent = self.completed / self.total * 100 if self.total else 100.0
+        parts = [f"Progress: {percent:.2f}% ({self.completed}/{self.total})", f"{self.rate():,.0f} pps"]
+        in_flight = self.in_flight()
+        if in_flight is not None:
+            parts.append(f"{in_flight} in flight")
+        eta = self.eta()
+        if eta is not None:
+            parts.append(f"ETA {timedelta(seconds=round(eta))}")
+        return " | ".join(parts)
+
+    def snapshot(self):
+        with self._lock:
+            return {"total": self.total, "completed": self.completed, "states": dict(self.states),
+                    "in_flight": self.in_flight(), "rate": self.rate(), "eta": self.eta(),
+                    "rtt_counts": list(self.rtt_counts), "rtt_sum": self.rtt_sum,
+                    "rate_limit": self.limiter.rate if self.limiter else None,
+                    "elapsed": time.monotonic() - self.started}
+
+    def prometheus(self):
+        """The snapshot in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = ["# TYPE netscan_probes_total counter"]
+        for state, count in sorted(snap["states"].items()):
+            lines.append(f'netscan_probes_total{{state="{state}"}} {count}')
+        lines += ["# TYPE netscan_targets gauge", f"netscan_targets {snap['total']}",
+                  "# TYPE netscan_probes_per_second gauge", f"netscan_probes_per_second {snap['rate']:.3f}",
+                  "# TYPE netscan_elapsed_seconds gauge", f"netscan_elapsed_seconds {snap['elapsed']:.3f}"]
+        if snap["in_flight"] is not None:
+            lines += ["# TYPE netscan_probes_in_flight gauge", f"netscan_probes_in_flight {snap['in_flight']}"]
+        if snap["eta"] is not None:
+            lines += ["# TYPE netscan_eta_seconds gauge", f"netscan_eta_seconds {snap['eta']:.1f}"]
+        if snap["rate_limit"] is not None:
+            lines += ["# TYPE netscan_rate_limit gauge", f"netscan_rate_limit {snap['rate_limit']:.1f}"]
+        lines.append("# TYPE netscan_rtt_seconds histogram")
+        cumulative = 0
+        for bound, count in zip(self.RTT_BUCKETS + ("+Inf",), snap["rtt_counts"]):
+            cumulative += count
+            lines.append(f'netscan_rtt_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"netscan_rtt_seconds_sum {snap['rtt_sum']:.6f}", f"netscan_rtt_seconds_count {cumulative}"]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves ScanMetrics over HTTP from a daemon thread: Prometheus text on /metrics,
+    the raw snapshot as JSON on /metrics.json."""
+
+    def __init__(self, address, metrics):
+        import http.server
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, kind = metrics.prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, kind = json.dumps(metrics.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", kind)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # Keep request logs off the progress line
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(address, Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Profiling ---
+# --profile breaks a run down by pipeline stage. Stages are marked in main() as the run moves
+# from one to the next; worker pools created through worker_pool() while a profile is active
+# also record how long tasks queued and how busy their threads were.
+
+_profile = None # The active ScanProfile, if --profile is on
+
+class PoolStats:
+    """Task timings for one named worker pool."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.tasks = 0
+        self.busy = 0.0 # Seconds spent running tasks, summed over threads
+        self.wait = 0.0 # Seconds tasks sat in the queue before a thread picked them up
+        self.max_wait = 0.0
+        self.first = self.last = None # Earliest submit and latest completion
+        self._lock = threading.Lock()
+
+    def run(self, queued, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.tasks += 1
+                self.busy += end - start
+                self.wait += start - queued
+                self.max_wait = max(self.max_wait, start - queued)
+                self.first = queued if self.first is None else min(self.first, queued)
+                self.last = end if self.last is None else max(self.last, end)
+
+    def utilisation(self):
+        """Share of the pool's thread time spent running tasks, between its first submit and last completion."""
+        span = (self.last - self.first) * self.workers if self.tasks else 0
+        return self.busy / span if span > 0 else 0.0
+
+
+class _ProfiledPool(ThreadPoolExecutor):
+    def __init__(self, workers, name, stats):
+        super().__init__(max_workers=workers, thread_name_prefix=name)
+        self._stats = stats
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(self._stats.run, time.perf_counter(), fn, *args, **kwargs)
+
+
+def worker_pool(workers, name):
+    """A ThreadPoolExecutor, instrumented under `name` when a profile is active."""
+    if _profile is None:
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    return _ProfiledPool(workers, name, _profile.pool(name, workers))
+
+
+class StackSampler:
+    """Samples every thread's stack at a fixed interval and writes the counts in the folded
+    format flamegraph.pl, speedscope and inferno read ("thread;outer;...;inner count").
+    Unlike cProfile it sees the worker threads, where a scan spends most of its time."""
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(re.sub(r"_\d+$", "", names.get(ident, "thread"))) # One root per pool, not per worker
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+class ScanProfile:
+    """Wall and CPU time per stage, the main loop's wait for engine results, and PoolStats
+    for instrumented pools. With an output path it also profiles the code: a .prof/.pstats
+    path gets cProfile statistics for the main thread (snakeviz, pstats), anything else
+    folded stack samples of all threads from StackSampler."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stages = [] # [name, wall, process CPU, main thread CPU]
+        self.pools = {}
+        self.result_wait = 0.0 # Main loop blocked waiting for the engine
+        self.results = 0
+        self._current = None
+        self._profiler = self._sampler = None
+        if path and path.endswith((".prof", ".pstats")):
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif path:
+            self._sampler = StackSampler(path)
+
+    def _clock(self):
+        return time.perf_counter(), time.process_time(), time.thread_time()
+
+    def enter(self, name):
+        """Ends the current stage, if any, and starts timing `name`."""
+        self._close_stage()
+        self._current = (name, self._clock())
+
+    def _close_stage(self):
+        if self._current:
+            name, start = self._current
+            self.stages.append([name] + [now - then for now, then in zip(self._clock(), start)])
+            self._current = None
+
+    def pool(self, name, workers):
+        stats = self.pools.get(name)
+        if stats is None:
+            stats = self.pools[name] = PoolStats(name, workers)
+        stats.workers = max(stats.workers, workers)
+        return stats
+
+    def timed_results(self, results):
+        """Passes engine results through, adding up the time spent waiting for each."""
+        results = iter(results)
+        while True:
+            start = time.perf_counter()
+            try:
+                result = next(results)
+            except StopIteration:
+                self.result_wait += time.perf_counter() - start
+                return
+            self.result_wait += time.perf_counter() - start
+            self.results += 1
+            yield result
+
+    def finish(self):
+        """Stops profiling and prints the breakdown. Registered with atexit, so interrupted
+        runs still get one."""
+        self._close_stage()
+        if self._profiler:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path)
+        if self._sampler:
+            self._sampler.close()
+        print("\n--- Profile ---")
+        print(f"  {'STAGE'.ljust(18)} {'WALL'.rjust(9)} {'CPU'.rjust(9)} {'MAIN CPU'.rjust(9)}")
+        for name, wall, cpu, main_cpu in self.stages:
+            print(f"  {name.ljust(18)} {wall:8.3f}s {cpu:8.3f}s {main_cpu:8.3f}s")
+        scan_wall = sum(wall for name, wall, _, _ in self.stages if name == "port scan")
+        if self.results and scan_wall:
+            print(f"  Result loop: {self.result_wait:.3f}s ({self.result_wait / scan_wall:.0%}) waiting on the engine, "
+                  f"{scan_wall - self.result_wait:.3f}s handling {self.results} result(s)")
+        pools = [stats for stats in self.pools.values() if stats.tasks]
+        if pools:
+            print(f"\n  {'POOL'.ljust(10)} {'WORKERS'.rjust(7)} {'TASKS'.rjust(8)} {'BUSY'.rjust(9)} {'AVG WAIT'.rjust(9)} {'MAX WAIT'.rjust(9)} {'UTIL'.rjust(5)}")
+            for stats in pools:
+                avg_wait = stats.wait / stats.tasks if stats.tasks else 0.0
+                print(f"  {stats.name.ljust(10)} {stats.workers:7d} {stats.tasks:8d} {stats.busy:8.3f}s {avg_wait * 1000:7.1f}ms "
+                      f"{stats.max_wait * 1000:7.1f}ms {stats.utilisation():5.0%}")
+        if self.path:
+            kind = "cProfile statistics (main thread)" if self._profiler else "Folded stack samples"
+            print(f"\n[+] {kind} written to {self.path}")
+
+
+# --- Scanning Functions ---
+
+def icmp_ping(host, timeout, rtt=None, limiter=None):
+    """Sends an ICMP Echo Request to a host. Requires Scapy and often root."""
+    scapy = load_scapy()
+    if scapy is None:
+        print(f"[-] ICMP Ping skipped for {host} (Scapy unavailable or not root).")
+        return False # Cannot determine liveness without Scapy here
+    try:
+        # Using Scapy for ICMP ping
+        if address_family(host) == socket.AF_INET6:
+            pkt = scapy.IPv6(dst=host)/scapy.ICMPv6EchoRequest()
+        else:
+            pkt = scapy.IP(dst=host)/scapy.ICMP()
+        if limiter is not None:
+            limiter.acquire()
+        # sr() rather than sr1(): only the copy Scapy actually sent carries sent_time
+        ans, unans = scapy.sr(pkt, timeout=timeout, verbose=0)
+        sent, resp = ans[0] if ans else (None, None)
+        alive = resp is not None and (resp.haslayer(scapy.ICMPv6EchoReply) or (resp.haslayer(scapy.ICMP) and resp[scapy.ICMP].type == 0)) # Echo Reply
+        if limiter is not None:
+            limiter.observe("up" if resp is not None else "filtered")
+        if alive and rtt is not None and getattr(sent, "sent_time", None):
+            rtt.observe(host, resp.time - sent.sent_time) # Seed the host's timeout estimate
+        return alive
+    except Exception as e:
+        # print(f"[!] Error ICMP pinging {host}: {e}") # Can be very verbose
+        return False
+
+def arp_scan_local(network_cidr, timeout, rtt=None, limiter=None):
+    """Performs an ARP scan on the local network: a batched ArpSweep on Linux as root,
+    Scapy otherwise."""
+    live_hosts = []
+    network = ip_network(network_cidr, strict=False)
+    local = _local_interface_for(network) if sys.platform.startswith("linux") else None
+    if local is not None and icmp_sweep_available(): # Same privilege (CAP_NET_RAW) as AF_PACKET
+        interface, address, mac = local
+        print(f"[*] Performing ARP sweep on {network_cidr} via {interface}...")
+        hosts = (str(h) for h in network.hosts() if str(h) != address)
+        for host, alive, detail in ArpSweep(interface, address, mac, timeout, limiter, rtt).sweep(hosts):
+            if alive:
+                live_hosts.append(host)
+                print(f"    [+] Host Found (ARP): {host} ({detail})")
+        return live_hosts
+
+    scapy = load_scapy()
+    if scapy is None:
+        print("[-] ARP Scan skipped (Scapy unavailable or not root).")
+        return []
+
+    try:
+        print(f"[*] Performing ARP scan on {network_cidr}...")
+        ans, unans = scapy.srp(scapy.Ether(dst="ff:ff:ff:ff:ff:ff")/scapy.ARP(pdst=network_cidr),
+                         timeout=timeout, verbose=0, iface_hint=network_cidr) # iface_hint helps scapy pick interface
+        for sent, received in ans:
+            live_hosts.append(received.psrc)
+            if rtt is not None and getattr(sent, "sent_time", None):
+                rtt.observe(received.psrc, received.time - sent.sent_time)
+            print(f"    [+] Host Found (ARP): {received.psrc} ({received.hwsrc})")
+    except Exception as e:
+        print(f"[!] Error during ARP scan: {e}")
+    return live_hosts
+
+
+def scan_tcp_connect(host, port, timeout, handoff=None):
+    """Attempts a TCP Connect scan on a single port. With `handoff`, an open port's
+    connection is passed on as handoff(host, port, sock) instead of being thrown away."""
+    try:
+        with socket.socket(address_family(host), socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            result = sock.connect_ex((host, port))
+            if result == 0:
+                if handoff is not None:
+                    handoff(host, port, sock.dup()) # The duplicate keeps the connection alive past this block
+                return "open"
+            if result in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ETIMEDOUT): # connect_ex reports timeouts as an errno
+                return "filtered (timeout)"
+    except socket.timeout:
+        return "filtered (timeout)" # Or just closed, hard to distinguish simply
+    except socket.error:
+        return "closed" # Connection refused, host down etc.
+    return "closed"
+
+def scan_tcp_syn(host, port, timeout):
+    """Performs a TCP SYN scan on a single port. Requires Scapy and root."""
+    scapy = load_scapy()
+    if scapy is None:
+        # Fallback or error if scapy is not available/usable
+        # print(f"[-] SYN Scan for {host}:{port} skipped (Scapy unavailable or not root). Falling back to Connect Scan.")
+        # For this example, we'll just indicate it couldn't run.
+        # In a more robust tool, you might fall back to TCP Connect.
+        return "error (scapy unavailable)"
+
+    try:
+        src_port = socket.htons(1500 + port % 1000) # Some randomness, or use RandShort() from scapy
+        ip_layer = scapy.IPv6(dst=host) if address_family(host) == socket.AF_INET6 else scapy.IP(dst=host)
+        tcp_layer = scapy.TCP(sport=src_port, dport=port, flags="S") # SYN flag
+        
+        response = scapy.sr1(ip_layer/tcp_layer, timeout=timeout, verbose=0)
+
+        if response is None:
+            return "filtered" # No response
+        elif response.haslayer(scapy.TCP):
+            if response[scapy.TCP].flags == 0x12: # SYN-ACK
+                # Send RST to close the connection gracefully (optional, good practice)
+                # rst_pkt = IP(dst=host)/TCP(sport=src_port, dport=port, flags="R")
+                # send(rst_pkt, verbose=0)
+                return "open"
+            elif response[scapy.TCP].flags == 0x14 or response[scapy.TCP].flags == 0x04: # RST-ACK or RST
+                return "closed"
+            else: # Other flags
+                return f"filtered (flags: {response[scapy.TCP].flags:#04x})"
+        elif response.haslayer(scapy.ICMP):
+            # ICMP unreachable (type 3, code 1, 2, 3, 9, 10, or 13)
+            if int(response[scapy.ICMP].type) == 3 and int(response[scapy.ICMP].code) in [1, 2, 3, 9, 10, 13]:
+                return "filtered (ICMP)"
+            else:
+                return "filtered (ICMP other)"
+        else:
+            return "filtered (unknown response)"
+            
+    except PermissionError:
+        # This will likely be caught earlier by the load_scapy() check in main() if run as non-root
+        print(f"[!] Permission denied for SYN scan on {host}:{port}. Try running as root/administrator.")
+        return "error (permission)"
+    except Exception as e:
+        # print(f"[!] Error SYN scanning {host}:{port}: {e}") # Can be verbose
+        return "error"
+
+
+def raw_sockets_available():
+    """True if we can open raw TCP sockets (Linux, root or CAP_NET_RAW)."""
+    if not sys.platform.startswith("linux"): # Other stacks don't hand inbound TCP to raw sockets
+        return False
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP).close()
+        return True
+    except OSError: # PermissionError included
+        return False
+
+
+def _source_address(dst):
+    """Local address the kernel would use to reach `dst` (no packets are sent)."""
+    with socket.socket(address_family(dst), socket.SOCK_DGRAM) as s:
+        s.connect((dst, 9))
+        return s.getsockname()[0]
+
+
+def _checksum_words(data):
+    """Unfolded one's complement sum of 16-bit big-endian words."""
+    if len(data) % 2:
+        data += b"\x00"
+    return sum(struct.unpack(f"!{len(data) // 2}H", data))
+
+
+def _fold_checksum(total):
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class SynScanner:
+    """Batched SYN scan over raw sockets. One sender thread streams SYNs built from a
+    pre-computed template; one receiver thread classifies SYN-ACK/RST/ICMP replies.
+    Probes and replies are matched statelessly through a keyed cookie stored in the
+    SYN's sequence number, so the two threads never wait on each other. IPv4 and IPv6
+    targets can be mixed; each family gets its own pair of raw sockets. Linux only."""
+
+    TCP_OPTIONS = b"\x02\x04\x05\xb4" # MSS 1460, like a real stack would send
+
+    def __init__(self, timeout, limiter=None, rtt=None):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.rtt = rtt
+        self.sport = random.randint(32768, 60999)
+        self._secret = os.urandom(16)
+        self._template = bytearray(struct.pack("!HHIIBBHHH", self.sport, 0, 0, 0, (20 + len(self.TCP_OPTIONS)) // 4 << 4,
+                                               0x02, 1024, 0, 0) + self.TCP_OPTIONS)
+        self._header_sums = {} # dst -> checksum sum of pseudo-header + constant template words
+        self._pending = {} # (host, port) -> (sent_at, deadline, attempt)
+        self._expiry = [] # Heap of (deadline, host, port); per-host timeouts differ
+        self._retries = deque() # Timed-out probes waiting for their one re-send
+        self._lock = threading.Lock()
+        self._sending = True
+        self.results = queue.Queue()
+
+    def cookie(self, host, port):
+        digest = hashlib.blake2s(f"{host}:{port}".encode(), key=self._secret, digest_size=4).digest()
+        return int.from_bytes(digest, "big")
+
+    def build_syn(self, host, port):
+        """Returns the TCP segment (header + options) for a SYN to host:port."""
+        base = self._header_sums.get(host)
+        if base is None:
+            family = address_family(host)
+            addresses = socket.inet_pton(family, _source_address(host)) + socket.inet_pton(family, host)
+            if family == socket.AF_INET6:
+                pseudo = addresses + struct.pack("!IxxxB", len(self._template), socket.IPPROTO_TCP)
+            else:
+                pseudo = addresses + struct.pack("!BBH", 0, socket.IPPROTO_TCP, len(self._template))
+            base = self._header_sums[host] = _checksum_words(pseudo) + _checksum_words(bytes(self._template))
+        seq = self.cookie(host, port)
+        segment = bytearray(self._template)
+        struct.pack_into("!HI", segment, 2, port, seq)
+        struct.pack_into("!H", segment, 16, _fold_checksum(base + port + (seq >> 16) + (seq & 0xFFFF)))
+        return segment
+
+    def _probes(self, pairs):
+        """Yields (host, port, attempt) to send: retries first, then fresh pairs. After the
+        pairs run out it keeps waiting while probes are outstanding, since they may time out
+        and need a retry."""
+        pairs = iter(pairs)
+        while True:
+            with self._lock:
+                retry = self._retries.popleft() if self._retries else None
+            if retry is not None:
+                yield retry[0], retry[1], 1
+                continue
+            pair = next(pairs, None)
+            if pair is not None:
+                yield pair[0], pair[1], 0
+                continue
+            with self._lock:
+                if not self._pending and not self._retries:
+                    return
+            time.sleep(0.01)
+
+    def _send(self, pairs):
+        socks = {} # Address family -> raw send socket, opened on first use
+        try:
+            for host, port, attempt in self._probes(pairs):
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                if self.rtt is None:
+                    timeout = self.timeout
+                else:
+                    timeout = self.rtt.retry_timeout(host) if attempt else self.rtt.timeout(host)
+                sent_at = time.monotonic()
+                with self._lock: # Register first: on fast links the reply can beat sendto() back
+                    self._pending[(host, port)] = (sent_at, sent_at + timeout, attempt)
+                    heapq.heappush(self._expiry, (sent_at + timeout, host, port))
+                try:
+                    family = address_family(host)
+                    if family not in socks:
+                        socks[family] = socket.socket(family, socket.SOCK_RAW, socket.IPPROTO_TCP)
+                    socks[family].sendto(self.build_syn(host, port), (host, 0))
+                except OSError as e:
+                    self._resolve(host, port, f"error ({e.strerror or e})")
+        finally:
+            self._sending = False
+            for sock in socks.values():
+                sock.close()
+
+    def _resolve(self, host, port, state):
+        with self._lock:
+            probe = self._pending.pop((host, port), None)
+        if probe is None:
+            return # Duplicate reply, or it already timed out
+        if self.rtt is not None and state in RTT_SAMPLE_STATES:
+            self.rtt.observe(host, time.monotonic() - probe[0])
+        if self.limiter is not None:
+            self.limiter.observe(state)
+        self.results.put((host, port, state))
+
+    def _handle_tcp(self, packet, address):
+        """IPv4 raw sockets deliver the IP header too; IPv6 ones start at the TCP header."""
+        if len(address) > 2:
+            self._handle_segment(packet, address[0])
+        else:
+            ihl = (packet[0] & 0x0F) * 4
+            self._handle_segment(packet[ihl:], socket.inet_ntoa(packet[12:16]))
+
+    def _handle_segment(self, segment, host):
+        if len(segment) < 20:
+            return
+        sport, dport, _, ack, _, flags = struct.unpack_from("!HHIIBB", segment)
+        if dport != self.sport or not flags & 0x10: # Replies to our SYNs always carry ACK
+            return
+        if (ack - 1) & 0xFFFFFFFF != self.cookie(host, sport):
+            return # Not one of ours (or a forged reply)
+        if flags & 0x04:
+            self._resolve(host, sport, "closed")
+        elif flags & 0x02:
+            self._resolve(host, sport, "open") # Kernel has no socket for it and answers with RST for us
+        else:
+            self._resolve(host, sport, f"filtered (flags: {flags:#04x})")
+
+    def _handle_icmp(self, packet, address):
+        if len(address) > 2: # ICMPv6: no IP header; the quoted packet is a fixed 40-byte IPv6 header
+            if len(packet) < 8 + 40 + 8 or packet[0] != 1 or packet[8 + 6] != socket.IPPROTO_TCP: # Destination unreachable only
+                return
+            host = socket.inet_ntop(socket.AF_INET6, packet[8 + 24:8 + 40])
+            state = "filtered (ICMP)" if packet[1] in (1, 3, 4) else "filtered (ICMP other)"
+            self._handle_quoted(packet[8 + 40:], host, state)
+            return
+        ihl = (packet[0] & 0x0F) * 4
+        if len(packet) < ihl + 8 + 20 + 8 or packet[ihl] != 3: # Destination unreachable only
+            return
+        code = packet[ihl + 1]
+        inner = packet[ihl + 8:]
+        inner_ihl = (inner[0] & 0x0F) * 4
+        if inner[9] != socket.IPPROTO_TCP or len(inner) < inner_ihl + 8:
+            return
+        state = "filtered (ICMP)" if code in (1, 2, 3, 9, 10, 13) else "filtered (ICMP other)"
+        self._handle_quoted(inner[inner_ihl:], socket.inet_ntoa(inner[16:20]), state)
+
+    def _handle_quoted(self, segment, host, state):
+        """Matches the start of a SYN quoted in an ICMP error back to its probe."""
+        if len(segment) < 8:
+            return
+        sport, dport, seq = struct.unpack_from("!HHI", segment)
+        if sport != self.sport or seq != self.cookie(host, dport):
+            return
+        self._resolve(host, dport, state)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, host, port = heapq.heappop(self._expiry)
+                probe = self._pending.get((host, port))
+                if probe is None or probe[1] > now:
+                    continue # Answered already, or superseded by a retry
+                del self._pending[(host, port)]
+                if self.limiter is not None:
+                    self.limiter.observe("filtered")
+                if self.rtt is not None and probe[2] == 0:
+                    self._retries.append((host, port))
+                else:
+                    self.results.put((host, port, "filtered"))
+            return not self._sending and not self._pending and not self._retries
+
+    def _receive(self, handlers):
+        while True:
+            readable, _, _ = select.select(list(handlers), [], [], 0.05)
+            for sock in readable:
+                while True: # Drain everything queued before checking deadlines again
+                    try:
+                        packet, address = sock.recvfrom(65535)
+                    except BlockingIOError:
+                        break
+                    handlers[sock](packet, address)
+            if self._expire():
+                return
+
+    def scan(self, pairs):
+        """Yields (host, port, state) for every pair, in completion order."""
+        handlers = {
+            socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP): self._handle_tcp,
+            socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP): self._handle_icmp,
+        }
+        try:
+            handlers[socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_TCP)] = self._handle_tcp
+            handlers[socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_ICMPV6)] = self._handle_icmp
+        except OSError:
+            pass # No IPv6 on this system; sends to IPv6 targets fail and report an error
+        done = object()
+        for sock in handlers:
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+        def receive():
+            try:
+                self._receive(handlers)
+            finally:
+                self.results.put(done)
+
+        receiver = threading.Thread(target=receive, name="syn-receiver", daemon=True)
+        sender = threading.Thread(target=self._send, args=(pairs,), name="syn-sender", daemon=True)
+        receiver.start() # Listen before the first SYN goes out
+        sender.start()
+        try:
+            while True:
+                item = self.results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            for sock in handlers:
+                sock.close()
+
+
+def syn_scan(pairs, timeout, limiter=None, rtt=None):
+    """Batched raw-socket SYN scan (see SynScanner). Yields (host, port, state)."""
+    return SynScanner(timeout, limiter, rtt).scan(pairs)
+
+
+# --- UDP Scanning ---
+
+# Datagrams that make a listening service answer; an empty one rarely does
+UDP_PAYLOADS = {
+    53: b"\x4e\x53\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01", # DNS query: root NS
+    5353: b"\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x09_services\x07_dns-sd\x04_udp\x05local\x00\x00\x0c\x00\x01", # mDNS service listing
+    69: b"\x00\x01netscan\x00octet\x00", # TFTP read request; a "file not found" error still means open
+    111: b"\x4e\x53\x50\x31\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01\x86\xa0\x00\x00\x00\x02" + b"\x00" * 20, # RPC portmap NULL call
+    123: b"\x1b" + b"\x00" * 47, # NTP v3 client request
+    137: b"\x4e\x53\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x20CKAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA\x00\x00\x21\x00\x01", # NetBIOS NBSTAT
+    161: b"\x30\x29\x02\x01\x00\x04\x06public\xa0\x1c\x02\x04\x4e\x53\x50\x31\x02\x01\x00\x02\x01\x00"
+         b"\x30\x0e\x30\x0c\x06\x08\x2b\x06\x01\x02\x01\x01\x01\x00\x05\x00", # SNMPv1 GET sysDescr.0, community "public"
+    1900: b"M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\nMAN: \"ssdp:discover\"\r\nMX: 1\r\nST: ssdp:all\r\n\r\n",
+    11211: b"\x00\x01\x00\x00\x00\x01\x00\x00stats\r\n", # memcached UDP frame + stats
+}
+UDP_RETRIES = 2 # Re-sends for a silent port on a host known to answer; ICMP rate limiting drops many replies
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11) # Linux: queue ICMP errors on unconnected sockets
+IPV6_RECVERR = getattr(socket, "IPV6_RECVERR", 25)
+SO_EE_ORIGIN_ICMP = 2
+SO_EE_ORIGIN_ICMP6 = 3
+
+def udp_errors_available():
+    """True if ICMP port unreachables can be matched to probes (Linux IP_RECVERR)."""
+    return sys.platform.startswith("linux") and hasattr(socket, "MSG_ERRQUEUE")
+
+
+class UdpScanner:
+    """Batched UDP scan from one unprivileged socket. A sender thread streams a
+    protocol-specific payload to each port while a receiver thread takes replies (open)
+    and, through Linux's IP_RECVERR error queue, the ICMP errors they caused: port
+    unreachable is closed, other unreachables are filtered. Silence is open|filtered.
+    Hosts ration ICMP errors (Linux: a burst, then about one per second), so silent ports
+    on a host that has answered before are retried. Once a retry gets the answer the first
+    probe didn't, probes to that host are spaced out to the rate it has been answering at
+    (at least doubling on each new loss), while other hosts go on at full speed; ports that
+    went silent before pacing began get their retries again at the new pace. IPv6 targets
+    go through a second socket; ICMPv6 errors are read the same way."""
+
+    MIN_HOST_DELAY = 0.001 # Seconds between probes to a host found rationing its replies
+    MAX_HOST_DELAY = 1.0
+    RAISE_INTERVAL = 0.5 # A burst of drops raises a host's delay once, not once per lost reply
+    RETRY_SPACING = 1.0 # Seconds between tries of a port on a host that answers: lets its ICMP budget refill
+    DELAY_DECAY = 0.95 # Applied to a paced host's delay for every first-try answer
+    MAX_WAITING = 10000 # Paced probes held back before the sender stops taking new pairs
+
+    def __init__(self, timeout, limiter=None, rtt=None):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.rtt = rtt
+        self._pending = {} # (host, port) -> (sent_at, deadline, attempt)
+        self._expiry = [] # Heap of (deadline, host, port)
+        self._waiting = [] # Heap of (send_at, seq, host, port, attempt) for paced hosts and retries
+        self._seq = 0
+        self._delay = {} # host -> seconds between probes, once it is paced
+        self._raised_at = {} # host -> when its delay last went up
+        self._paced_since = {} # host -> when it was first found rationing
+        self._answer_times = {} # host -> deque of recent answer times, to estimate its reply rate
+        self._next_send = {} # host -> earliest time the next probe to it may go out
+        self._answered = set() # Hosts that replied at least once, so their silence means something
+        self._lock = threading.Lock()
+        self._sending = True
+        self.results = queue.Queue()
+
+    def _schedule(self, host, port, attempt, now, earliest=0):
+        """Queues a probe at the host's next free slot, not before `earliest`. Returns True
+        if that slot is now. Lock held."""
+        delay = self._delay.get(host)
+        if not delay:
+            if not attempt:
+                return True
+            send_at = max(now, earliest)
+        else:
+            send_at = max(now, earliest, self._next_send.get(host, now))
+            self._next_send[host] = send_at + delay
+            if send_at <= now and not attempt:
+                return True
+        self._seq += 1
+        heapq.heappush(self._waiting, (send_at, self._seq, host, port, attempt))
+        return False
+
+    def _probes(self, pairs):
+        """Yields (host, port, attempt) as each becomes due: held-back probes first, then fresh
+        pairs, which wait their turn if their host is being paced."""
+        pairs = iter(pairs)
+        exhausted = False
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                if self._waiting and self._waiting[0][0] <= now:
+                    _, _, host, port, attempt = heapq.heappop(self._waiting)
+                    due = True
+                elif exhausted or len(self._waiting) >= self.MAX_WAITING:
+                    if exhausted and not self._pending and not self._waiting:
+                        return
+                    due = False
+                else:
+                    pair = next(pairs, None)
+                    if pair is None:
+                        exhausted = True
+                        continue
+                    host, port, attempt = pair[0], pair[1], 0
+                    due = self._schedule(host, port, 0, now)
+                    if not due:
+                        continue
+                wait = self._waiting[0][0] - now if self._waiting else 0.01
+            if due:
+                yield host, port, attempt
+            else:
+                time.sleep(min(max(wait, 0.001), 0.01))
+
+    def _send(self, socks, pairs):
+        try:
+            for host, port, attempt in self._probes(pairs):
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                if self.rtt is None:
+                    timeout = self.timeout
+                else:
+                    timeout = self.rtt.retry_timeout(host) if attempt else self.rtt.timeout(host)
+                sent_at = time.monotonic()
+                with self._lock: # Register first: on fast links the reply can beat sendto() back
+                    self._pending[(host, port)] = (sent_at, sent_at + timeout, attempt)
+                    heapq.heappush(self._expiry, (sent_at + timeout, host, port))
+                error = None
+                sock = socks.get(address_family(host))
+                for _ in range(3 if sock else 0):
+                    try:
+                        sock.sendto(UDP_PAYLOADS.get(port, b""), (host, port))
+                        break
+                    except BlockingIOError:
+                        select.select([], [sock], [], 0.1) # Send buffer full
+                    except OSError as e:
+                        # An earlier probe's ICMP error surfaces on the next call and the datagram
+                        # isn't sent; that error is in the queue already, so just try again
+                        error = e
+                else:
+                    if sock is None:
+                        self._resolve(host, port, "error (no IPv6 support)")
+                    else:
+                        self._resolve(host, port, f"error ({error.strerror if error else 'send buffer full'})")
+        finally:
+            self._sending = False
+
+    def _resolve(self, host, port, state):
+        with self._lock:
+            probe = self._pending.pop((host, port), None)
+            if state in RTT_SAMPLE_STATES:
+                self._answered.add(host)
+                if probe is not None:
+                    self._adjust_delay(host, probe[2])
+        if probe is None:
+            return # Duplicate reply, or it already timed out
+        if self.rtt is not None and state in RTT_SAMPLE_STATES:
+            self.rtt.observe(host, time.monotonic() - probe[0])
+        if self.limiter is not None:
+            self.limiter.observe(state)
+        self.results.put((host, port, state))
+
+    def _adjust_delay(self, host, attempt):
+        """A retry's answer means the first reply went missing: the host is rationing, so
+        slow down to the rate it answered at over the last second. First-try answers wear
+        the delay down again. Lock held."""
+        delay = self._delay.get(host, 0)
+        now = time.monotonic()
+        answers = self._answer_times.setdefault(host, deque(maxlen=64))
+        answers.append(now)
+        if attempt and now - self._raised_at.get(host, 0) >= self.RAISE_INTERVAL:
+            recent = sum(1 for t in answers if now - t <= 1.0)
+            self._delay[host] = min(self.MAX_HOST_DELAY, max(self.MIN_HOST_DELAY, delay * 2, 1.0 / recent))
+            self._raised_at[host] = now
+            self._paced_since.setdefault(host, now)
+        elif not attempt and delay:
+            delay *= self.DELAY_DECAY
+            if delay < self.MIN_HOST_DELAY:
+                del self._delay[host]
+            else:
+                self._delay[host] = delay
+
+    def _read_errors(self, sock):
+        """Drains the IP_RECVERR queue: one entry per ICMP error, addressed by the original
+        destination."""
+        if sock.family == socket.AF_INET6: # Destination unreachable is type 1, port unreachable code 4
+            level, kind, expected_origin, unreachable, port_code, filtered_codes = socket.IPPROTO_IPV6, IPV6_RECVERR, SO_EE_ORIGIN_ICMP6, 1, 4, (1, 3)
+        else:
+            level, kind, expected_origin, unreachable, port_code, filtered_codes = socket.IPPROTO_IP, IP_RECVERR, SO_EE_ORIGIN_ICMP, 3, 3, (1, 2, 9, 10, 13)
+        while True:
+            try:
+                _, ancillary, _, address = sock.recvmsg(512, 512, socket.MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                return
+            for cmsg_level, cmsg_type, data in ancillary:
+                if cmsg_level != level or cmsg_type != kind or len(data) < 16:
+                    continue
+                _, origin, icmp_type, code = struct.unpack_from("=IBBB", data)
+                if origin != expected_origin or icmp_type != unreachable:
+                    continue
+                if code == port_code:
+                    self._resolve(address[0], address[1], "closed")
+                else:
+                    self._resolve(address[0], address[1], "filtered (ICMP)" if code in filtered_codes else "filtered (ICMP other)")
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, host, port = heapq.heappop(self._expiry)
+                probe = self._pending.get((host, port))
+                if probe is None or probe[1] > now:
+                    continue # Answered already, or superseded by a retry
+                del self._pending[(host, port)]
+                if self.limiter is not None:
+                    self.limiter.observe("filtered")
+                earliest = 0
+                if host in self._answered: # Silence from a host that talks may be a rationed reply
+                    retries = UDP_RETRIES
+                    earliest = probe[0] + self.RETRY_SPACING
+                else:
+                    retries = 1 if self.rtt is not None else 0
+                attempt = probe[2]
+                if probe[0] < self._paced_since.get(host, 0):
+                    attempt = 0 # Went out before we knew to pace this host: its tries don't count
+                if attempt < retries:
+                    self._schedule(host, port, attempt + 1, now, earliest)
+                else:
+                    self.results.put((host, port, "open|filtered"))
+            return not self._sending and not self._pending and not self._waiting
+
+    def _receive(self, socks):
+        while True:
+            readable, _, _ = select.select(socks, [], [], 0.05)
+            for sock in readable:
+                while True: # Drain everything queued before checking deadlines again
+                    try:
+                        _, address = sock.recvfrom(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError: # Pending ICMP error reported here too; the queue has the details
+                        continue
+                    self._resolve(address[0], address[1], "open")
+                if udp_errors_available():
+                    self._read_errors(sock)
+            if self._expire():
+                return
+
+    def scan(self, pairs):
+        """Yields (host, port, state) for every pair, in completion order."""
+        socks = {}
+        for family, level, option in ((socket.AF_INET, socket.IPPROTO_IP, IP_RECVERR),
+                                      (socket.AF_INET6, socket.IPPROTO_IPV6, IPV6_RECVERR)):
+            try:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+            except OSError:
+                continue # No IPv6 on this system
+            socks[family] = sock
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            if udp_errors_available():
+                sock.setsockopt(level, option, 1)
+        done = object()
+
+        def receive():
+            try:
+                self._receive(list(socks.values()))
+            finally:
+                self.results.put(done)
+
+        receiver = threading.Thread(target=receive, name="udp-receiver", daemon=True)
+        sender = threading.Thread(target=self._send, args=(socks, pairs), name="udp-sender", daemon=True)
+        receiver.start()
+        sender.start()
+        try:
+            while True:
+                item = self.results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            for sock in socks.values():
+                sock.close()
+
+
+def udp_scan(pairs, timeout, limiter=None, rtt=None):
+    """Batched UDP scan (see UdpScanner). Yields (host, port, state)."""
+    return UdpScanner(timeout, limiter, rtt).scan(pairs)
+
+
+# --- Host Discovery ---
+
+class HostSweep:
+    """Batched host discovery. A sender thread streams probes from one raw socket while a
+    receiver thread matches replies on a shared listener, so a sweep costs its send time
+    plus a single timeout rather than a full timeout per host. Subclasses provide the
+    sockets, the probe for a host and the reply parser; each address family they list in
+    `families` gets its own pair of sockets."""
+
+    families = (socket.AF_INET,)
+
+    def __init__(self, timeout, limiter=None, rtt=None):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.rtt = rtt
+        self._pending = {} # host -> sent_at
+        self._expiry = deque() # (deadline, host); one timeout for every probe, so deadlines come in order
+        self._lock = threading.Lock()
+        self._sending = True
+        self._stopped = False
+        self.results = queue.Queue()
+
+    def open_socket(self, family):
+        raise NotImplementedError
+
+    def build_probe(self, host):
+        raise NotImplementedError
+
+    def send_probe(self, sock, host, probe):
+        sock.sendto(probe, (host, 0))
+
+    def parse_reply(self, packet, address, family):
+        """Returns (host, detail) for a reply to one of our probes, else None."""
+        raise NotImplementedError
+
+    def _send(self, socks, hosts):
+        try:
+            for host in hosts:
+                if self._stopped:
+                    return
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                probe = self.build_probe(host)
+                sent_at = time.monotonic()
+                with self._lock: # Register first, as in SynScanner: replies can beat sendto() back
+                    if host in self._pending:
+                        continue # Same host already in flight (expand_targets has collapsed true duplicates)
+                    self._pending[host] = sent_at
+                    self._expiry.append((sent_at + self.timeout, host))
+                sock = socks.get(address_family(host))
+                if sock is None:
+                    self._resolve(host, False, "error (address family not supported)")
+                    continue
+                try:
+                    self.send_probe(sock, host, probe)
+                except OSError as e:
+                    self._resolve(host, False, f"error ({e.strerror or e})")
+        finally:
+            self._sending = False
+
+    def _resolve(self, host, alive, detail=None):
+        with self._lock:
+            sent_at = self._pending.pop(host, None)
+        if sent_at is None:
+            return # Duplicate reply, or it already timed out
+        if alive:
+            if self.rtt is not None:
+                self.rtt.observe(host, time.monotonic() - sent_at) # Seeds the port scan's timeouts
+            if self.limiter is not None:
+                self.limiter.observe("up")
+        self.results.put((host, alive, detail))
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, host = self._expiry.popleft()
+                if self._pending.pop(host, None) is not None:
+                    if self.limiter is not None:
+                        self.limiter.observe("filtered")
+                    self.results.put((host, False, None))
+            return not self._sending and not self._pending
+
+    def _receive(self, socks):
+        while True:
+            readable, _, _ = select.select(socks, [], [], 0.05)
+            for sock in readable:
+                while True: # Drain everything queued before checking deadlines again
+                    try:
+                        packet, address = sock.recvfrom(65535)
+                    except BlockingIOError:
+                        break
+                    reply = self.parse_reply(packet, address, sock.family)
+                    if reply is not None:
+                        self._resolve(reply[0], True, reply[1])
+            if self._expire():
+                return
+
+    def sweep(self, hosts):
+        """Yields (host, alive, detail) for every host: replies as they arrive, silent hosts
+        once their timeout has passed. detail is protocol specific (the MAC for ARP) or an
+        error string for probes that could not be sent."""
+        send_socks, listen_socks = {}, []
+        for family in self.families:
+            try:
+                send_socks[family] = self.open_socket(family)
+            except OSError:
+                if family == self.families[0]:
+                    raise
+                continue # No IPv6 on this system; those hosts report an error
+            listen_sock = self.open_socket(family)
+            listen_sock.setblocking(False)
+            listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            listen_socks.append(listen_sock)
+        done = object()
+
+        def receive():
+            try:
+                self._receive(listen_socks)
+            finally:
+                self.results.put(done)
+
+        receiver = threading.Thread(target=receive, name=f"{type(self).__name__.lower()}-receiver", daemon=True)
+        sender = threading.Thread(target=self._send, args=(send_socks, hosts), name=f"{type(self).__name__.lower()}-sender", daemon=True)
+        receiver.start() # Listen before the first probe goes out
+        sender.start()
+        try:
+            while True:
+                item = self.results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            self._stopped = True
+            sender.join()
+            for sock in list(send_socks.values()) + listen_socks:
+                sock.close()
+
+
+class IcmpSweep(HostSweep):
+    """ICMP echo sweep. Replies are matched by our echo identifier plus a keyed per-host
+    cookie carried in the sequence number and payload, so no per-probe state is needed
+    to recognise them. IPv6 hosts get ICMPv6 echo requests."""
+
+    families = (socket.AF_INET, socket.AF_INET6)
+
+    def __init__(self, timeout, limiter=None, rtt=None):
+        super().__init__(timeout, limiter, rtt)
+        self.ident = random.randint(0, 0xFFFF)
+        self._secret = os.urandom(16)
+
+    def cookie(self, host):
+        return hashlib.blake2s(host.encode(), key=self._secret, digest_size=4).digest()
+
+    def open_socket(self, family):
+        if family == socket.AF_INET6:
+            return socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_ICMPV6)
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+
+    def build_probe(self, host):
+        cookie = self.cookie(host)
+        if address_family(host) == socket.AF_INET6: # The kernel fills in ICMPv6 checksums
+            return struct.pack("!BBHHH", 128, 0, 0, self.ident, int.from_bytes(cookie[:2], "big")) + cookie
+        packet = bytearray(struct.pack("!BBHHH", 8, 0, 0, self.ident, int.from_bytes(cookie[:2], "big")) + cookie)
+        struct.pack_into("!H", packet, 2, _fold_checksum(_checksum_words(bytes(packet))))
+        return packet
+
+    def parse_reply(self, packet, address, family):
+        if family == socket.AF_INET6: # No IP header on ICMPv6 raw sockets
+            ihl, reply_type, host = 0, 129, address[0]
+        else:
+            ihl, reply_type, host = (packet[0] & 0x0F) * 4, 0, socket.inet_ntoa(packet[12:16])
+        if len(packet) < ihl + 12 or packet[ihl] != reply_type: # Echo replies only (we also see our own requests)
+            return None
+        ident, seq = struct.unpack_from("!HH", packet, ihl + 4)
+        if ident != self.ident:
+            return None # Another ping running on this machine
+        cookie = self.cookie(host)
+        if seq != int.from_bytes(cookie[:2], "big") or packet[ihl + 8:ihl + 12] != cookie:
+            return None
+        return host, None
+
+
+class ArpSweep(HostSweep):
+    """ARP who-has sweep over an AF_PACKET socket on the interface facing the target
+    network. Replies are matched by sender protocol address. Linux only."""
+
+    ETH_P_ARP = 0x0806
+
+    def __init__(self, interface, src_ip, src_mac, timeout, limiter=None, rtt=None):
+        super().__init__(timeout, limiter, rtt)
+        self.interface = interface
+        self._header = (b"\xff" * 6 + src_mac + struct.pack("!HHHBBH", self.ETH_P_ARP, 1, 0x0800, 6, 4, 1)
+                        + src_mac + socket.inet_aton(src_ip) + b"\x00" * 6) # Everything but the target address
+
+    def open_socket(self, family):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(self.ETH_P_ARP))
+        sock.bind((self.interface, 0))
+        return sock
+
+    def build_probe(self, host):
+        return self._header + socket.inet_aton(host)
+
+    def send_probe(self, sock, host, probe):
+        sock.send(probe)
+
+    def parse_reply(self, frame, address, family):
+        if len(frame) < 42 or frame[12:14] != b"\x08\x06" or frame[20:22] != b"\x00\x02": # ARP is-at
+            return None
+        return socket.inet_ntoa(frame[28:32]), ":".join(f"{b:02x}" for b in frame[22:28])
+
+
+def icmp_sweep_available():
+    """True if we can open a raw ICMP socket (root or CAP_NET_RAW)."""
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP).close()
+        return True
+    except OSError:
+        return False
+
+
+def _local_interface_for(network):
+    """(name, address, mac) of the local interface whose subnet overlaps `network`, or None.
+    Uses Linux interface ioctls."""
+    try:
+        import fcntl
+        interfaces = socket.if_nameindex()
+    except (ImportError, AttributeError, OSError):
+        return None
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _, name in interfaces:
+            request = struct.pack("256s", name.encode()[:15])
+            try:
+                address = socket.inet_ntoa(fcntl.ioctl(s.fileno(), 0x8915, request)[20:24]) # SIOCGIFADDR
+                netmask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), 0x891B, request)[20:24]) # SIOCGIFNETMASK
+                mac = fcntl.ioctl(s.fileno(), 0x8927, request)[18:24] # SIOCGIFHWADDR
+            except OSError:
+                continue # No IPv4 address on this interface
+            if mac != b"\x00" * 6 and ip_network(f"{address}/{netmask}", strict=False).overlaps(network):
+                return name, address, mac
+    return None
+
+
+def scapy_ping_available():
+    """True if per-host Scapy pings can stand in for IcmpSweep without raw sockets: Scapy is
+    installed and this isn't Linux, where it needs the same privilege. Elsewhere it sends
+    through pcap (BPF on macOS, Npcap on Windows), which unprivileged users may be allowed
+    to open. Doesn't import Scapy."""
+    return not sys.platform.startswith("linux") and importlib.util.find_spec("scapy") is not None
+
+
+def ping_sweep(hosts, timeout, threads, rtt=None, limiter=None):
+    """ICMP host discovery. Yields (host, alive, error) for every host, using one batched
+    IcmpSweep when raw sockets are available and per-host Scapy pings otherwise (see
+    scapy_ping_available())."""
+    if icmp_sweep_available():
+        yield from IcmpSweep(timeout, limiter, rtt).sweep(hosts) # detail is None or an error
+        return
+    with worker_pool(threads, "ping") as executor:
+        for host, future in bounded_as_completed(executor, icmp_ping, hosts, threads * 2, timeout, rtt, limiter):
+            try:
+                yield host, future.result(), None
+            except Exception as e:
+                yield host, False, str(e)
+
+
+async def _async_tcp_ping_port(loop, host, port, timeout):
+    """One discovery connect. Returns True on SYN-ACK or RST (the host answered), else False."""
+    sock = socket.socket(address_family(host), socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00") # RST, no TIME_WAIT
+        return True
+    except ConnectionRefusedError:
+        return True
+    except (asyncio.TimeoutError, OSError): # Timeout, host/network unreachable ...
+        return False
+    finally:
+        sock.close()
+
+
+async def _async_tcp_ping(loop, host, ports, timeout, rtt=None, limiter=None, pace=None):
+    """Races connects to every port in `ports`. Returns the first port that answered (the
+    rest are cancelled), or None if none did."""
+    start = time.monotonic()
+    attempts = {}
+    for port in ports:
+        if limiter is not None:
+            async with pace:
+                delay = limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        attempts[asyncio.ensure_future(_async_tcp_ping_port(loop, host, port, timeout))] = port
+    try:
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.result():
+                    if rtt is not None:
+                        rtt.observe(host, time.monotonic() - start)
+                    if limiter is not None:
+                        limiter.observe("up")
+                    return attempts[attempt]
+        if limiter is not None:
+            limiter.observe("filtered")
+        return None
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+
+async def _async_tcp_ping_run(hosts, ports, timeout, workers, results, rtt=None, limiter=None):
+    loop = asyncio.get_running_loop()
+    hosts = iter(hosts)
+    pace = asyncio.Lock()
+
+    async def worker():
+        for host in hosts: # Sharing the iterator is safe: all workers run on the loop thread
+            port = await _async_tcp_ping(loop, host, ports, timeout, rtt, limiter, pace)
+            results.put((host, port is not None, port))
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def tcp_ping_sweep(hosts, ports, timeout, concurrency=DEFAULT_CONCURRENCY, rtt=None, limiter=None):
+    """Unprivileged host discovery: races non-blocking connects to a few ports per host and
+    counts the host as up on the first SYN-ACK or RST. Yields (host, alive, port that answered)."""
+    ports = list(ports)
+    fd_limit = _raise_fd_limit(concurrency + 64)
+    workers = max(1, min(concurrency, fd_limit - 64) // max(1, len(ports))) # Each host holds one socket per port
+    return _drive_event_loop(lambda results: _async_tcp_ping_run(hosts, ports, timeout, workers, results, rtt, limiter),
+                             "tcp-ping-engine")
+
+
+def grab_service_response(host, port, timeout=2, sock=None, payload=b""):
+    """Connects to an open TCP port (or reuses `sock`, an already-connected socket from the
+    connect scan), sends `payload` if any and reads the reply. Returns (data, error) where
+    error is a placeholder banner like "(banner grab timeout)" if nothing came back."""
+    try:
+        if sock is None:
+            sock = socket.socket(address_family(host), socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect((host, port))
+        else:
+            sock.settimeout(timeout) # Also switches a socket from the async engine back out of non-blocking mode
+        with sock as s:
+            if payload:
+                s.sendall(payload)
+            # Try to receive a small amount of data
+            # Be careful with large banners or services that wait for client input
+            data = s.recv(4096)
+            return data, None if data else "(empty response)"
+    except socket.timeout:
+        return b"", "(banner grab timeout)"
+    except ConnectionRefusedError:
+        return b"", "(connection refused for banner)" # Should not happen if port reported open
+    except Exception:
+        return b"", "(banner grab error)"
+    finally:
+        if sock is not None:
+            sock.close() # No-op if the with block already closed it
+
+
+def banner_from_response(data):
+    """First printable line of a service response."""
+    try:
+        banner = data.decode('utf-8', errors='ignore').strip().split('\n')[0]
+        banner = ''.join(c for c in banner if c.isprintable()) # Clean non-printable
+        return banner or "(binary data)"
+    except Exception:
+        return "(binary data)"
+
+
+def get_service_banner(host, port, timeout=2, sock=None, probes=None):
+    """Tries to grab a service banner from an open TCP port, sending the probe the
+    fingerprint database picks for that port (or nothing, without a database)."""
+    payload = probes.probe_for_port(port).payload if probes else b""
+    data, error = grab_service_response(host, port, timeout, sock, payload)
+    return error or banner_from_response(data)
+
+
+def detect_service(host, port, timeout=2, sock=None, probes=None, enricher=None):
+    """Banner grab plus fingerprint match. Returns {"banner", "service", "version"};
+    service and version are empty if the database has no match. With a ServiceEnricher,
+    TLS and HTTP services also get "tls" and "http" details."""
+    probe = probes.probe_for_port(port) if probes else None
+    if enricher and enricher.replaces(probe):
+        if sock is not None:
+            sock.close()
+        detection = {"banner": "(no TLS or HTTP response)", "service": "", "version": ""}
+        return enricher.enrich(host, port, detection, b"", timeout) # Tried like a silent service: TLS first
+    data, error = grab_service_response(host, port, timeout, sock, probe.payload if probe else b"")
+    detection = {"banner": error or banner_from_response(data), "service": "", "version": ""}
+    match = probes.match(probe, data) if probes and data else None
+    if match:
+        detection["service"] = match["service"]
+        detection["version"] = format_version(match)
+        detection["fingerprint"] = {key: match[key] for key in ("product", "version", "info") if match[key]}
+    if enricher:
+        enricher.enrich(host, port, detection, data, timeout)
+    return detection
+
+
+class ServiceDetectionStage:
+    """Banner grabbing (-sV) as its own pipeline stage: open-port events are queued to a
+    dedicated worker pool, so the result loop keeps consuming scan results meanwhile.
+    Connections handed over by the connect scan via adopt() are reused as-is."""
+
+    def __init__(self, threads, timeout_for, probes=None, limiter=None, enricher=None):
+        self.timeout_for = timeout_for # host -> banner timeout
+        self.probes = probes
+        self.enricher = enricher
+        self.limiter = limiter
+        self._executor = worker_pool(threads, "banner")
+        self._results = queue.Queue()
+        self._adopted = set()
+        self._lock = threading.Lock()
+        self.outstanding = 0
+
+    def _start(self, host, port, sock=None):
+        with self._lock:
+            self.outstanding += 1
+        future = self._executor.submit(self._detect, host, port, sock)
+        future.add_done_callback(lambda f: self._results.put((host, port, f.result())))
+
+    def _detect(self, host, port, sock=None):
+        """Never raises: every submitted grab must come back through the results queue, or
+        outstanding never drains and wait() blocks forever."""
+        try:
+            if sock is None and self.limiter is not None:
+                self.limiter.acquire() # A fresh connection is another probe; adopted ones cost nothing
+            return detect_service(host, port, self.timeout_for(host), sock, self.probes, self.enricher)
+        except Exception as e:
+            if sock is not None:
+                sock.close()
+            return {"banner": "(banner grab error)", "service": "", "version": "", "error": f"{type(e).__name__}: {e}"}
+
+    def adopt(self, host, port, sock):
+        """Handoff target for the connect scan: grab the banner over the scan's own connection."""
+        with self._lock:
+            self._adopted.add((host, port))
+        self._start(host, port, sock)
+
+    def submit(self, host, port):
+        """Queues banner grabbing for an open port, unless its connection was already adopted."""
+        with self._lock:
+            if (host, port) in self._adopted:
+                self._adopted.discard((host, port))
+                return
+        self._start(host, port)
+
+    def _collect(self, item):
+        with self._lock:
+            self.outstanding -= 1
+        return item
+
+    def completed(self):
+        """Yields (host, port, detection) for grabs that have finished, without blocking."""
+        while True:
+            try:
+                yield self._collect(self._results.get_nowait())
+            except queue.Empty:
+                return
+
+    def wait(self):
+        """Blocks until the next grab finishes and returns its (host, port, detection)."""
+        return self._collect(self._results.get())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# --- Service Fingerprints ---
+
+SERVICE_PROBES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "netscan_probes.json")
+
+class ServiceProbe:
+    """One probe from the fingerprint database: what to send, which ports it suits, and
+    its matchers pre-sorted into per-first-byte buckets."""
+
+    def __init__(self, name, payload, ports):
+        self.name = name
+        self.payload = payload
+        self.ports = set(ports)
+        self.matchers = []
+        self._by_first_byte = None # byte value -> matchers that can match a response starting with it
+
+    def build_index(self):
+        anchored = {}
+        unanchored = []
+        for matcher in self.matchers:
+            first = matcher["first_bytes"]
+            if first is None:
+                unanchored.append(matcher)
+            else:
+                for b in first:
+                    anchored.setdefault(b, []).append(matcher)
+        # Each bucket keeps database order, with unanchored matchers merged in where they belong
+        self._by_first_byte = [sorted(anchored.get(b, []) + unanchored, key=lambda m: m["order"]) for b in range(256)]
+
+    def candidates(self, data):
+        return self._by_first_byte[data[0]]
+
+
+def _unescape_probe_string(text):
+    """Probe payloads are stored with C-style escapes (\\r, \\x16 ...) to keep the JSON readable."""
+    return text.encode("latin-1").decode("unicode_escape").encode("latin-1")
+
+
+def _has_top_level_alternation(pattern):
+    """Whether `pattern` has a "|" outside any group or character class."""
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]" or pattern[i - 1] == "["
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def _regex_first_bytes(pattern, ignore_case=False):
+    """Set of byte values a response must start with for `pattern` to match, or None if
+    that can't be told from a simple '^literal' prefix (alternations included)."""
+    if not pattern.startswith("^") or len(pattern) < 2:
+        return None
+    rest = pattern[1:]
+    if _has_top_level_alternation(pattern):
+        return None # "^a|^b" can start with either
+    if rest[0] == "\\":
+        if rest[1:2] == "x" and len(rest) >= 4:
+            try:
+                first, used = int(rest[2:4], 16), 4
+            except ValueError:
+                return None
+        elif rest[1:2] and not rest[1].isalnum(): # Escaped punctuation, e.g. \\+ or \\*
+            first, used = ord(rest[1]), 2
+        else:
+            return None # Class escape like \\d or \\w
+    elif rest[0] in ".[(|?*+{^$)":
+        return None
+    else:
+        first, used = ord(rest[0]), 1
+    if rest[used:used + 1] in ("?", "*", "{"): # The literal is optional
+        return None
+    if first > 255:
+        return None
+    first_bytes = {first}
+    if ignore_case and chr(first).isalpha():
+        first_bytes |= {ord(chr(first).lower()), ord(chr(first).upper())}
+    return first_bytes
+
+
+def _expand_template(template, match):
+    """Fills $1..$9 in a product/version/info template from regex groups."""
+    if not template or "$" not in template:
+        return template or ""
+    def group(m):
+        value = match.group(int(m.group(1))) if int(m.group(1)) <= match.re.groups else None
+        return value.decode("latin-1", errors="replace") if value else ""
+    return re.sub(r"\$(\d)", group, template).strip(" ;")
+
+
+def format_version(match):
+    """'product version (info)' from a fingerprint match, skipping empty parts."""
+    text = " ".join(part for part in (match.get("product"), match.get("version")) if part)
+    if match.get("info"):
+        text = f"{text} ({match['info']})" if text else match["info"]
+    return text
+
+
+class ServiceFingerprintDB:
+    """Data-driven service detection loaded once from netscan_probes.json. Regexes are
+    compiled at load time and bucketed by probe and by the first byte they can match,
+    so a response only runs through the handful of matchers that could apply to it."""
+
+    def __init__(self, probes):
+        self.probes = probes
+        self.null_probe = next((p for p in probes if not p.payload), None)
+        self._probe_by_name = {p.name: p for p in probes}
+        self._probe_by_port = {}
+        for probe in probes:
+            for port in probe.ports:
+                self._probe_by_port.setdefault(port, probe) # First probe listed wins
+        for probe in probes:
+            probe.build_index()
+
+    @classmethod
+    def load(cls, path=SERVICE_PROBES_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        probes = []
+        order = 0
+        for entry in data.get("probes", []):
+            probe = ServiceProbe(entry["name"], _unescape_probe_string(entry.get("send", "")), entry.get("ports", []))
+            for m in entry.get("matches", []):
+                ignore_case = "i" in m.get("flags", "")
+                flags = re.S | (re.I if ignore_case else 0)
+                probe.matchers.append({
+                    "order": order,
+                    "regex": re.compile(m["pattern"].encode("latin-1"), flags),
+                    "first_bytes": _regex_first_bytes(m["pattern"], ignore_case),
+                    "service": m["service"],
+                    "product": m.get("product", ""),
+                    "version": m.get("version", ""),
+                    "info": m.get("info", ""),
+                })
+                order += 1
+            probes.append(probe)
+        return cls(probes)
+
+    def matcher_count(self):
+        return sum(len(p.matchers) for p in self.probes)
+
+    def probe_named(self, name):
+        return self._probe_by_name.get(name)
+
+    def probe_for_port(self, port):
+        """Probe to send to `port`: one that lists the port, else the NULL (listen-only) probe."""
+        return self._probe_by_port.get(port, self.null_probe)
+
+    def match(self, probe, data):
+        """Matches a response to `probe` (None = NULL probe). Falls back to the NULL probe's
+        matchers, since some services greet before reading what we sent."""
+        if not data:
+            return None
+        probe = probe or self.null_probe
+        for candidate_probe in (probe, self.null_probe) if probe is not self.null_probe else (probe,):
+            if candidate_probe is None:
+                continue
+            for matcher in candidate_probe.candidates(data):
+                found = matcher["regex"].match(data)
+                if found:
+                    return {
+                        "service": matcher["service"],
+                        "product": _expand_template(matcher["product"], found),
+                        "version": _expand_template(matcher["version"], found),
+                        "info": _expand_template(matcher["info"], found),
+                    }
+        return None
+
+
+def load_probe_db(path=SERVICE_PROBES_FILE):
+    """Loads the fingerprint database, or returns None (plain banner grabbing) if it can't."""
+    try:
+        db = ServiceFingerprintDB.load(path)
+    except (OSError, ValueError, KeyError, re.error) as e:
+        print(f"[!] Could not load service fingerprint database {path}: {e}. Falling back to plain banner grabbing.")
+        return None
+    return db
+
+
+# --- Service Enrichment ---
+# After -sV's probe, services that speak TLS or HTTP get a closer look: a real handshake
+# for the certificate, and an HTTP request for status, server and page title. Silent
+# services (nothing to the probe) are tried both ways, which finds HTTP on odd ports.
+
+ENRICHMENT_KEYS = ("fingerprint", "tls", "http") # What -sV adds to an open port's service_info beyond the banner
+
+_X509_NAMES = {b"\x55\x04\x03": "CN", b"\x55\x04\x0a": "O", b"\x55\x04\x0b": "OU", b"\x55\x04\x06": "C"}
+_X509_SAN = b"\x55\x1d\x11"
+
+def _der_items(data, pos=0, end=None):
+    """Yields (tag, start, end) for each DER element in data[pos:end]."""
+    end = len(data) if end is None else end
+    while pos < end:
+        tag, length = data[pos], data[pos + 1]
+        pos += 2
+        if length & 0x80: # Long form: the low bits say how many length bytes follow
+            count = length & 0x7f
+            length = int.from_bytes(data[pos:pos + count], "big")
+            pos += count
+        yield tag, pos, pos + length
+        pos += length
+
+
+def _der_string(data, tag, start, end):
+    return data[start:end].decode("utf-16-be" if tag == 0x1e else "utf-8", errors="replace") # 0x1e: BMPString
+
+
+def _der_time(data, tag, start, end):
+    text = data[start:end].decode("ascii").rstrip("Z")
+    if tag == 0x17: # UTCTime has a two-digit year
+        text = ("19" if int(text[:2]) >= 50 else "20") + text
+    return datetime.strptime(text[:14], "%Y%m%d%H%M%S").isoformat() + "Z"
+
+
+def _x509_name(data, start, end):
+    parts = []
+    for _, set_start, set_end in _der_items(data, start, end): # RDN sets
+        for _, seq_start, seq_end in _der_items(data, set_start, set_end):
+            (_, oid_start, oid_end), value = list(_der_items(data, seq_start, seq_end))[:2]
+            key = _X509_NAMES.get(data[oid_start:oid_end])
+            if key:
+                parts.append(f"{key}={_der_string(data, *value)}")
+    return ", ".join(parts)
+
+
+def parse_certificate(der):
+    """Subject, issuer, validity and subjectAltNames of a DER certificate, without
+    verifying it: enough for an inventory, and needs no third-party ASN.1 library."""
+    _, cert_start, cert_end = next(_der_items(der))
+    _, tbs_start, tbs_end = next(_der_items(der, cert_start, cert_end))
+    fields = list(_der_items(der, tbs_start, tbs_end))
+    if fields[0][0] == 0xa0: # Explicit version tag, absent in v1 certificates
+        fields = fields[1:]
+    validity = list(_der_items(der, fields[3][1], fields[3][2]))
+    info = {"subject": _x509_name(der, fields[4][1], fields[4][2]), "issuer": _x509_name(der, fields[2][1], fields[2][2]),
+            "not_before": _der_time(der, *validity[0]), "not_after": _der_time(der, *validity[1]), "san": []}
+    for tag, start, end in fields[6:]:
+        if tag != 0xa3: # [3] extensions
+            continue
+        for _, ext_start, ext_end in _der_items(der, *next(_der_items(der, start, end))[1:]):
+            ext = list(_der_items(der, ext_start, ext_end))
+            if der[ext[0][1]:ext[0][2]] != _X509_SAN:
+                continue
+            _, names_start, names_end = next(_der_items(der, ext[-1][1], ext[-1][2])) # OCTET STRING wrapping GeneralNames
+            for name_tag, name_start, name_end in _der_items(der, names_start, names_end):
+                if name_tag == 0x82: # dNSName
+                    info["san"].append(der[name_start:name_end].decode("ascii", errors="replace"))
+                elif name_tag == 0x87: # iPAddress
+                    info["san"].append(str(ip_address(der[name_start:name_end])))
+    return info
+
+
+def parse_http_response(data):
+    """Status, Server header and page title of a raw HTTP response, or None if it isn't one."""
+    if not data.startswith(b"HTTP/"):
+        return None
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = lines[0].split(" ", 2)
+    info = {"status": int(status[1]) if len(status) > 1 and status[1].isdigit() else 0}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() in ("server", "location"):
+            info[name.strip().lower()] = value.strip()
+    title = re.search(rb"<title[^>]*>(.*?)</title", body, re.I | re.S)
+    if title:
+        import html
+        info["title"] = " ".join(html.unescape(title.group(1).decode("utf-8", errors="replace")).split())[:200]
+    return info
+
+
+def describe_tls(tls):
+    """One-line summary of ServiceEnricher's "tls" details."""
+    parts = [tls["version"]]
+    if tls.get("subject"):
+        parts.append(f"subject {tls['subject']}")
+    if tls.get("san"):
+        parts.append(f"SAN {' '.join(tls['san'][:5])}{' ...' if len(tls['san']) > 5 else ''}")
+    if tls.get("not_after"):
+        parts.append(f"expires {tls['not_after'][:10]}{' (self-signed)' if tls['issuer'] == tls['subject'] else ''}")
+    return "; ".join(parts + ([tls["error"]] if "error" in tls else []))
+
+
+def describe_http(http):
+    """One-line summary of ServiceEnricher's "http" details."""
+    text = str(http["status"])
+    if http.get("title"):
+        text += f' "{http["title"][:60]}"'
+    if http.get("location"):
+        text += f" -> {http['location']}"
+    if http.get("server"):
+        text += f" ({http['server']})"
+    return text
+
+
+class ServiceEnricher:
+    """TLS and HTTP follow-up for -sV, run on the detection stage's threads. One SSL context
+    is shared by every handshake, and each host has a pool of `per_host` connection slots
+    so a host with hundreds of open ports isn't hit with hundreds of handshakes at once.
+    SNI uses the name the target was given by, if it was given by name."""
+
+    HTTP_READ_LIMIT = 16384 # Bytes read looking for the page title
+    HTTP_PROBE = "GetRequest" # Fingerprints that HTTP and TLS-wrapped responses are matched against
+    TLS_PROBE = "TLSSessionReq" # Ports this probe is for go straight to a real handshake
+
+    def __init__(self, probes=None, per_host=4, names=None, limiter=None):
+        import ssl
+        self.probes = probes
+        self.per_host = per_host
+        self.names = names or {} # address -> hostname it was resolved from, for SNI and Host:
+        self.limiter = limiter
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self._context.check_hostname = False
+        self._context.verify_mode = ssl.CERT_NONE # We want to see whatever certificate is there
+        try:
+            self._context.minimum_version = ssl.TLSVersion.MINIMUM_SUPPORTED
+            self._context.set_ciphers("ALL:@SECLEVEL=0") # Old appliances are exactly what an inventory needs to find
+        except (ssl.SSLError, ValueError):
+            pass
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def replaces(self, probe):
+        """Whether detect_service should skip `probe` and leave the port to enrich()."""
+        return probe is not None and probe.name == self.TLS_PROBE
+
+    def _slot(self, host):
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _connect(self, host, port, timeout):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        return socket.create_connection((host, port), timeout)
+
+    def _http_exchange(self, sock, host, port):
+        """Sends GET / and reads until the title, the read limit or the end of the response."""
+        name = self.names.get(host, f"[{host}]" if ":" in host else host)
+        sock.sendall(f"GET / HTTP/1.1\r\nHost: {name}\r\nUser-Agent: NetScan Pro\r\nAccept: */*\r\nConnection: close\r\n\r\n".encode())
+        data = b""
+        try:
+            while len(data) < self.HTTP_READ_LIMIT and b"</title" not in data.lower():
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        except OSError: # Timeout or reset: keep what arrived
+            pass
+        return data
+
+    def _tls(self, host, port, timeout):
+        """Handshake, certificate, then one request over the session. Returns (tls, data,
+        answered); tls is None if the handshake failed, and answered False if it failed
+        because the service never replied."""
+        sock = None
+        try:
+            sock = self._connect(host, port, timeout)
+            sock = self._context.wrap_socket(sock, server_hostname=self.names.get(host))
+            der = sock.getpeercert(binary_form=True)
+            tls = {"version": sock.version(), "cipher": sock.cipher()[0]}
+            if der:
+                try:
+                    tls.update(parse_certificate(der))
+                except (StopIteration, IndexError, ValueError):
+                    tls["error"] = "unparsable certificate"
+            return tls, self._http_exchange(sock, host, port), True
+        except socket.timeout:
+            return None, b"", False
+        except OSError:
+            return None, b"", True
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def _http(self, host, port, timeout):
+        try:
+            with self._connect(host, port, timeout) as sock:
+                return self._http_exchange(sock, host, port)
+        except OSError:
+            return b""
+
+    def enrich(self, host, port, detection, response, timeout):
+        """Adds "tls" and/or "http" to a detection from detect_service(), given the raw
+        `response` to its probe, and refines service, version and banner from what they
+        turn up. Only services that matched as ssl or http, or sent nothing, are contacted."""
+        service = detection["service"]
+        if response and service not in ("ssl", "http"):
+            return detection
+        tls, data, answered = None, b"", False
+        with self._slot(host):
+            if service == "ssl" or not response:
+                tls, data, answered = self._tls(host, port, timeout)
+            if service == "http" and response.startswith(b"HTTP/") and host not in self.names:
+                data = response # Short of a virtual host to ask for, a second GET would tell us nothing new
+            elif service == "http" or not response and not tls and answered:
+                data = self._http(host, port, timeout) # Turned the handshake down without a timeout: maybe plain HTTP
+        if tls:
+            detection["tls"] = tls
+        http = parse_http_response(data)
+        if http:
+            detection["http"] = http
+        match = self.probes.match(self.probes.probe_named(self.HTTP_PROBE), data) if self.probes and data else None
+        inner = match["service"] if match else "http" if http else ""
+        if tls:
+            detection["service"] = {"": "ssl", "http": "https"}.get(inner, f"ssl/{inner}")
+        elif inner:
+            detection["service"] = inner
+        if match and format_version(match):
+            detection["version"] = format_version(match)
+            detection["fingerprint"] = {key: match[key] for key in ("product", "version", "info") if match[key]}
+        if data and data is not response:
+            detection["banner"] = banner_from_response(data)
+        elif tls:
+            detection["banner"] = f"{tls['version']} {tls.get('subject', '')}".strip()
+        return detection
+
+
+# --- Scan Engines ---
+# Each engine takes an iterable of (host, port) pairs and yields (host, port, state)
+# tuples as probes complete, so main() can consume any of them with the same loop.
+
+def bounded_as_completed(executor, fn, items, limit, *args):
+    """Submits fn(item, *args) for each item, keeping at most `limit` futures pending, and
+    yields (item, future) as they finish. Lets `items` be an arbitrarily long stream."""
+    pending = {}
+    items = iter(items)
+    while True:
+        for item in items:
+            pending[executor.submit(fn, item, *args)] = item
+            if len(pending) >= limit:
+                break
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+
+def interleave_pairs(hosts, ports):
+    """Yields (host, port) pairs port-major, so consecutive probes hit different hosts."""
+    for port in ports:
+        for host in hosts:
+            yield host, port
+
+
+class PairScheduler:
+    """Hands out (host, port) pairs from one shared stream while keeping at most
+    `max_per_host` probes in flight against any host. Pairs for a busy host are
+    parked until one of its probes finishes. Not thread-safe: drive it from one thread."""
+
+    MAX_DEFERRED = 10000 # Stop reading ahead once this many pairs are parked
+
+    def __init__(self, pairs, max_per_host=None):
+        self._pairs = iter(pairs)
+        self.max_per_host = max_per_host if max_per_host and max_per_host > 0 else None
+        self.in_flight = {}
+        self._deferred = {}
+        self._deferred_count = 0
+        self._ready = deque() # Hosts with parked pairs that just got a free slot
+        self.exhausted = False
+
+    def _dispatch(self, host, port):
+        self.in_flight[host] = self.in_flight.get(host, 0) + 1
+        return host, port
+
+    def next_pair(self):
+        """Returns the next dispatchable pair, or None if nothing can be sent right now."""
+        while self._ready:
+            host = self._ready.popleft()
+            parked = self._deferred.get(host)
+            if parked and self.in_flight.get(host, 0) < self.max_per_host:
+                self._deferred_count -= 1
+                port = parked.popleft()
+                if not parked:
+                    del self._deferred[host]
+                return self._dispatch(host, port)
+        while not self.exhausted and self._deferred_count < self.MAX_DEFERRED:
+            try:
+                host, port = next(self._pairs)
+            except StopIteration:
+                self.exhausted = True
+                break
+            if self.max_per_host and self.in_flight.get(host, 0) >= self.max_per_host:
+                self._deferred.setdefault(host, deque()).append(port)
+                self._deferred_count += 1
+                continue
+            return self._dispatch(host, port)
+        return None
+
+    def done(self, host):
+        """Marks one probe against `host` as finished, freeing its slot."""
+        remaining = self.in_flight[host] - 1
+        if remaining:
+            self.in_flight[host] = remaining
+        else:
+            del self.in_flight[host]
+        if host in self._deferred:
+            self._ready.append(host)
+
+    def finished(self):
+        """True once every pair has been handed out (probes may still be in flight)."""
+        return self.exhausted and not self._deferred_count
+
+
+def thread_pool_scan(scan_function, pairs, timeout, threads, max_per_host=None, rtt=None, limiter=None):
+    """Runs a blocking per-port scan function on one long-lived thread pool shared by all hosts."""
+    scheduler = PairScheduler(pairs, max_per_host)
+    in_flight = {}
+    with worker_pool(threads, "scan") as executor:
+        while True:
+            while len(in_flight) < threads:
+                pair = scheduler.next_pair()
+                if pair is None:
+                    break
+                in_flight[executor.submit(probe_with_retry, scan_function, pair[0], pair[1], timeout, rtt, limiter)] = pair
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                host, port = in_flight.pop(future)
+                scheduler.done(host)
+                try:
+                    yield host, port, future.result()
+                except Exception as e:
+                    yield host, port, f"error ({e})"
+
+
+async def _async_connect_probe(loop, host, port, timeout, handoff=None):
+    """Non-blocking TCP connect on the event loop. Mirrors scan_tcp_connect's states."""
+    sock = socket.socket(address_family(host), socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout)
+        # Abortive close (RST) so thousands of probes don't pile up in TIME_WAIT
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00")
+        if handoff is not None:
+            handoff(host, port, sock.dup())
+        return "open"
+    except asyncio.TimeoutError: # Must come before OSError, TimeoutError is a subclass of it
+        return "filtered (timeout)"
+    except OSError:
+        return "closed" # Connection refused, host unreachable etc.
+    finally:
+        sock.close()
+
+
+async def _async_paced_probe(loop, host, port, timeout, handoff=None, limiter=None, pace=None):
+    """_async_connect_probe() behind the rate limiter. `pace` serialises waiting for tokens
+    so a rate cut applies to the next probe, not after a queue of pre-booked ones."""
+    if limiter is None:
+        return await _async_connect_probe(loop, host, port, timeout, handoff)
+    async with pace:
+        delay = limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    state = await _async_connect_probe(loop, host, port, timeout, handoff)
+    limiter.observe(state)
+    return state
+
+
+async def _async_probe_with_retry(loop, host, port, timeout, rtt=None, handoff=None, limiter=None, pace=None):
+    """Async counterpart of probe_with_retry()."""
+    if rtt is None:
+        return await _async_paced_probe(loop, host, port, timeout, handoff, limiter, pace)
+    start = time.monotonic()
+    state = await _async_paced_probe(loop, host, port, rtt.timeout(host), handoff, limiter, pace)
+    if state in RTT_SAMPLE_STATES:
+        rtt.observe(host, time.monotonic() - start)
+    elif state in TIMEOUT_STATES:
+        start = time.monotonic()
+        state = await _async_paced_probe(loop, host, port, rtt.retry_timeout(host), handoff, limiter, pace)
+        if state in RTT_SAMPLE_STATES:
+            rtt.observe(host, time.monotonic() - start)
+    return state
+
+
+async def _async_connect_worker(loop, scheduler, wakeup, timeout, results, rtt=None, handoff=None, limiter=None, pace=None):
+    """Pulls pairs off the shared scheduler until all work has been handed out."""
+    while True: # Sharing the scheduler is safe: all workers run on the same loop thread
+        pair = scheduler.next_pair()
+        if pair is None:
+            if scheduler.finished():
+                async with wakeup: # Release workers still parked below so they can exit too
+                    wakeup.notify_all()
+                return
+            async with wakeup: # Every remaining pair belongs to a busy host
+                await wakeup.wait()
+            continue
+        host, port = pair
+        state = await _async_probe_with_retry(loop, host, port, timeout, rtt, handoff, limiter, pace)
+        scheduler.done(host)
+        results.put((host, port, state))
+        async with wakeup:
+            wakeup.notify()
+
+
+async def _async_connect_run(pairs, timeout, concurrency, results, max_per_host=None, rtt=None, handoff=None, limiter=None):
+    loop = asyncio.get_running_loop()
+    scheduler = PairScheduler(pairs, max_per_host)
+    wakeup = asyncio.Condition()
+    pace = asyncio.Lock()
+    workers = [asyncio.create_task(_async_connect_worker(loop, scheduler, wakeup, timeout, results, rtt, handoff, limiter, pace))
+               for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+def _raise_fd_limit(wanted):
+    """Raises the soft open-file limit towards `wanted`. Returns the usable number of descriptors."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return wanted
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+            soft = new_soft
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+def async_connect_scan(pairs, timeout, concurrency=DEFAULT_CONCURRENCY, max_per_host=None, rtt=None, handoff=None, limiter=None):
+    """TCP Connect scan on an asyncio event loop with up to `concurrency` connects in flight."""
+    fd_limit = _raise_fd_limit(concurrency + 64)
+    concurrency = max(1, min(concurrency, fd_limit - 64)) # Leave room for stdout, output files etc.
+    return _drive_event_loop(lambda results: _async_connect_run(pairs, timeout, concurrency, results, max_per_host, rtt, handoff, limiter),
+                             "async-connect-engine")
+
+
+def _drive_event_loop(make_main, name):
+    """Runs make_main(results) on a fresh event loop in a background thread and yields
+    whatever it puts on the `results` queue, until it returns."""
+    results = queue.Queue()
+    done = object()
+    loop = asyncio.new_event_loop()
+    main_task = loop.create_task(make_main(results))
+
+    def run():
+        try:
+            loop.run_until_complete(main_task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            results.put(e)
+        finally:
+            results.put(done)
+
+    runner = threading.Thread(target=run, name=name, daemon=True)
+    runner.start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consumer stopped early (Ctrl-C, error): cancel whatever is still in flight
+        if runner.is_alive():
+            loop.call_soon_threadsafe(main_task.cancel)
+        runner.join()
+        loop.close()
+
+
+def open_engine(config, pairs, rtt=None, limiter=None, handoff=None):
+    """Starts the engine described by `config` (built in main(): engine, scan, timeout,
+    threads, concurrency, max_per_host) on `pairs` and returns its result stream."""
+    if config["engine"] == "syn-raw":
+        return syn_scan(pairs, config["timeout"], limiter, rtt)
+    if config["engine"] == "udp":
+        return udp_scan(pairs, config["timeout"], limiter, rtt)
+    if config["engine"] == "async":
+        return async_connect_scan(pairs, config["timeout"], config["concurrency"], config["max_per_host"], rtt, handoff, limiter)
+    scan_function = scan_tcp_syn if config["scan"] == "syn" else scan_tcp_connect
+    if handoff and scan_function is scan_tcp_connect:
+        scan_function = partial(scan_tcp_connect, handoff=handoff)
+    return thread_pool_scan(scan_function, pairs, config["timeout"], config["threads"], config["max_per_host"], rtt, limiter)
+
+
+# --- Multi-process Sharding ---
+
+SHARD_BATCH = 256 # Results per message from a worker process
+SHARD_FLUSH_INTERVAL = 0.05 # Seconds a worker holds a partial batch before sending it anyway
+
+def shard_pairs(hosts, ports, shard, shards, seed=None):
+    """(host, port) pairs for one shard out of `shards`. Ports are dealt round-robin between
+    shards (hosts, if there are fewer ports than shards), so every shard still spreads its
+    probes over all hosts. A seed randomizes the port order, identically in every shard."""
+    if seed is not None:
+        port_order = (ports[i] for i in permuted_indices(len(ports), seed))
+    else:
+        port_order = iter(ports)
+    if len(ports) >= shards:
+        return interleave_pairs(hosts, islice(port_order, shard, None, shards))
+    return interleave_pairs(hosts[shard::shards], port_order)
+
+
+def batched_results(results, size=SHARD_BATCH, interval=SHARD_FLUSH_INTERVAL):
+    """Groups a result stream into lists of up to `size`, cutting a batch short once it
+    has been open for `interval` seconds so slow streams still arrive promptly."""
+    batch = []
+    flushed = time.monotonic()
+    for result in results:
+        batch.append(result)
+        now = time.monotonic()
+        if len(batch) >= size or now - flushed >= interval:
+            yield batch
+            batch = []
+            flushed = now
+    if batch:
+        yield batch
+
+
+def _split_limit(value, parts):
+    """Share of a total limit for one of `parts` workers (0/None = unlimited stays that way)."""
+    return -(-value // parts) if value and value > 0 else value
+
+
+def _shard_worker(shard, shards, hosts, ports, seed, config, rtt, rate, done_ports, out):
+    """Body of one --workers process: runs its own engine over its shard and ships results
+    to the parent in batches. The last message is always None."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is the parent's job; it terminates us
+    try:
+        limiter = RateLimiter(*rate) if rate else None
+        pairs = shard_pairs(hosts, ports, shard, shards, seed)
+        if done_ports:
+            pairs = ((host, port) for host, port in pairs if port not in done_ports.get(host, ()))
+        for batch in batched_results(open_engine(config, pairs, rtt, limiter)):
+            out.put(batch)
+    except Exception as e:
+        out.put(f"worker {shard}: {e}")
+    finally:
+        out.put(None)
 
-# --- Helper Functions ---
 
-def resolve_target(target_str):
-    """Resolves a hostname to an IP address."""
+def multiprocess_scan(hosts, ports, workers, config, rtt=None, rate=None, done_ports=None, randomize=False):
+    """Shards the host x port space across `workers` processes, each running its own engine,
+    and yields their merged (host, port, state) stream. Threads, concurrency, the per-host
+    cap and the (max, min) rate are totals and get split between the workers."""
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn") # Forking with writer/banner threads running isn't safe
+    out = ctx.Queue(maxsize=1024) # Bounded: a busy parent slows the workers down instead of buffering
+    seed = random.randrange(2 ** 32) if randomize else None
+    shard_config = dict(config, threads=_split_limit(config["threads"], workers),
+                        concurrency=_split_limit(config["concurrency"], workers),
+                        max_per_host=_split_limit(config["max_per_host"], workers))
+    shard_rate = (rate[0] / workers, rate[1] / workers if rate[1] else None) if rate else None
+    processes = [ctx.Process(target=_shard_worker, name=f"netscan-worker-{i}", daemon=True,
+                             args=(i, workers, hosts, ports, seed, shard_config, rtt, shard_rate, done_ports, out))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    running = workers
     try:
-        return socket.gethostbyname(target_str)
-    except socket.gaierror:
-        print(f"[!] Could not resolve hostname: {target_str}")
+        while running:
+            try:
+                item = out.get(timeout=0.5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes):
+                    break # Killed without getting to say goodbye
+                continue
+            if item is None:
+                running -= 1
+            elif isinstance(item, str):
+                print(f"\n[!] Scan {item}. Its share of the results is missing.")
+            else:
+                yield from item
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+# --- Distributed Scanning ---
+# Coordinator <-> worker protocol: one JSON object per line over TCP.
+#   worker: {"type": "hello"}             coordinator: {"type": "config", ...}
+#   worker: {"type": "next"}              coordinator: {"type": "lease", "id", "hosts", "ports"} | {"type": "wait"} | {"type": "bye"}
+#   worker: {"type": "results", "lease", "results": [[host, port, state], ...]}
+#   worker: {"type": "done", "lease"}
+# There is no authentication: run coordinators on a network you trust.
+
+DEFAULT_COORDINATOR_PORT = 7878
+DEFAULT_LEASE_SIZE = 4096 # Host-port pairs per lease
+DEFAULT_LEASE_TIMEOUT = 60 # Seconds without progress before a lease is handed to another worker
+
+def parse_address(text, default_host="127.0.0.1"):
+    """'host:port', ':port' or 'port' -> (host, port)."""
+    host, _, port = text.rpartition(":")
+    return host or default_host, int(port) if port else DEFAULT_COORDINATOR_PORT
+
+
+def _send_message(wfile, message):
+    wfile.write(json.dumps(message).encode() + b"\n")
+    wfile.flush()
+
+
+def _read_message(rfile):
+    """Next message from the other end, or None if it hung up (EOF, or a line cut short)."""
+    line = rfile.readline()
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
         return None
 
-def expand_targets(targets_str):
-    """Expands target strings (single IP, CIDR, hostname) into a list of IP strings."""
-    expanded = set()
-    for t_str in targets_str.split(','):
-        t_str = t_str.strip()
-        if '/' in t_str: # CIDR
-            try:
-                network = ip_network(t_str, strict=False)
-                for ip in network.hosts():
-                    expanded.add(str(ip))
-            except ValueError:
-                print(f"[!] Invalid CIDR notation: {t_str}")
-        else: # Single IP or hostname
-            try:
-                # Check if it's an IP address directly
-                ip_addr_obj = ip_address(t_str)
-                expanded.add(str(ip_addr_obj))
-            except ValueError:
-                # Not a direct IP, try to resolve as hostname
-                resolved_ip = resolve_target(t_str)
-                if resolved_ip:
-                    expanded.add(resolved_ip)
-    return list(expanded)
 
-def parse_ports(ports_str, top_n=None):
-    """Parses port strings (e.g., "22,80,443", "1-1024", "all")."""
-    if not ports_str and top_n:
-        return sorted(list(COMMON_TCP_PORTS.keys()))[:top_n]
-    if ports_str.lower() == "all":
-        return list(range(1, 65536))
+def make_leases(hosts, ports, lease_size=DEFAULT_LEASE_SIZE):
+    """Chunks hosts x ports into leases of about `lease_size` pairs: a block of hosts times
+    a run of ports, port chunks outermost so concurrent leases cover different hosts."""
+    hosts = list(hosts)
+    block = max(1, min(len(hosts), lease_size))
+    per_lease = max(1, lease_size // block)
+    lease_id = 0
+    port_iter = iter(ports)
+    while True:
+        chunk = IntRangeSet(islice(port_iter, per_lease))
+        if not chunk:
+            return
+        for i in range(0, len(hosts), block):
+            lease_hosts = hosts[i:i + block]
+            yield {"id": lease_id, "hosts": lease_hosts, "ports": [list(r) for r in chunk.ranges()],
+                   "size": len(lease_hosts) * len(chunk), "host_set": set(lease_hosts), "port_set": chunk,
+                   "reported": set(), "owner": None, "deadline": 0, "complete": False}
+            lease_id += 1
 
-    ports = set()
-    parts = ports_str.split(',')
-    for part in parts:
-        part = part.strip()
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            ports.update(range(start, end + 1))
-        else:
+
+class ScanCoordinator:
+    """Hands out the port scan in leases to --worker processes, possibly on other machines,
+    and merges their streamed results into one (host, port, state) stream. A lease that
+    shows no progress for `lease_timeout` seconds, or whose worker disconnects, goes back
+    in the queue. Results are de-duplicated per pair, so re-issued work is reported once."""
+
+    def __init__(self, address, hosts, ports, config, lease_size=DEFAULT_LEASE_SIZE, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+        self.address = address
+        self.config = config
+        self.lease_timeout = lease_timeout
+        self._leases = make_leases(hosts, ports, lease_size)
+        self._exhausted = False
+        self._open = {} # lease id -> lease, for every handed-out lease not fully reported yet
+        self._requeued = deque()
+        self._connections = {}
+        self._lock = threading.Lock()
+        self.results = queue.Queue()
+        self.reissued = 0
+
+    def _next_lease(self, worker):
+        with self._lock:
+            lease = None
+            while self._requeued and lease is None:
+                candidate = self._requeued.popleft()
+                if not candidate["complete"]: # The old owner may have finished it after all
+                    lease = candidate
+            if lease is None and not self._exhausted:
+                lease = next(self._leases, None)
+                if lease is None:
+                    self._exhausted = True
+                else:
+                    self._open[lease["id"]] = lease
+            if lease is not None:
+                lease["owner"] = worker
+                lease["deadline"] = time.monotonic() + self.lease_timeout
+            return lease
+
+    def _finished(self):
+        with self._lock:
+            return self._exhausted and not self._open
+
+    def _record(self, lease_id, results):
+        with self._lock:
+            lease = self._open.get(lease_id)
+            if lease is None:
+                return # Already complete: everything here is a duplicate
+            lease["deadline"] = time.monotonic() + self.lease_timeout # Progress renews the lease
+            for host, port, state in results:
+                key = (host, port)
+                if key in lease["reported"] or host not in lease["host_set"] or port not in lease["port_set"]:
+                    continue
+                lease["reported"].add(key)
+                self.results.put((host, port, state))
+            if len(lease["reported"]) >= lease["size"]:
+                lease["complete"] = True
+                del self._open[lease_id]
+
+    def _release(self, worker, lease_id=None):
+        """Puts a worker's unfinished lease(s) back in the queue."""
+        with self._lock:
+            for lease in self._open.values():
+                if lease["owner"] is worker and (lease_id is None or lease["id"] == lease_id):
+                    lease["owner"] = None
+                    self._requeued.append(lease)
+                    self.reissued += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            for lease in self._open.values():
+                if lease["owner"] is not None and lease["deadline"] < now:
+                    lease["owner"] = None
+                    self._requeued.append(lease)
+                    self.reissued += 1
+
+    def _serve(self, conn, name):
+        worker = object() # Identity token for lease ownership
+        rfile, wfile = conn.makefile("rb"), conn.makefile("wb")
+        try:
+            for line in rfile:
+                message = json.loads(line)
+                kind = message.get("type")
+                if kind == "hello":
+                    print(f"\r[+] Worker connected: {name}")
+                    _send_message(wfile, {"type": "config", **self.config})
+                elif kind == "next":
+                    lease = self._next_lease(worker)
+                    if lease is not None:
+                        _send_message(wfile, {"type": "lease", "id": lease["id"], "hosts": lease["hosts"], "ports": lease["ports"]})
+                    elif self._finished():
+                        _send_message(wfile, {"type": "bye"})
+                        break
+                    else:
+                        _send_message(wfile, {"type": "wait"}) # Leases are out; one may still come back
+                elif kind == "results":
+                    self._record(message["lease"], message["results"])
+                elif kind == "done":
+                    self._release(worker, message["lease"]) # No-op unless pairs are missing
+        except (OSError, ValueError) as e:
+            print(f"\r[!] Worker {name} failed: {e}")
+        finally:
+            self._release(worker)
+            with self._lock:
+                self._connections.pop(conn, None)
+            conn.close()
+
+    def _accept(self, server):
+        while True:
             try:
-                ports.add(int(part))
-            except ValueError:
-                print(f"[!] Invalid port specified: {part}")
-    return sorted(list(ports))
+                conn, peer = server.accept()
+            except OSError:
+                return # Server socket closed: scan is over
+            with self._lock:
+                self._connections[conn] = peer
+            threading.Thread(target=self._serve, args=(conn, f"{peer[0]}:{peer[1]}"), name="coordinator-conn", daemon=True).start()
 
+    def scan(self):
+        """Yields merged (host, port, state) results until every lease is complete."""
+        server = socket.create_server(self.address)
+        self.address = server.getsockname()[:2] # The port actually bound, if 0 was asked for
+        print(f"[*] Coordinator listening on {self.address[0]}:{self.address[1]}. Start workers with --worker HOST:{self.address[1]}")
+        if not ip_address(server.getsockname()[0]).is_loopback:
+            print("[!] The coordinator has no authentication: anyone who can reach this address can read the targets and submit results.")
+        threading.Thread(target=self._accept, args=(server,), name="coordinator-accept", daemon=True).start()
+        try:
+            while True:
+                try:
+                    yield self.results.get(timeout=0.5)
+                    continue
+                except queue.Empty:
+                    pass
+                self._expire()
+                if self._finished() and self.results.empty():
+                    return
+        finally:
+            try:
+                server.shutdown(socket.SHUT_RDWR) # Wakes _accept: on Linux close() alone leaves it blocked in accept()
+            except OSError:
+                pass
+            server.close()
+            grace = time.monotonic() + 1.0 # Idle workers poll twice a second and get their "bye"
+            while self._connections and time.monotonic() < grace:
+                time.sleep(0.05)
+            with self._lock:
+                connections = list(self._connections)
+            for conn in connections:
+                conn.close()
 
-# --- Scanning Functions ---
 
-def icmp_ping(host, timeout):
-    """Sends an ICMP Echo Request to a host. Requires Scapy and often root."""
-    if not SCAPY_AVAILABLE:
-        print(f"[-] ICMP Ping skipped for {host} (Scapy unavailable or not root).")
-        return False # Cannot determine liveness without Scapy here
+def run_worker(address, connect_timeout=30):
+    """--worker mode: pulls leases from a coordinator, scans them with the engine it asks for,
+    and streams the results back until told there is no more work."""
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = socket.create_connection(address, timeout=10)
+            break
+        except OSError as e:
+            if time.monotonic() >= deadline:
+                print(f"[!] Could not reach coordinator {address[0]}:{address[1]}: {e}")
+                return 1
+            time.sleep(1)
+    conn.settimeout(None)
+    rfile, wfile = conn.makefile("rb"), conn.makefile("wb")
+    leases = probes = 0
     try:
-        # Using Scapy for ICMP ping
-        pkt = IP(dst=host)/ICMP()
-        resp = sr1(pkt, timeout=timeout, verbose=0)
-        return resp is not None and resp.haslayer(ICMP) and resp[ICMP].type == 0 # Echo Reply
-    except Exception as e:
-        # print(f"[!] Error ICMP pinging {host}: {e}") # Can be very verbose
-        return False
+        _send_message(wfile, {"type": "hello"})
+        config = _read_message(rfile)
+        if config is None:
+            print(f"[!] Coordinator {address[0]}:{address[1]} hung up before sending the scan configuration.")
+            return 1
+        engine_config = config["engine"]
+        if engine_config["engine"] == "syn-raw" and not raw_sockets_available():
+            print("[i] Coordinator asked for a raw SYN scan but this worker has no raw sockets. Using TCP Connect.")
+            engine_config = dict(engine_config, engine="thread", scan="connect")
+        rtt = RttTracker(engine_config["timeout"], config["min_rtt_timeout"], config["max_rtt_timeout"]) if config["adaptive"] else None
+        limiter = RateLimiter(config["max_rate"], config["min_rate"]) if config["max_rate"] else None
+        print(f"[*] Connected to coordinator {address[0]}:{address[1]} ({engine_config['engine']} engine).")
+        while True:
+            _send_message(wfile, {"type": "next"})
+            message = _read_message(rfile)
+            if message is None: # Whatever lease it would have sent goes to another worker
+                print(f"[!] Coordinator hung up after {leases} lease(s), {probes} probe(s).")
+                return 1
+            if message["type"] == "bye":
+                break
+            if message["type"] == "wait":
+                time.sleep(0.5)
+                continue
+            ports = IntRangeSet()
+            for start, end in message["ports"]:
+                ports.add(start, end)
+            pairs = interleave_pairs(message["hosts"], ports)
+            for batch in batched_results(open_engine(engine_config, pairs, rtt, limiter)):
+                _send_message(wfile, {"type": "results", "lease": message["id"], "results": batch})
+                probes += len(batch)
+            _send_message(wfile, {"type": "done", "lease": message["id"]})
+            leases += 1
+    except OSError as e:
+        print(f"[!] Lost connection to coordinator: {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"[*] Worker finished: {leases} lease(s), {probes} probe(s).")
+    return 0
 
-def arp_scan_local(network_cidr, timeout):
-    """Performs an ARP scan on the local network. Requires Scapy and root."""
-    if not SCAPY_AVAILABLE:
-        print("[-] ARP Scan skipped (Scapy unavailable or not root).")
-        return []
 
-    live_hosts = []
-    try:
-        print(f"[*] Performing ARP scan on {network_cidr}...")
-        ans, unans = srp(Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=network_cidr),
-                         timeout=timeout, verbose=0, iface_hint=network_cidr) # iface_hint helps scapy pick interface
-        for sent, received in ans:
-            live_hosts.append(received.psrc)
-            print(f"    [+] Host Found (ARP): {received.psrc} ({received.hwsrc})")
-    except Exception as e:
-        print(f"[!] Error during ARP scan: {e}")
-    return live_hosts
+# --- Result Store ---
 
+class ResultStore:
+    """Scan results in flat typed storage rather than nested dicts. Hosts are numbered in
+    the order they are first seen; a probed port's state is one byte in a hosts x ports
+    matrix (1 byte per pair, about 64MB for a /16 x 1,000 ports), holding a code into a
+    table of the distinct state strings seen ("closed", "filtered (timeout)", a few dozen
+    at most). A host's row is added when its first result arrives, and once the matrix
+    reaches `max_matrix` bytes later hosts keep only a count per state, so memory stays
+    bounded for a /16 x all ports. Only open ports keep a dict, for their service details.
+    JSON is built one host at a time as it is written."""
 
-def scan_tcp_connect(host, port, timeout):
-    """Attempts a TCP Connect scan on a single port."""
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(timeout)
-            result = sock.connect_ex((host, port))
-            if result == 0:
-                return "open"
-    except socket.timeout:
-        return "filtered (timeout)" # Or just closed, hard to distinguish simply
-    except socket.error:
-        return "closed" # Connection refused, host down etc.
-    return "closed"
+    COUNTED = -2 # _row value of a host past the matrix cap
 
-def scan_tcp_syn(host, port, timeout):
-    """Performs a TCP SYN scan on a single port. Requires Scapy and root."""
-    if not SCAPY_AVAILABLE:
-        # Fallback or error if scapy is not available/usable
-        # print(f"[-] SYN Scan for {host}:{port} skipped (Scapy unavailable or not root). Falling back to Connect Scan.")
-        # For this example, we'll just indicate it couldn't run.
-        # In a more robust tool, you might fall back to TCP Connect.
-        return "error (scapy unavailable)"
+    def __init__(self, ports=None, max_matrix=MAX_STATE_MATRIX):
+        self.ports = ports if ports is not None else IntRangeSet()
+        self.max_matrix = max_matrix
+        self._hosts = [] # Host index -> address
+        self._index = {} # Address -> host index
+        self._status = array("B") # Host index -> code of its discovery status
+        self._row = array("l") # Host index -> first byte of its port states in _matrix, -1 (none yet) or COUNTED
+        self._matrix = bytearray()
+        self._counts = {} # Host index -> {code: ports}, for COUNTED hosts
+        self._states = [None] # Code -> state string; code 0 is "not probed"
+        self._codes = {}
+        self._services = {} # Host index -> service_info of each open port
+        self._hostnames = {} # Host index -> name from reverse DNS
 
-    try:
-        src_port = socket.htons(1500 + port % 1000) # Some randomness, or use RandShort() from scapy
-        ip_layer = IP(dst=host)
-        tcp_layer = TCP(sport=src_port, dport=port, flags="S") # SYN flag
-        
-        response = sr1(ip_layer/tcp_layer, timeout=timeout, verbose=0)
+    def _code(self, state):
+        code = self._codes.get(state)
+        if code is None:
+            if len(self._states) > 255: # Out of codes: fall back to the bare state ("filtered")
+                return self._code(state.split(" ", 1)[0]) if " " in state else 0
+            code = self._codes[state] = len(self._states)
+            self._states.append(state)
+        return code
 
-        if response is None:
-            return "filtered" # No response
-        elif response.haslayer(TCP):
-            if response[TCP].flags == 0x12: # SYN-ACK
-                # Send RST to close the connection gracefully (optional, good practice)
-                # rst_pkt = IP(dst=host)/TCP(sport=src_port, dport=port, flags="R")
-                # send(rst_pkt, verbose=0)
-                return "open"
-            elif response[TCP].flags == 0x14 or response[TCP].flags == 0x04: # RST-ACK or RST
-                return "closed"
-            else: # Other flags
-                return f"filtered (flags: {response[TCP].flags:#04x})"
-        elif response.haslayer(ICMP):
-            # ICMP unreachable (type 3, code 1, 2, 3, 9, 10, or 13)
-            if int(response[ICMP].type) == 3 and int(response[ICMP].code) in [1, 2, 3, 9, 10, 13]:
-                return "filtered (ICMP)"
+    def _host(self, host):
+        i = self._index.get(host)
+        if i is None:
+            i = self._index[host] = len(self._hosts)
+            self._hosts.append(host)
+            self._status.append(0)
+            self._row.append(-1)
+        return i
+
+    def hosts(self):
+        return iter(self._hosts)
+
+    def __contains__(self, host):
+        return host in self._index
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def set_status(self, host, status):
+        self._status[self._host(host)] = self._code(status)
+
+    def status(self, host, default=None):
+        i = self._index.get(host)
+        if i is None or not self._status[i]:
+            return default
+        return self._states[self._status[i]]
+
+    def set_hostname(self, host, name):
+        self._hostnames[self._host(host)] = name
+
+    def _add_row(self, i):
+        width = len(self.ports)
+        if len(self._matrix) + width > self.max_matrix:
+            self._row[i] = self.COUNTED
+            self._counts[i] = {}
+        else:
+            self._row[i] = len(self._matrix)
+            self._matrix.extend(bytes(width))
+
+    def record(self, host, port, state, service_info=None):
+        i = self._host(host)
+        if state == "open":
+            self._services.setdefault(i, []).append(service_info or {"port": port, "status": state})
+        if port not in self.ports:
+            return
+        if self._row[i] == -1:
+            self._add_row(i)
+        if self._row[i] == self.COUNTED: # Can't tell a repeated port from a new one here; results arrive once per pair
+            counts = self._counts[i]
+            code = self._code(state)
+            counts[code] = counts.get(code, 0) + 1
+        else:
+            self._matrix[self._row[i] + self.ports.index(port)] = self._code(state)
+
+    def open_ports(self, host):
+        return sorted(self._services.get(self._index.get(host), ()), key=lambda info: info["port"])
+
+    def state_counts(self, host=None, brief=False):
+        """{state: ports} for one host, or every host. With `brief`, details are dropped
+        ("filtered (timeout)" counts as "filtered")."""
+        if host is None:
+            spans, counted = [(0, len(self._matrix))], self._counts.values()
+        else:
+            i = self._index.get(host)
+            if i is None or self._row[i] == -1:
+                return {}
+            if self._row[i] == self.COUNTED:
+                spans, counted = [], [self._counts[i]]
             else:
-                return "filtered (ICMP other)"
+                spans, counted = [(self._row[i], self._row[i] + len(self.ports))], []
+        by_code = {}
+        for start, end in spans:
+            for code in range(1, len(self._states)):
+                count = self._matrix.count(code.to_bytes(1, "big"), start, end)
+                if count:
+                    by_code[code] = count
+        for counts in counted:
+            for code, count in counts.items():
+                by_code[code] = by_code.get(code, 0) + count
+        result = {}
+        for code, count in by_code.items():
+            state = self._states[code]
+            key = state.split(" ", 1)[0] if brief else state
+            result[key] = result.get(key, 0) + count
+        return result
+
+    def host_record(self, host):
+        """The -oJ entry for `host`: status, open ports, and how many ports ended in each other state."""
+        record = {"status": self.status(host, "unknown"), "ports": self.open_ports(host)}
+        i = self._index[host]
+        if i in self._hostnames:
+            record["hostname"] = self._hostnames[i]
+        counts = {state: count for state, count in self.state_counts(host).items() if state != "open"}
+        if counts:
+            record["port_states"] = counts
+        return record
+
+    def write_json(self, path):
+        """Writes every host as one JSON object, host by host, instead of building it all in memory first."""
+        with open(path, "w") as f:
+            f.write("{")
+            for n, host in enumerate(self._hosts):
+                entry = json.dumps(self.host_record(host), indent=4).replace("\n", "\n    ")
+                f.write(f"{',' if n else ''}\n    {json.dumps(host)}: {entry}")
+            f.write("\n}\n" if self._hosts else "}\n")
+
+
+# --- Output ---
+# Streaming formats share the OutputSink interface: main() reports every probe result to
+# port() and every finished host to host(), so any number of formats are written in one
+# pass over the results, each by its own writer thread.
+
+class OutputSink:
+    """Base for streaming output files. Callers only enqueue; a writer thread formats and
+    drains whatever has queued up in one write() and flushes whenever it catches up, so
+    `tail -f` sees results within moments of them completing. Subclasses implement the
+    events they care about and _format()."""
+
+    BATCH = 4096
+    LABEL = "Output"
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._queue = queue.Queue(maxsize=100000) # Bounded: a slow disk applies back-pressure instead of eating memory
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"{type(self).__name__.lower()}-output", daemon=True)
+        self._thread.start()
+
+    def begin(self, run):
+        """Start of the run. `run` has args (the command line), start (datetime), scan
+        ("connect", "syn", "udp", or None for discovery only), proto, ports (IntRangeSet)
+        and verbose."""
+
+    def port(self, host, port, state, proto="tcp", info=None, previous=None):
+        """One probe result, as it completes. `info` is the service_info of an open port;
+        `previous` the state --diff-since compared against."""
+
+    def host(self, host, record):
+        """A finished host, as ResultStore.host_record() describes it."""
+
+    def finish(self, stats):
+        """End of a completed run. `stats` has hosts_up, hosts_total and elapsed (seconds)."""
+
+    def _write(self, item):
+        self._queue.put(item)
+
+    def _format(self, item):
+        return item
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None: # close() sentinel
+                batch.pop()
+                stop = True
+            if batch:
+                self._file.write("".join(self._format(item) for item in batch))
+            if stop or self._queue.empty():
+                self._file.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+class NdjsonWriter(OutputSink):
+    """Newline-delimited JSON (-oN): one object per probe result. Serialised on the writer
+    thread, so the scan loop only pays for building the dict."""
+
+    LABEL = "Per-port NDJSON results"
+
+    def port(self, host, port, state, proto="tcp", info=None, previous=None):
+        record = {"host": host, "port": port, "proto": proto, "state": state,
+                  "service": info["service"] if info else "", "banner": info["banner"] if info else ""}
+        if info and info.get("version"):
+            record["version"] = info["version"]
+        for key in ("tls", "http"):
+            if info and key in info:
+                record[key] = info[key]
+        if previous is not None: # --diff-since: the state this port had before
+            record["previous"] = previous
+        record["time"] = datetime.now().isoformat(timespec="milliseconds")
+        self._write(record)
+
+    def _format(self, record):
+        return json.dumps(record) + "\n"
+
+
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+def _xml_attr(value):
+    """A quoted XML attribute value. Banners can hold control characters XML 1.0 can't
+    carry at all; they are written as \\xNN like nmap does."""
+    value = _XML_INVALID.sub(lambda m: f"\\x{ord(m.group()):02x}", str(value))
+    return '"' + value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;") + '"'
+
+
+def _range_list(int_set):
+    return ",".join(f"{s}-{e}" if s != e else str(s) for s, e in int_set.ranges())
+
+
+class XmlWriter(OutputSink):
+    """nmap-compatible XML (-oX): an <nmaprun> document with one <host> element per host,
+    written as each host finishes. Ports in other states are summarised in <extraports>
+    like nmap does; banners go in a "banner" <script> element."""
+
+    LABEL = "XML output"
+
+    # Our state details -> nmap's reason attribute
+    PORT_REASONS = {"filtered (timeout)": "no-response", "filtered": "no-response", "open|filtered": "no-response",
+                    "filtered (ICMP)": "host-unreach", "filtered (ICMP other)": "net-unreach"}
+
+    def begin(self, run):
+        self._scan = run["scan"]
+        self._proto = run["proto"]
+        start = run["start"]
+        header = (f'<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE nmaprun>\n'
+                  f'<nmaprun scanner="netscan_pro" args={_xml_attr(run["args"])} start="{int(start.timestamp())}" '
+                  f'startstr={_xml_attr(start.ctime())} version="1.0" xmloutputversion="1.05">\n')
+        if run["scan"]:
+            header += (f'<scaninfo type="{run["scan"]}" protocol="{run["proto"]}" numservices="{len(run["ports"])}" '
+                       f'services="{_range_list(run["ports"])}"/>\n')
+        self._write(header + f'<verbose level="{run["verbose"]}"/>\n<debugging level="0"/>\n')
+
+    def port_reason(self, state):
+        if state == "open":
+            return "udp-response" if self._scan == "udp" else "syn-ack"
+        if state == "closed":
+            return {"udp": "port-unreach", "syn": "reset"}.get(self._scan, "conn-refused")
+        return self.PORT_REASONS.get(state, "unknown-response")
+
+    def host(self, host, record):
+        status = record["status"]
+        up = status.startswith("up")
+        reason = "no-response" if not up else "arp-response" if "ARP" in status else "echo-reply" if "ICMP" in status else "syn-ack" if "TCP" in status else "user-set"
+        now = int(time.time())
+        lines = [f'<host starttime="{now}" endtime="{now}"><status state="{"up" if up else "down"}" reason="{reason}" reason_ttl="0"/>',
+                 f'<address addr="{host}" addrtype="{"ipv6" if ":" in host else "ipv4"}"/>',
+                 f'<hostnames><hostname name={_xml_attr(record["hostname"])} type="PTR"/></hostnames>' if "hostname" in record else "<hostnames>\n</hostnames>"]
+        if record["ports"] or record.get("port_states"):
+            lines.append("<ports>")
+            extra = {} # Bare state -> {reason: count}
+            for state, count in record.get("port_states", {}).items():
+                reasons = extra.setdefault(state.split(" ", 1)[0], {})
+                reasons[self.port_reason(state)] = reasons.get(self.port_reason(state), 0) + count
+            for state, reasons in extra.items():
+                lines.append(f'<extraports state="{state}" count="{sum(reasons.values())}">')
+                lines += [f'<extrareasons reason="{reason}" count="{count}" proto="{self._proto}"/>' for reason, count in reasons.items()]
+                lines.append("</extraports>")
+            for info in record["ports"]:
+                if info.get("version"):
+                    # nmap keeps product, version and extra info apart; ports from older journals only have the joined string
+                    fingerprint = info.get("fingerprint") or {"product": info["version"]}
+                    details = "".join(f" {attr}={_xml_attr(fingerprint[key])}" for attr, key in
+                                      (("product", "product"), ("version", "version"), ("extrainfo", "info")) if fingerprint.get(key))
+                    service = f'<service name={_xml_attr(info["service"])}{details} method="probed" conf="10"/>'
+                else:
+                    service = f'<service name={_xml_attr(info.get("service", "unknown"))} method="table" conf="3"/>'
+                banner = f'<script id="banner" output={_xml_attr(info["banner"])}/>' if info.get("banner") else ""
+                if "tls" in info:
+                    banner += f'<script id="ssl-cert" output={_xml_attr(describe_tls(info["tls"]))}/>'
+                if "http" in info:
+                    banner += f'<script id="http-title" output={_xml_attr(describe_http(info["http"]))}/>'
+                lines.append(f'<port protocol="{info.get("proto", self._proto)}" portid="{info["port"]}"><state state="open" '
+                             f'reason="{self.port_reason("open")}" reason_ttl="0"/>{service}{banner}</port>')
+            lines.append("</ports>")
+        lines.append("</host>\n")
+        self._write("\n".join(lines))
+
+    def finish(self, stats):
+        now = datetime.now()
+        summary = (f"NetScan Pro done at {now.ctime()}; {stats['hosts_total']} IP address{'es' if stats['hosts_total'] != 1 else ''} "
+                   f"({stats['hosts_up']} host{'s' if stats['hosts_up'] != 1 else ''} up) scanned in {stats['elapsed']:.2f} seconds")
+        self._write(f'<runstats><finished time="{int(now.timestamp())}" timestr={_xml_attr(now.ctime())} summary={_xml_attr(summary)} '
+                    f'elapsed="{stats["elapsed"]:.2f}" exit="success"/><hosts up="{stats["hosts_up"]}" '
+                    f'down="{stats["hosts_total"] - stats["hosts_up"]}" total="{stats["hosts_total"]}"/>\n</runstats>\n</nmaprun>\n')
+
+
+class GrepableWriter(OutputSink):
+    """nmap grepable output (-oG): tab-separated "Host:" lines, one with the host's status
+    and one listing its open ports as port/state/protocol//service//version/, written as
+    each host finishes."""
+
+    LABEL = "Grepable output"
+
+    @staticmethod
+    def _field(value):
+        return re.sub(r"[\x00-\x1f]", " ", value).replace("/", "|").replace(",", " ") # The separators the format uses
+
+    def begin(self, run):
+        self._proto = run["proto"]
+        self._write(f"# NetScan Pro scan initiated {run['start'].ctime()} as: {run['args']}\n")
+
+    def host(self, host, record):
+        prefix = f"Host: {host} ({record.get('hostname', '')})"
+        up = record["status"].startswith("up")
+        text = f"{prefix}\tStatus: {'Up' if up else 'Down'}\n"
+        if record["ports"] or record.get("port_states"):
+            fields = []
+            if record["ports"]:
+                fields.append("Ports: " + ", ".join(
+                    f"{info['port']}/open/{info.get('proto', self._proto)}//{self._field(info.get('service', ''))}//{self._field(info.get('version', ''))}/"
+                    for info in record["ports"]))
+            ignored = {}
+            for state, count in record.get("port_states", {}).items():
+                ignored[state.split(" ", 1)[0]] = ignored.get(state.split(" ", 1)[0], 0) + count
+            if ignored: # The format has room for one: the most common
+                state, count = max(ignored.items(), key=lambda item: item[1])
+                fields.append(f"Ignored State: {state} ({count})")
+            text += f"{prefix}\t" + "\t".join(fields) + "\n"
+        self._write(text)
+
+    def finish(self, stats):
+        self._write(f"# NetScan Pro done at {datetime.now().ctime()} -- {stats['hosts_total']} IP address{'es' if stats['hosts_total'] != 1 else ''} "
+                    f"({stats['hosts_up']} host{'s' if stats['hosts_up'] != 1 else ''} up) scanned in {stats['elapsed']:.2f} seconds\n")
+
+
+# --- Checkpointing ---
+
+class ScanJournal:
+    """Append-only checkpoint file for --resume. One JSON array per line:
+    ["H", host, status] for discovery results and ["P", host, port, state, service, banner(, version(, details))]
+    for finished probes, where details holds an open port's fingerprint, tls and http entries. Records are buffered and written in batches so journaling keeps
+    up with high probe rates; a torn last line from a crash is ignored on load."""
+
+    FLUSH_RECORDS = 2000
+    FLUSH_INTERVAL = 2.0 # Seconds
+
+    def __init__(self, path):
+        self.path = path
+        self.host_status = {} # host -> discovery status from a previous run
+        self.done_ports = {} # host -> IntRangeSet of ports already probed
+        self.open_ports = {} # host -> [service_info, ...] recorded as open
+        self.port_states = {} # host -> {state: IntRangeSet of ports} for the other finished probes
+        self._load()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # Torn write from an interrupted run
+                    if record[0] == "H":
+                        self.host_status[record[1]] = record[2]
+                    elif record[0] == "P":
+                        _, host, port, state, service, banner, *extra = record
+                        self.done_ports.setdefault(host, IntRangeSet()).add(port)
+                        if state == "open":
+                            info = {"port": port, "status": state, "service": service, "banner": banner}
+                            if extra and extra[0]:
+                                info["version"] = extra[0]
+                            if len(extra) > 1:
+                                info.update(extra[1])
+                            self.open_ports.setdefault(host, []).append(info)
+                        else:
+                            self.port_states.setdefault(host, {}).setdefault(state, IntRangeSet()).add(port)
+        except FileNotFoundError:
+            pass
+
+    def probes_done(self):
+        return sum(len(ports) for ports in self.done_ports.values())
+
+    def is_done(self, host, port):
+        ports = self.done_ports.get(host)
+        return ports is not None and port in ports
+
+    def record_host(self, host, status):
+        self._append(["H", host, status])
+
+    def record_port(self, host, port, state, service="", banner="", version="", details=None):
+        if details:
+            self._append(["P", host, port, state, service, banner, version, details])
+        elif version:
+            self._append(["P", host, port, state, service, banner, version])
         else:
-            return "filtered (unknown response)"
-            
-    except PermissionError:
-        # This will likely be caught earlier by SCAPY_AVAILABLE check if run as non-root
-        print(f"[!] Permission denied for SYN scan on {host}:{port}. Try running as root/administrator.")
-        return "error (permission)"
-    except Exception as e:
-        # print(f"[!] Error SYN scanning {host}:{port}: {e}") # Can be verbose
-        return "error"
+            self._append(["P", host, port, state, service, banner])
 
+    def _append(self, record):
+        self._buffer.append(json.dumps(record) + "\n")
+        if len(self._buffer) >= self.FLUSH_RECORDS or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
 
-def get_service_banner(host, port, timeout=2):
-    """Tries to grab a service banner from an open TCP port."""
-    banner = "unknown"
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(timeout)
-            s.connect((host, port))
-            # For HTTP, send a basic request. For others, just try to receive.
-            if port == 80 or port == 8080:
-                s.sendall(b"HEAD / HTTP/1.0\r\n\r\n")
-            elif port == 443: # Basic SSL/TLS handshake often reveals server type
-                 s.sendall(b"\x16\x03\x01\x00\x88\x01\x00\x00\x84\x03\x03") # ClientHello start
-            
-            # Try to receive a small amount of data
-            # Be careful with large banners or services that wait for client input
-            banner_data = s.recv(1024)
-            try:
-                banner = banner_data.decode('utf-8', errors='ignore').strip().split('\n')[0]
-                banner = ''.join(c for c in banner if c.isprintable()) # Clean non-printable
-                if not banner: banner = "(empty response)"
-            except:
-                banner = "(binary data)"
+    def flush(self):
+        if self._buffer and not self._file.closed:
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+# --- Scan History ---
+
+class ScanHistory:
+    """SQLite store of results across runs (--history), keyed by (host, port, proto) with
+    first-seen, last-seen and last-changed times. Only ports that have been open at some
+    point get a row; after that every state seen for them is tracked, so a database for
+    nightly /16 sweeps stays the size of what was ever exposed. Writes are batched into
+    transactions like the journal's, and only touched from the main thread."""
+
+    FLUSH_RECORDS = 2000
+    FLUSH_INTERVAL = 2.0 # Seconds
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started TEXT NOT NULL, finished TEXT);
+        CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, status TEXT NOT NULL, first_seen TEXT NOT NULL,
+                                          last_seen TEXT NOT NULL, changed TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS ports (host TEXT NOT NULL, port INTEGER NOT NULL, proto TEXT NOT NULL,
+                                          state TEXT NOT NULL, service TEXT, banner TEXT, version TEXT,
+                                          first_seen TEXT NOT NULL, last_seen TEXT NOT NULL, changed TEXT NOT NULL,
+                                          PRIMARY KEY (host, port, proto));
+        CREATE INDEX IF NOT EXISTS ports_open ON ports (state, last_seen);
+    """
+
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(self.SCHEMA)
+        row = self._db.execute("SELECT MAX(started) FROM runs").fetchone()
+        self.last_run = row[0] # Start of the previous run, for --diff-since last
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._run_id = self._db.execute("INSERT INTO runs (started) VALUES (?)", (self.started,)).lastrowid
+        self._db.commit()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def open_ports_since(self, since, proto="tcp"):
+        """host -> IntRangeSet of `proto` ports seen open at or after `since` (ISO timestamp)."""
+        result = {}
+        for host, port in self._db.execute("SELECT host, port FROM ports WHERE proto = ? AND state = 'open' AND last_seen >= ? "
+                                           "UNION SELECT host, port FROM ports WHERE proto = ? AND changed >= ? AND state != 'open'",
+                                           (proto, since, proto, since)):
+            result.setdefault(host, IntRangeSet()).add(port)
+        return result
+
+    def record_host(self, host, status):
+        """Stores a discovery result. Returns the previous status, or None for a host never seen up."""
+        now = datetime.now().isoformat(timespec="seconds")
+        row = self._db.execute("SELECT status FROM hosts WHERE host = ?", (host,)).fetchone()
+        previous = row[0] if row else None
+        if row:
+            self._db.execute("UPDATE hosts SET status = ?, last_seen = ?, changed = CASE WHEN status != ? THEN ? ELSE changed END "
+                             "WHERE host = ?", (status, now, status, now, host))
+        elif status.startswith("up"):
+            self._db.execute("INSERT INTO hosts VALUES (?, ?, ?, ?, ?)", (host, status, now, now, now))
+        self._written()
+        return previous
+
+    def record_port(self, host, port, state, service="", banner="", version="", proto="tcp"):
+        """Stores a probe result. Returns the previous (state, service, version), or None if
+        the port has never been seen open."""
+        now = datetime.now().isoformat(timespec="seconds")
+        row = self._db.execute("SELECT state, service, version FROM ports WHERE host = ? AND port = ? AND proto = ?",
+                               (host, port, proto)).fetchone()
+        if row:
+            self._db.execute("UPDATE ports SET state = ?, service = ?, banner = ?, version = ?, last_seen = ?, "
+                             "changed = CASE WHEN state != ? THEN ? ELSE changed END WHERE host = ? AND port = ? AND proto = ?",
+                             (state, service or row[1], banner, version or row[2], now, state, now, host, port, proto))
+        elif state == "open":
+            self._db.execute("INSERT INTO ports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (host, port, proto, state, service, banner, version, now, now, now))
+        else:
+            return None # Never open: nothing worth remembering
+        self._written()
+        return row
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.FLUSH_RECORDS or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._db.commit()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._db is None:
+            return
+        self._db.execute("UPDATE runs SET finished = ? WHERE id = ?", (datetime.now().isoformat(timespec="seconds"), self._run_id))
+        self._db.commit()
+        self._db.close()
+        self._db = None
+
+
+def parse_since(text, history):
+    """--diff-since value -> ISO timestamp. Accepts 'last' (start of the previous run),
+    a relative age like 36h or 7d, or an ISO date/time."""
+    if text == "last":
+        return history.last_run or datetime.min.isoformat()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text)
+    if match:
+        unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+        return (datetime.now() - timedelta(**{unit: float(match.group(1))})).isoformat(timespec="seconds")
+    return datetime.fromisoformat(text).isoformat(timespec="seconds")
+
+
+def port_state_changed(previous, state, service="", version=""):
+    """Whether a result is worth reporting against the port's history row (see ScanHistory):
+    open <-> not open, or a different service or version on a port that stayed open."""
+    was_open = previous is not None and previous[0] == "open"
+    if was_open != (state == "open"):
+        return True
+    if state != "open":
+        return False
+    def differs(new, old): # Only compare what both runs actually identified
+        return bool(new) and bool(old) and new != old and "unknown" not in (new, old)
+    return differs(service, previous[1]) or differs(version, previous[2])
+
+
+def sample_int_set(int_set, fraction):
+    """Random subset holding about `fraction` of an IntRangeSet's values (at least one)."""
+    if fraction >= 1 or not int_set:
+        return int_set
+    count = max(1, round(len(int_set) * fraction))
+    return IntRangeSet(int_set[i] for i in random.sample(range(len(int_set)), count))
 
-    except socket.timeout:
-        banner = "(banner grab timeout)"
-    except ConnectionRefusedError:
-        banner = "(connection refused for banner)" # Should not happen if port reported open
-    except Exception:
-        banner = "(banner grab error)"
-    return banner
 
 # --- Main Logic ---
 
@@ -222,6 +3715,7 @@ def main():
   python netscan_pro.py -t 192.168.1.1-192.168.1.10 --top-ports 10 -sS (SYN Scan, requires root)
   python netscan_pro.py --arp-scan 192.168.1.0/24 (ARP Scan for local net, requires root)
   python netscan_pro.py -t scanme.nmap.org -p 1-100 -sT -oJ results.json
+  python netscan_pro.py -6 -t scanme.nmap.org,2001:db8::/64 -p 22,80 -sT (IPv6)
 
 Disclaimer:
   This tool is for educational purposes and authorized scanning only.
@@ -231,91 +3725,300 @@ Disclaimer:
     # Target Specification
     parser.add_argument("-t", "--targets", required=False, help="Target IP, hostname, CIDR, or comma-separated list (e.g., 192.168.1.1,192.168.1.0/24,example.com)")
     parser.add_argument("--target-file", help="File containing a list of targets, one per line.")
+    parser.add_argument("-6", "--ipv6", action="store_true", help="Resolve hostnames to IPv6 addresses instead of IPv4. IPv6 literals and prefixes are accepted either way.")
+    parser.add_argument("-R", "--reverse-dns", action="store_true", help="Look up the DNS name of every live host, while the port scan runs.")
+    parser.add_argument("--dns-cache", metavar="FILE", help="Keep hostname lookups in FILE between runs (JSON; entries expire after --dns-ttl).")
+    parser.add_argument("--dns-ttl", type=float, default=DEFAULT_DNS_TTL, metavar="SECONDS", help=f"How long a cached lookup stays valid (default: {DEFAULT_DNS_TTL})")
+    parser.add_argument("--ipv6-sample", type=int, default=DEFAULT_IPV6_SAMPLE, metavar="N", help=f"Addresses probed in each IPv6 prefix or range larger than {MAX_IPV6_EXPANSION} addresses,\nbesides its lowest 256 (default: {DEFAULT_IPV6_SAMPLE}). Use --target-file for hit-lists.")
 
     # Scan Type
     scan_type_group = parser.add_argument_group('Scan Types')
-    scan_type_group.add_argument("-sn", "--ping-scan", action="store_true", help="Host discovery only (ICMP Ping). No port scan.")
+    scan_type_group.add_argument("-sn", "--ping-scan", action="store_true", help="Host discovery only (ICMP Ping, or TCP with -PS). No port scan.")
+    scan_type_group.add_argument("-PS", "--tcp-ping", metavar="PORTS", nargs="?", const=DEFAULT_DISCOVERY_PORTS, help=f"Discover hosts with TCP connects to PORTS instead of ICMP (default: {DEFAULT_DISCOVERY_PORTS}). Needs no privileges;\nused automatically when raw ICMP sockets are unavailable and Scapy cannot ping without them.")
     scan_type_group.add_argument("--arp-scan", metavar="NETWORK_CIDR", help="ARP scan for live hosts on the local network (e.g., 192.168.1.0/24). Requires root. Overrides -t for host discovery if local.")
     scan_type_group.add_argument("-sT", "--tcp-connect-scan", action="store_true", help="TCP Connect Scan (default if no scan type specified and not -sn)")
     scan_type_group.add_argument("-sS", "--tcp-syn-scan", action="store_true", help="TCP SYN (Stealth) Scan (requires root/admin & Scapy)")
-    # parser.add_argument("-sU", "--udp-scan", action="store_true", help="UDP Scan (can be slow and less reliable)") # Not implemented yet
+    scan_type_group.add_argument("-sU", "--udp-scan", action="store_true", help="UDP Scan: protocol payloads for common services, ICMP port unreachable means closed,\nsilence is open|filtered. Needs no privileges; telling closed ports apart needs Linux.")
 
     # Port Specification
     port_group = parser.add_argument_group('Port Specification')
     port_group.add_argument("-p", "--ports", default="1-1024", help="Ports to scan (e.g., 22,80,443 or 1-1024 or 'all'). Default: 1-1024.")
-    port_group.add_argument("--top-ports", type=int, metavar="N", help="Scan the top N most common TCP ports.")
+    port_group.add_argument("--top-ports", type=int, metavar="N", help="Scan the top N most common TCP ports (UDP ports with -sU).")
+    port_group.add_argument("--randomize", action="store_true", help="Probe targets and ports in a pseudo-random order instead of ascending.")
 
 
     # Service and Version
     parser.add_argument("-sV", "--service-version", action="store_true", help="Attempt service and version detection (basic banner grabbing).")
+    parser.add_argument("--probe-db", metavar="FILE", default=SERVICE_PROBES_FILE, help="Service fingerprint database used by -sV (default: netscan_probes.json next to this script)")
+    parser.add_argument("--banner-threads", type=int, default=DEFAULT_BANNER_THREADS, help=f"Worker threads for the -sV banner grabbing stage (default: {DEFAULT_BANNER_THREADS})")
+    parser.add_argument("--no-enrich", dest="enrich", action="store_false", help="With -sV, don't follow up on TLS, HTTP and silent services with a TLS handshake (certificate\nsubject, SANs, expiry) and an HTTP request (status, server, title).")
+    parser.add_argument("--enrich-per-host", type=int, default=DEFAULT_ENRICH_PER_HOST, metavar="N", help=f"TLS/HTTP enrichment connections open at once against any one host (default: {DEFAULT_ENRICH_PER_HOST})")
+    parser.add_argument("--reuse-connection", action="store_true", help="With -sV and a TCP Connect scan, grab banners over the scan's own connection\ninstead of connecting a second time.")
 
     # Performance
     performance_group = parser.add_argument_group('Performance')
-    performance_group.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"Timeout for probes in seconds (default: {DEFAULT_TIMEOUT})")
+    performance_group.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"Timeout for probes in seconds; with adaptive timeouts, the starting value per host (default: {DEFAULT_TIMEOUT})")
     performance_group.add_argument("--threads", type=int, default=DEFAULT_THREADS, help=f"Number of concurrent threads (default: {DEFAULT_THREADS})")
+    performance_group.add_argument("--dns-threads", type=int, default=DEFAULT_DNS_THREADS, help=f"Concurrent hostname lookups for targets and -R (default: {DEFAULT_DNS_THREADS})")
+    performance_group.add_argument("--engine", choices=["thread", "async"], default="thread", help="Port scan engine for TCP Connect scans: 'thread' (blocking sockets on a thread pool)\nor 'async' (non-blocking sockets on an asyncio event loop). Default: thread.")
+    performance_group.add_argument("--no-adaptive-timeout", dest="adaptive_timeout", action="store_false", help="Use the fixed --timeout for every probe instead of per-host timeouts derived from measured RTTs,\nand don't retry probes that timed out.")
+    performance_group.add_argument("--min-rtt-timeout", type=float, default=DEFAULT_MIN_RTT_TIMEOUT, metavar="SECONDS", help=f"Floor for adaptive per-host timeouts (default: {DEFAULT_MIN_RTT_TIMEOUT})")
+    performance_group.add_argument("--max-rtt-timeout", type=float, default=DEFAULT_MAX_RTT_TIMEOUT, metavar="SECONDS", help=f"Ceiling for adaptive per-host timeouts (default: {DEFAULT_MAX_RTT_TIMEOUT})")
+    performance_group.add_argument("--max-rate", "--rate", dest="max_rate", type=float, metavar="PPS", help=f"Global cap on probes per second, shared by ping, port scan and -sV connections. 0 for no limit\n(default: {DEFAULT_RATE} for -sS, no limit otherwise). Congestion control backs off below it on loss.")
+    performance_group.add_argument("--min-rate", type=float, metavar="PPS", help="Floor congestion control never backs off below (default: a tenth of --max-rate).\nSet it equal to --max-rate for a fixed rate.")
+    performance_group.add_argument("--max-per-host", type=int, default=DEFAULT_MAX_PER_HOST, help=f"Max probes in flight against any one host, 0 for no limit (default: {DEFAULT_MAX_PER_HOST})")
+    performance_group.add_argument("--workers", type=int, default=DEFAULT_WORKERS, metavar="N", help=f"Shard the port scan across N processes, each with its own engine. --threads, --concurrency,\n--max-per-host and --max-rate remain totals split between them (default: {DEFAULT_WORKERS})")
+    performance_group.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help=f"Max in-flight connects for --engine async (default: {DEFAULT_CONCURRENCY})")
+    performance_group.add_argument("--profile", action="store_true", help="Print wall and CPU time per stage, how long the result loop waited on the engine, and\nqueue wait and utilisation of the worker pools at the end of the run.")
+    performance_group.add_argument("--profile-output", metavar="FILE", help="Implies --profile. Also write cProfile statistics of the main thread if FILE ends in .prof\nor .pstats, or else stack samples of all threads in folded format (flamegraph.pl, speedscope).")
+
+    # Distributed
+    distributed_group = parser.add_argument_group('Distributed Scanning')
+    distributed_group.add_argument("--coordinator", metavar="[HOST:]PORT", help="Run discovery here, then hand the port scan out in leases to --worker nodes connecting\nto this address, and merge their results. HOST defaults to 127.0.0.1; give one (e.g. 0.0.0.0:PORT)\nto accept remote workers. No authentication: use on trusted networks.")
+    distributed_group.add_argument("--worker", metavar="HOST:PORT", help="Act as a scanner node for the coordinator at HOST:PORT. Targets and scan settings come from\nthe coordinator, whose --max-rate applies to each worker separately.")
+    distributed_group.add_argument("--lease-size", type=int, default=DEFAULT_LEASE_SIZE, metavar="PAIRS", help=f"Host-port pairs per lease (default: {DEFAULT_LEASE_SIZE})")
+    distributed_group.add_argument("--lease-timeout", type=float, default=DEFAULT_LEASE_TIMEOUT, metavar="SECONDS", help=f"Re-issue a lease after this long without results from its worker (default: {DEFAULT_LEASE_TIMEOUT})")
 
     # Output
     output_group = parser.add_argument_group('Output')
-    output_group.add_argument("-oJ", "--output-json", metavar="FILENAME", help="Output results in JSON format to a file.")
-    # output_group.add_argument("-oN", "--output-normal", metavar="FILENAME", help="Output results in Normal format to a file.") # For text file
-    # output_group.add_argument("-oX", "--output-xml", metavar="FILENAME", help="Output results in XML format to a file.") # More complex
+    output_group.add_argument("-oJ", "--output-json", metavar="FILENAME", help="Output results in JSON format to a file (written once, at the end).")
+    output_group.add_argument("-oN", "--output-ndjson", metavar="FILENAME", help="Stream results to a file as newline-delimited JSON, one line per host-port result\nas it completes (can be followed live with tail -f).")
+    output_group.add_argument("--resume", metavar="FILE", help="Checkpoint finished hosts and probes to FILE (append-only journal). If FILE already\nexists, skip the work it records and continue from there.")
+    output_group.add_argument("--history", metavar="FILE", help="Record results in a SQLite scan history (first/last seen and last change per host, port\nand protocol), kept across runs.")
+    output_group.add_argument("--diff-since", metavar="WHEN", help="Differential rescan against --history: probe ports open since WHEN first, then only a\nsample of the rest, and report only changes. WHEN is 'last' (previous run), an age like\n24h or 7d, or an ISO date.")
+    output_group.add_argument("--diff-sample", type=float, default=DEFAULT_DIFF_SAMPLE, metavar="FRACTION", help=f"Share of the remaining port range probed by --diff-since (default: {DEFAULT_DIFF_SAMPLE})")
+    output_group.add_argument("--metrics", metavar="[HOST:]PORT", help="Serve live scan metrics over HTTP: Prometheus text on /metrics, JSON on /metrics.json\n(probes/sec, in flight, per-state counts, RTT histogram, ETA). HOST defaults to 127.0.0.1.")
+    output_group.add_argument("-oX", "--output-xml", metavar="FILENAME", help="Write nmap-compatible XML to a file, each host as soon as it finishes.")
+    output_group.add_argument("-oG", "--output-grepable", metavar="FILENAME", help="Write nmap-style grepable output to a file, each host as soon as it finishes.")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output (show closed/filtered ports).")
 
     args = parser.parse_args()
 
+    if args.worker: # Worker nodes take everything, targets included, from the coordinator
+        sys.exit(run_worker(parse_address(args.worker, "127.0.0.1")))
+
     # --- Argument Validation and Processing ---
     if not args.targets and not args.target_file and not args.arp_scan:
         parser.error("No targets specified. Use -t, --target-file, or --arp-scan.")
 
     # Default to TCP Connect scan if no scan type is given and not a ping scan
-    if not args.ping_scan and not args.tcp_connect_scan and not args.tcp_syn_scan and not args.arp_scan:
+    if not args.ping_scan and not args.tcp_connect_scan and not args.tcp_syn_scan and not args.udp_scan and not args.arp_scan:
         args.tcp_connect_scan = True # Make TCP Connect the default port scan
+    if args.udp_scan and (args.tcp_connect_scan or args.tcp_syn_scan):
+        parser.error("-sU can't be combined with -sT/-sS in one run; scan TCP and UDP separately.")
 
-    if args.tcp_syn_scan and not SCAPY_AVAILABLE:
-        print("[!] TCP SYN Scan (-sS) requires Scapy. Please install it or choose another scan type.")
+    if args.tcp_syn_scan and not raw_sockets_available() and not load_scapy():
+        print("[!] TCP SYN Scan (-sS) requires raw sockets (Linux, root) or Scapy. Please run as root, install Scapy or choose another scan type.")
         sys.exit(1)
-    if args.ping_scan and not SCAPY_AVAILABLE and not args.arp_scan: # ARP scan can discover without ICMP
-        print("[!] ICMP Ping Scan (-sn) requires Scapy for best results. Please install it.")
-        # Could allow it to proceed with a warning if we had a TCP-ping alternative for -sn
-        # sys.exit(1)
 
-    all_targets = []
+    if args.diff_since and not args.history:
+        parser.error("--diff-since needs --history FILE to compare against.")
+    if args.diff_since and (args.workers > 1 or args.coordinator):
+        parser.error("--diff-since runs in a single process; it can't be combined with --workers or --coordinator.")
+    if not 0 < args.diff_sample <= 1:
+        parser.error("--diff-sample must be a fraction between 0 and 1.")
+    if args.ipv6_sample < 0:
+        parser.error("--ipv6-sample can't be negative.")
+    if args.dns_threads < 1:
+        parser.error("--dns-threads must be at least 1.")
+    if args.enrich_per_host < 1:
+        parser.error("--enrich-per-host must be at least 1.")
+    if args.arp_scan:
+        try:
+            ip_network(args.arp_scan, strict=False)
+        except ValueError:
+            parser.error(f"Invalid --arp-scan network: {args.arp_scan}")
+
+    if args.max_rate is None:
+        args.max_rate = DEFAULT_RATE if args.tcp_syn_scan or args.udp_scan else 0 # Fire-and-forget probes need a cap by default
+    if args.min_rate is not None and args.max_rate > 0 and args.min_rate > args.max_rate:
+        parser.error("--min-rate cannot be higher than --max-rate.")
+    if args.min_rate is not None and args.max_rate <= 0:
+        print("[i] --min-rate only applies together with --max-rate. Ignoring it.")
+
+    global _profile
+    if args.profile or args.profile_output:
+        _profile = ScanProfile(args.profile_output)
+        atexit.register(_profile.finish)
+    stage = _profile.enter if _profile else lambda name: None
+    stage("targets")
+
+    # Targets are kept as merged integer ranges (duplicates collapse on insert) and turned
+    # into address strings lazily, so memory doesn't grow with the size of the target space.
+    all_targets = IntRangeSet()
+    family = socket.AF_INET6 if args.ipv6 else socket.AF_INET
+    # Hostnames are resolved concurrently while the rest of the input is parsed
+    resolver = Resolver(args.dns_threads, args.dns_ttl, args.dns_cache)
+    target_names = {}
+    atexit.register(resolver.close)
     if args.targets:
-        all_targets.extend(expand_targets(args.targets))
+        expand_targets(args.targets, all_targets, family, args.ipv6_sample, resolver)
     if args.target_file:
         try:
             with open(args.target_file, 'r') as f:
-                file_targets = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-                all_targets.extend(expand_targets(",".join(file_targets))) # Process through expand_targets for consistency
+                for line in f: # Streamed line by line, through expand_targets for consistency
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        expand_targets(line, all_targets, family, args.ipv6_sample, resolver)
         except FileNotFoundError:
             print(f"[!] Target file not found: {args.target_file}")
             sys.exit(1)
-    
-    # Remove duplicates
-    all_targets = sorted(list(set(all_targets)))
+    if resolver.pending():
+        lookup_start = time.monotonic()
+        print(f"[*] Resolving {resolver.pending()} hostname(s) with {args.dns_threads} concurrent lookups...")
+        for name, address in resolver.completed():
+            if address:
+                all_targets.add(ip_to_int(address))
+                target_names[address] = name # For TLS SNI and the HTTP Host header
+            else:
+                print(f"[!] Could not resolve hostname: {name}")
+        print(f"[*] Name resolution done in {time.monotonic() - lookup_start:.1f}s ({resolver.cached} from cache).")
 
 
     if not all_targets and not args.arp_scan:
         print("[!] No valid targets to scan after processing inputs.")
         sys.exit(0)
 
-    ports_to_scan = []
+    ports_to_scan = IntRangeSet()
     if not args.ping_scan and not args.arp_scan: # Only parse ports if we're doing a port scan
-         ports_to_scan = parse_ports(args.ports if args.ports else "", args.top_ports)
+         ports_to_scan = parse_ports(args.ports if args.ports else "", args.top_ports, COMMON_UDP_PORTS if args.udp_scan else COMMON_TCP_PORTS)
          if not ports_to_scan:
              print("[!] No ports specified or parsed correctly for scanning.")
              sys.exit(1)
 
-    scan_results = {} # Store results: { "host": { "status": "up/down", "ports": [ {port, state, service} ] } }
+    store = ResultStore(ports_to_scan) # Host statuses, every probe's state and open ports' service details
+    # Per-host RTT estimates: seeded by discovery, refined by every completed probe.
+    # --timeout becomes the starting value for hosts we have no samples for yet.
+    rtt = RttTracker(args.timeout, args.min_rtt_timeout, args.max_rtt_timeout) if args.adaptive_timeout else None
+    # One token bucket paces every stage that puts packets on the wire
+    limiter = RateLimiter(args.max_rate, args.min_rate) if args.max_rate > 0 else None
     start_time = datetime.now()
     print(f"[*] NetScan Pro starting at {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    if limiter:
+        print(f"[*] Rate limit: up to {limiter.max_rate:g} probes/s, backing off to no less than {limiter.min_rate:g} on loss.")
+    metrics = ScanMetrics(limiter=limiter)
+    if rtt:
+        rtt.listener = metrics.observe_rtt
+    if args.metrics:
+        try:
+            metrics_server = MetricsServer(parse_address(args.metrics, "127.0.0.1"), metrics)
+        except (OSError, ValueError) as e:
+            parser.error(f"Can't serve metrics on {args.metrics}: {e}")
+        atexit.register(metrics_server.close)
+        print(f"[*] Serving metrics on http://{metrics_server.address[0]}:{metrics_server.address[1]}/metrics")
+
+    # Every requested format is fed from the same events, in the same pass
+    sinks = []
+    for path, sink_class in ((args.output_ndjson, NdjsonWriter), (args.output_xml, XmlWriter), (args.output_grepable, GrepableWriter)):
+        if path:
+            try:
+                sink = sink_class(path)
+            except OSError as e:
+                parser.error(f"Can't write {path}: {e}")
+            atexit.register(sink.close) # Flush what's queued even if the scan is interrupted
+            sink.begin({"args": " ".join(sys.argv), "start": start_time, "proto": "udp" if args.udp_scan else "tcp", "ports": ports_to_scan,
+                        "scan": None if args.ping_scan or args.arp_scan else "udp" if args.udp_scan else "syn" if args.tcp_syn_scan else "connect",
+                        "verbose": int(args.verbose)})
+            sinks.append(sink)
+    reverse_lookups = {} # -R: host -> pending PTR lookup, filled in once discovery is done
+
+    def emit_host(host):
+        if not sinks:
+            return
+        lookup = reverse_lookups.get(host)
+        if lookup is not None and lookup.result():
+            store.set_hostname(host, lookup.result())
+        record = store.host_record(host)
+        for sink in sinks:
+            sink.host(host, record)
+
+    def close_outputs():
+        stats = {"hosts_up": len(live_hosts), "hosts_total": max(len(all_targets), len(store)),
+                 "elapsed": (datetime.now() - start_time).total_seconds()}
+        for sink in sinks:
+            sink.finish(stats)
+            sink.close()
+            print(f"\n[+] {sink.LABEL} written to {sink.path}")
+
+    journal = None
+    resumed_live_hosts = []
+    if args.resume:
+        journal = ScanJournal(args.resume)
+        atexit.register(journal.close) # Also runs on Ctrl-C, so nothing buffered is lost
+        if journal.host_status or journal.done_ports:
+            print(f"[*] Resuming from {args.resume}: {len(journal.host_status)} host(s) discovered and {journal.probes_done()} probe(s) finished already.")
+            for host, status in journal.host_status.items():
+                store.set_status(host, status)
+                if status.startswith("up"):
+                    resumed_live_hosts.append(host)
+        else:
+            print(f"[*] Checkpointing progress to {args.resume}. Rerun with the same --resume to continue after an interruption.")
+
+    history = None
+    since = None
+    changes = [] # --diff-since: (host, port or None, old state, new state, detail)
+    if args.history:
+        history = ScanHistory(args.history)
+        atexit.register(history.close)
+        if args.diff_since:
+            try:
+                since = parse_since(args.diff_since, history)
+            except ValueError:
+                parser.error(f"Invalid --diff-since value: {args.diff_since}")
+            print(f"[*] Differential scan against {args.history} since {since}: known-open ports first, then a {args.diff_sample:.0%} sample of the rest.")
+
+    def record_change(host, port, old, new, detail=""):
+        changes.append((host, port, old, new, detail))
+        where = f"{host}:{port}/{proto}" if port is not None else f"{host} (host)"
+        sys.stdout.write("\r" + " " * 80 + "\r")
+        print(f"    [~] {where} {old} -> {new}{f' ({detail})' if detail else ''}")
+
+    def set_host_status(host, status):
+        store.set_status(host, status)
+        if journal:
+            journal.record_host(host, status)
+        if history:
+            previous = history.record_host(host, status)
+            was_up = previous is not None and previous.startswith("up")
+            if since and was_up != status.startswith("up"):
+                record_change(host, None, previous or "unseen", status)
+        # Port scans emit live hosts when they finish; -sn has nothing more to wait for (but the PTR lookup)
+        if status.startswith("up") and args.ping_scan and not args.reverse_dns or not status.startswith("up") and args.verbose:
+            emit_host(host)
 
 
     # --- Host Discovery Phase ---
+    stage("discovery")
     live_hosts = []
+    # ICMP needs raw sockets, or Scapy with pcap access; a TCP connect is something any user can make
+    use_tcp_ping = bool(args.tcp_ping) or not (icmp_sweep_available() or scapy_ping_available())
+    ping_method = "TCP" if use_tcp_ping else "ICMP"
+    if use_tcp_ping:
+        discovery_ports = parse_ports(args.tcp_ping or DEFAULT_DISCOVERY_PORTS)
+        if not args.tcp_ping:
+            print(f"[i] No raw socket access for ICMP. Discovering hosts with TCP connects to ports {','.join(map(str, discovery_ports))}.")
+
+    def run_ping_discovery(targets):
+        if use_tcp_ping:
+            sweep = tcp_ping_sweep(targets, discovery_ports, args.timeout, args.concurrency, rtt, limiter)
+        else:
+            sweep = ping_sweep(targets, args.timeout, args.threads, rtt, limiter)
+        for host, alive, detail in sweep:
+            if alive:
+                how = f"TCP/{detail}" if use_tcp_ping else "ICMP"
+                print(f"    [+] Host Found ({how}): {host}")
+                live_hosts.append(host)
+                set_host_status(host, f"up ({how})")
+            elif detail:
+                print(f"[!] Error pinging {host}: {detail}")
+                set_host_status(host, f"error pinging ({detail})")
+            else:
+                if args.verbose: print(f"    [-] Host Appears Down ({ping_method}): {host}")
+                set_host_status(host, f"down ({ping_method})")
+
     if args.arp_scan:
-        if not SCAPY_AVAILABLE:
-            print("[!] ARP Scan requires Scapy and usually root privileges. Aborting ARP scan.")
+        if not icmp_sweep_available() and not load_scapy():
+            print("[!] ARP Scan requires root privileges (or Scapy). Aborting ARP scan.")
         else:
             try:
                 # Check if current user is root (simplistic check for Linux/macOS)
@@ -329,95 +4032,105 @@ Disclaimer:
                 pass
 
             print(f"[*] Initiating ARP scan for {args.arp_scan}...")
-            live_hosts = arp_scan_local(args.arp_scan, args.timeout)
+            live_hosts = arp_scan_local(args.arp_scan, args.timeout, rtt, limiter)
             # If ARP scan is primary, other targets might be ignored or handled separately
             # For now, we'll use ARP discovered hosts if any, otherwise proceed with -t targets
             if not live_hosts and all_targets:
-                print("[i] ARP scan found no hosts. Proceeding with ICMP ping for specified targets (if any).")
+                print(f"[i] ARP scan found no hosts. Proceeding with {ping_method} ping for specified targets (if any).")
             elif live_hosts:
                 print(f"[*] ARP Scan complete. Found {len(live_hosts)} live host(s).")
                 # If ARP scan is done, we might not need to ICMP ping these.
                 # For simplicity now, if ARP scan is specified, its results are the primary live_hosts.
                 # If -t was also given, those will be ICMP pinged unless they were found by ARP.
                 discovered_by_arp = set(live_hosts)
-                remaining_targets_for_ping = [t for t in all_targets if t not in discovered_by_arp]
+                remaining_count = len(all_targets) - sum(1 for h in discovered_by_arp if ip_to_int(h) in all_targets)
+                remaining_targets_for_ping = (t for t in iter_ips(all_targets, args.randomize)
+                                              if t not in discovered_by_arp and not (journal and t in journal.host_status))
                 
-                # Add ARP discovered hosts to scan_results
+                # Add ARP discovered hosts to the results
                 for host_ip in live_hosts:
-                    scan_results[host_ip] = {"status": "up (ARP)", "ports": []}
-
-                if remaining_targets_for_ping:
-                    print(f"[*] Performing ICMP Ping for remaining {len(remaining_targets_for_ping)} target(s) specified with -t...")
-                    with ThreadPoolExecutor(max_workers=args.threads) as executor:
-                        future_to_host = {executor.submit(icmp_ping, target, args.timeout): target for target in remaining_targets_for_ping}
-                        for future in as_completed(future_to_host):
-                            host = future_to_host[future]
-                            try:
-                                if future.result():
-                                    print(f"    [+] Host Found (ICMP): {host}")
-                                    live_hosts.append(host)
-                                    scan_results[host] = {"status": "up (ICMP)", "ports": []}
-                                else:
-                                    scan_results[host] = {"status": "down (ICMP)", "ports": []}
-                            except Exception as e:
-                                print(f"[!] Error pinging {host}: {e}")
-                                scan_results[host] = {"status": f"error pinging ({e})", "ports": []}
-                all_targets = list(set(live_hosts + remaining_targets_for_ping)) # Update all_targets for port scanning phase
+                    set_host_status(host_ip, "up (ARP)")
+
+                if remaining_count:
+                    print(f"[*] Performing {ping_method} Ping for remaining {remaining_count} target(s) specified with -t...")
+                    run_ping_discovery(remaining_targets_for_ping)
             else: # No ARP specified, or ARP found nothing and no -t targets
                  pass # Continue to normal ICMP ping if all_targets exist
         
     if not args.arp_scan or (args.arp_scan and not live_hosts and all_targets): # If no ARP scan, or ARP failed and we have -t targets
         if all_targets:
-            print(f"[*] Initiating ICMP Ping scan for {len(all_targets)} target(s)...")
-            ping_targets_to_scan = [t for t in all_targets if t not in live_hosts] # Avoid re-pinging ARP found hosts
-
-            if ping_targets_to_scan:
-                with ThreadPoolExecutor(max_workers=args.threads) as executor:
-                    future_to_host = {executor.submit(icmp_ping, target, args.timeout): target for target in ping_targets_to_scan}
-                    for future in as_completed(future_to_host):
-                        host = future_to_host[future]
-                        try:
-                            if future.result():
-                                print(f"    [+] Host Found (ICMP): {host}")
-                                live_hosts.append(host)
-                                scan_results[host] = {"status": "up (ICMP)", "ports": []}
-                            else:
-                                if args.verbose: print(f"    [-] Host Appears Down (ICMP): {host}")
-                                scan_results[host] = {"status": "down (ICMP)", "ports": []}
-                        except Exception as e:
-                            print(f"[!] Error pinging {host}: {e}")
-                            scan_results[host] = {"status": f"error pinging ({e})", "ports": []}
-            live_hosts = sorted(list(set(live_hosts))) # Ensure unique and sorted
-            print(f"[*] ICMP Ping scan complete. Found {len(live_hosts)} live host(s).")
+            print(f"[*] Initiating {ping_method} Ping scan for {len(all_targets)} target(s)...")
+            already_live = set(live_hosts)
+            ping_targets_to_scan = (t for t in iter_ips(all_targets, args.randomize) # Avoid re-pinging ARP found and resumed hosts
+                                    if t not in already_live and not (journal and t in journal.host_status))
+
+            run_ping_discovery(ping_targets_to_scan)
+            live_hosts = sorted(list(set(live_hosts + resumed_live_hosts))) # Ensure unique and sorted
+            print(f"[*] {ping_method} Ping scan complete. Found {len(live_hosts)} live host(s).")
+
+
+    if resumed_live_hosts and args.arp_scan and live_hosts: # ICMP phase above was skipped
+        live_hosts = sorted(list(set(live_hosts + resumed_live_hosts)))
+    if journal:
+        journal.flush() # Discovery is complete: make sure it survives whatever happens next
 
+    # -R: PTR lookups run on the resolver's pool alongside the port scan, collected for output
+    if args.reverse_dns:
+        reverse_lookups.update((host, resolver.reverse(host)) for host in live_hosts)
+
+    def add_hostnames():
+        for host, lookup in reverse_lookups.items():
+            if lookup.result() and host in store:
+                store.set_hostname(host, lookup.result())
 
     if args.ping_scan: # If it's just a host discovery scan
+        stage("output")
+        add_hostnames()
+        for host in live_hosts if args.reverse_dns else resumed_live_hosts: # Not emitted during discovery
+            emit_host(host)
         print("\n[*] Host Discovery Results:")
-        for host, data in scan_results.items():
-            if "up" in data["status"]: # Check if status contains "up"
-                 print(f"    {host} is {data['status']}")
+        for host in store.hosts():
+            record = store.host_record(host)
+            if "up" in record["status"]: # Check if status contains "up"
+                 name = f" ({record['hostname']})" if "hostname" in record else ""
+                 print(f"    {host}{name} is {record['status']}")
         if args.output_json:
-            with open(args.output_json, 'w') as f:
-                json.dump(scan_results, f, indent=4)
+            store.write_json(args.output_json)
             print(f"\n[+] Results saved to {args.output_json}")
+        close_outputs()
         end_time = datetime.now()
         print(f"\n[*] NetScan Pro finished in {end_time - start_time}")
         sys.exit(0)
 
     if not live_hosts:
         print("\n[!] No live hosts found. Aborting port scan.")
+        close_outputs()
         sys.exit(0)
 
     # --- Port Scanning Phase ---
+    stage("port scan")
     print(f"\n[*] Initiating port scan on {len(live_hosts)} live host(s) for {len(ports_to_scan)} port(s) per host.")
     
     # Determine scan function
     scan_function = None
     scan_type_str = ""
-    if args.tcp_syn_scan:
+    use_raw_syn = False
+    proto = "udp" if args.udp_scan else "tcp"
+    if args.udp_scan:
+        scan_type_str = f"UDP (batched, {f'up to {args.max_rate:g}' if limiter else 'unlimited'} pps)"
+        if not udp_errors_available():
+            print("[i] ICMP errors can't be matched to UDP probes on this platform: closed ports will show as open|filtered.")
+        if args.service_version:
+            print("[i] -sV applies to TCP scans; UDP ports are named after the payload that got an answer.")
+            args.service_version = False
+    elif args.tcp_syn_scan and raw_sockets_available():
+        use_raw_syn = True # Batched sender/receiver engine, no Scapy needed
+        scan_function = scan_tcp_syn
+        scan_type_str = f"TCP SYN (batched raw socket, {f'up to {args.max_rate:g}' if limiter else 'unlimited'} pps)"
+    elif args.tcp_syn_scan:
         scan_function = scan_tcp_syn
-        scan_type_str = "TCP SYN"
-        if not SCAPY_AVAILABLE: # Should have been caught earlier, but double check
+        scan_type_str = "TCP SYN (Scapy, one probe at a time)"
+        if not load_scapy(): # Should have been caught earlier, but double check
             print("[!] Cannot perform SYN scan without Scapy. Exiting.")
             sys.exit(1)
         try: # Check for root/admin for SYN scan
@@ -439,76 +4152,256 @@ Disclaimer:
 
     print(f"[*] Using {scan_type_str} scan type.")
 
-    total_ports_to_scan_overall = len(live_hosts) * len(ports_to_scan)
-    scanned_count = 0
+    if args.engine == "async" and scan_function is not scan_tcp_connect and not args.udp_scan:
+        print("[i] --engine async only applies to TCP Connect scans. Using the thread engine.")
+    use_async = args.engine == "async" and scan_function is scan_tcp_connect
+    if use_async:
+        print(f"[*] Using asyncio engine with up to {args.concurrency} connects in flight.")
 
-    for host in live_hosts: # Iterate through hosts sequentially for clarity, ports concurrently
-        if scan_results.get(host, {}).get("status", "down").startswith("down"): # Skip hosts marked as down
+    hosts_to_scan = []
+    for host in live_hosts:
+        if store.status(host, "down").startswith("down"): # Skip hosts marked as down
             if args.verbose: print(f"[-] Skipping port scan for {host} (marked as down).")
             continue
+        hosts_to_scan.append(host)
 
-        print(f"\n[*] Scanning {host}...")
-        open_ports_on_host = []
-        with ThreadPoolExecutor(max_workers=args.threads) as executor:
-            future_to_port = {
-                executor.submit(scan_function, host, port, args.timeout): port for port in ports_to_scan
-            }
-            for future in as_completed(future_to_port):
-                port = future_to_port[future]
-                scanned_count += 1
-                progress = (scanned_count / total_ports_to_scan_overall) * 100
-                sys.stdout.write(f"\r    Progress: {progress:.2f}% ({scanned_count}/{total_ports_to_scan_overall} host-port pairs) ")
-                sys.stdout.flush()
-                try:
-                    status = future.result()
-                    if status == "open":
-                        service_info = {"port": port, "status": status, "service": "unknown", "banner": ""}
-                        if args.service_version:
-                            banner = get_service_banner(host, port, args.timeout)
-                            service_info["banner"] = banner
-                            # Basic service name from common ports
-                            service_info["service"] = COMMON_TCP_PORTS.get(port, "unknown")
-                        open_ports_on_host.append(service_info)
-                        print(f"\r    [+] {host}:{port}/tcp {status.ljust(10)} {service_info['service']} {service_info['banner'][:50]}{'...' if len(service_info['banner']) > 50 else ''}")
-                    elif args.verbose and status not in ["error (scapy unavailable)", "error (permission)"]: # Don't flood with scapy errors
-                        print(f"\r    [-] {host}:{port}/tcp {status.ljust(10)}")
+    # --diff-since: ports known open (or that changed) since then are probed first, on
+    # top of a random sample of the port range instead of the whole of it
+    priority = {}
+    plan_ports = ports_to_scan
+    if since:
+        known = history.open_ports_since(since, proto)
+        for host in hosts_to_scan:
+            ports = IntRangeSet(port for port in known.get(host, ()) if port in ports_to_scan)
+            if ports:
+                priority[host] = ports
+        plan_ports = sample_int_set(ports_to_scan, args.diff_sample)
 
-                except Exception as e:
-                    if args.verbose: print(f"\r    [!] Error scanning {host}:{port}: {e}")
-        
-        if host in scan_results:
-             scan_results[host]["ports"] = sorted(open_ports_on_host, key=lambda x: x['port'])
-        else: # Should not happen if host discovery ran correctly
-             scan_results[host] = {"status": "unknown", "ports": sorted(open_ports_on_host, key=lambda x: x['port'])}
-        
-        # Ensure a newline after progress bar and port results for this host
-        sys.stdout.write("\r" + " " * 80 + "\r") # Clear the progress line
-        sys.stdout.flush()
-        if not open_ports_on_host and not args.verbose:
+    def planned(host, port):
+        return port in plan_ports or port in priority.get(host, ())
+
+    def planned_count(host):
+        return len(plan_ports) + sum(1 for port in priority.get(host, ()) if port not in plan_ports)
+
+    scanned_count = 0
+    ports_left_by_host = {host: planned_count(host) for host in hosts_to_scan}
+    total_ports_to_scan_overall = sum(ports_left_by_host.values())
+    if journal: # Credit work finished by a previous run
+        for host in hosts_to_scan:
+            already_done = sum(1 for port in journal.done_ports.get(host, ()) if planned(host, port))
+            scanned_count += already_done
+            ports_left_by_host[host] -= already_done
+            for info in journal.open_ports.get(host, []):
+                if planned(host, info["port"]):
+                    store.record(host, info["port"], "open", dict(info, proto=proto))
+            for state, ports in journal.port_states.get(host, {}).items(): # So summaries and -oJ/-oX count them too
+                for port in ports:
+                    if planned(host, port):
+                        store.record(host, port, state)
+
+    # One scheduler for every host: pairs are interleaved port-major and fed through a
+    # single worker pool, so a slow or filtered host no longer stalls the others.
+    print(f"\n[*] Scanning {len(hosts_to_scan)} host(s), at most {args.max_per_host or 'unlimited'} probe(s) in flight per host...")
+    def finish_host(host):
+        if store.status(host) is None: # Should not happen if host discovery ran correctly
+            store.set_status(host, "unknown")
+        if not store.open_ports(host) and not args.verbose:
+            sys.stdout.write("\r" + " " * 80 + "\r") # Clear the progress line
             print(f"    No open ports found on {host} (or not verbose enough to show others).")
+        emit_host(host)
+
+    for host in hosts_to_scan:
+        if ports_left_by_host[host] == 0: # Fully scanned before the interruption
+            finish_host(host)
+
+    # -sV runs as its own stage with its own pool, fed by open-port events, so banner
+    # grabs never block the loop below from consuming scan results.
+    services = None
+    handoff = None
+    if args.service_version:
+        # Greeting delay is server think time rather than network RTT, so --timeout stays the floor here
+        probe_db = load_probe_db(args.probe_db)
+        enricher = ServiceEnricher(probe_db, args.enrich_per_host, target_names, limiter) if args.enrich else None
+        services = ServiceDetectionStage(args.banner_threads, lambda host: max(args.timeout, rtt.retry_timeout(host)) if rtt else args.timeout,
+                                         probe_db, limiter, enricher)
+        if args.reuse_connection and (args.workers > 1 or args.coordinator):
+            print("[i] --reuse-connection is ignored with --workers/--coordinator: connections can't be handed across processes.")
+        elif args.reuse_connection and not use_raw_syn: # SYN scans never complete a handshake to reuse
+            handoff = services.adopt
+    awaiting_banner = {} # (host, port) -> service_info waiting for its banner
+    early_banners = {} # Detections over adopted connections that beat their "open" result here
+
+    def port_done(host, port, status, service_info=None):
+        report = not since # A differential scan only reports changes
+        previous = None
+        if history and not status.startswith("error"):
+            info = service_info or {}
+            previous = history.record_port(host, port, status, info.get("service", ""), info.get("banner", ""), info.get("version", ""), proto)
+            if since and port_state_changed(previous, status, info.get("service", ""), info.get("version", "")):
+                report = True
+                record_change(host, port, previous[0] if previous else "unseen", status, info.get("version") or info.get("banner", ""))
+        if not status.startswith("error"): # Errors are retried on resume, so don't count as a result
+            store.record(host, port, status, service_info)
+        if status == "open":
+            if not since:
+                detail = service_info.get('version') or service_info['banner']
+                print(f"\r    [+] {host}:{port}/{proto} {status.ljust(10)} {service_info['service']} {detail[:50]}{'...' if len(detail) > 50 else ''}")
+        elif args.verbose and status not in ["error (scapy unavailable)", "error (permission)"]: # Don't flood with scapy errors
+            print(f"\r    [-] {host}:{port}/{proto} {status.ljust(10)}")
+        if journal and not status.startswith("error"): # Errors are retried on resume
+            if status == "open":
+                details = {key: service_info[key] for key in ENRICHMENT_KEYS if key in service_info} # So -oX/-oJ keep them on resume
+                journal.record_port(host, port, status, service_info["service"], service_info["banner"], service_info.get("version", ""), details)
+            else:
+                journal.record_port(host, port, status)
+        if sinks and report:
+            was = (previous[0] if previous else "unseen") if since else None
+            for sink in sinks:
+                sink.port(host, port, status, proto, service_info if status == "open" else None, was)
+
+        ports_left_by_host[host] -= 1
+        if ports_left_by_host[host] == 0: # Last port for this host just finished
+            finish_host(host)
+
+    def banner_done(host, port, detection):
+        service_info = awaiting_banner.pop((host, port), None)
+        if service_info is None:
+            early_banners[(host, port)] = detection
+            return
+        service_info["banner"] = detection["banner"]
+        if detection["service"]: # Fingerprint match beats the port-number guess
+            service_info["service"] = detection["service"]
+        if detection["version"]:
+            service_info["version"] = detection["version"]
+        for key in ENRICHMENT_KEYS:
+            if key in detection:
+                service_info[key] = detection[key]
+        port_done(host, port, "open", service_info)
+
+    if args.randomize:
+        random.shuffle(hosts_to_scan)
+    if priority:
+        hosts_to_scan.sort(key=lambda host: host not in priority) # Stable: keeps the shuffle within each group
+    engine_config = {"engine": "udp" if args.udp_scan else "syn-raw" if use_raw_syn else "async" if use_async else "thread",
+                     "scan": "udp" if args.udp_scan else "syn" if scan_function is scan_tcp_syn else "connect", "timeout": args.timeout,
+                     "threads": args.threads, "concurrency": args.concurrency, "max_per_host": args.max_per_host}
+    if args.coordinator:
+        coordinator_config = {"engine": engine_config, "adaptive": args.adaptive_timeout, "min_rtt_timeout": args.min_rtt_timeout,
+                              "max_rtt_timeout": args.max_rtt_timeout, "max_rate": limiter.max_rate if limiter else 0, "min_rate": args.min_rate}
+        coordinator = ScanCoordinator(parse_address(args.coordinator), hosts_to_scan, iter_values(ports_to_scan, args.randomize),
+                                      coordinator_config, args.lease_size, args.lease_timeout)
+        results = coordinator.scan()
+        if journal: # Leases cover whole blocks; drop what an earlier run already recorded
+            results = ((host, port, state) for host, port, state in results if not journal.is_done(host, port))
+    elif args.workers > 1:
+        print(f"[*] Sharding the scan across {args.workers} worker processes.")
+        rate = (limiter.max_rate, args.min_rate) if limiter else None
+        results = multiprocess_scan(hosts_to_scan, ports_to_scan, args.workers, engine_config, rtt, rate,
+                                    journal.done_ports if journal else None, args.randomize)
+    else:
+        pairs = interleave_pairs(hosts_to_scan, iter_values(plan_ports, args.randomize))
+        if priority:
+            pairs = chain(((host, port) for host in hosts_to_scan for port in priority.get(host, ())),
+                          ((host, port) for host, port in pairs if port not in priority.get(host, ())))
+        if journal:
+            pairs = ((host, port) for host, port in pairs if not journal.is_done(host, port))
+        results = open_engine(engine_config, metrics.track(pairs), rtt, limiter, handoff)
+    if _profile:
+        results = _profile.timed_results(results)
+    metrics.begin(total_ports_to_scan_overall, scanned_count)
+    redraw_at = 0.0
+    for host, port, status in results:
+        scanned_count += 1
+        metrics.record(status)
+        now = time.monotonic()
+        if now >= redraw_at or scanned_count == total_ports_to_scan_overall: # Redrawing per result costs real time at high rates
+            sys.stdout.write(f"\r    {metrics.progress_line()} ")
+            sys.stdout.flush()
+            redraw_at = now + PROGRESS_INTERVAL
+        if status == "open":
+            service_info = {"port": port, "proto": proto, "status": status, "service": "unknown", "banner": ""}
+            if args.udp_scan: # The payload that got the answer tells what answered
+                service_info["service"] = COMMON_UDP_PORTS.get(port, "unknown")
+            if services:
+                # Basic service name from common ports
+                service_info["service"] = COMMON_TCP_PORTS.get(port, "unknown")
+                awaiting_banner[(host, port)] = service_info
+                services.submit(host, port)
+                if (host, port) in early_banners:
+                    banner_done(host, port, early_banners.pop((host, port)))
+            else:
+                port_done(host, port, status, service_info)
+        else:
+            port_done(host, port, status)
+        if services:
+            for finished in services.completed():
+                banner_done(*finished)
+
+    if services: # Scanning is done; wait for the banner stage to drain
+        stage("service detection")
+        while services.outstanding:
+            banner_done(*services.wait())
+        services.shutdown()
+
+    # Ensure a newline after progress bar and port results
+    sys.stdout.write("\r" + " " * 80 + "\r") # Clear the progress line
+    sys.stdout.flush()
+    if args.coordinator and coordinator.reissued:
+        print(f"[i] {coordinator.reissued} lease(s) were re-issued after a worker stalled or disconnected.")
+    elapsed = time.monotonic() - metrics.started
+    probed = metrics.completed - metrics.resumed
+    if elapsed > 0 and probed:
+        print(f"[i] {probed} probe(s) in {elapsed:.1f}s ({probed / elapsed:,.0f} per second).")
+    if limiter and limiter.decreases:
+        print(f"[i] Congestion control backed off {limiter.decreases} time(s) on probe loss; final rate {limiter.rate:.0f} pps.")
 
 
     # --- Output Results ---
-    print("\n\n--- Scan Summary ---")
-    for host, data in scan_results.items():
-        if "up" not in data.get("status", "down"): # Skip hosts that were down or error
-            if args.verbose: print(f"{host}: Status {data.get('status', 'unknown')}")
+    stage("output")
+    add_hostnames()
+    if since:
+        print(f"\n\n--- Changes since {since} ---")
+        for host, port, old, new, detail in changes:
+            where = f"{host}:{port}/{proto}" if port is not None else f"{host} (host)"
+            print(f"  {where.ljust(24)} {old} -> {new}{f'  {detail[:40]}' if detail else ''}")
+        if not changes:
+            print("  No changes.")
+    else:
+        print("\n\n--- Scan Summary ---")
+        totals = store.state_counts(brief=True)
+        if totals: # Counted straight off the state matrix
+            print(f"{sum(totals.values())} port(s) probed: {', '.join(f'{count} {state}' for state, count in sorted(totals.items(), key=lambda item: -item[1]))}")
+    for host in store.hosts():
+        if since: # The changes above are the summary; -oJ still gets everything
+            break
+        data = store.host_record(host)
+        if "up" not in data["status"]: # Skip hosts that were down or error
+            if args.verbose: print(f"{host}: Status {data['status']}")
             continue
 
-        print(f"\nHost: {host} ({data.get('status', 'unknown')})")
+        name = f" ({data['hostname']})" if "hostname" in data else ""
+        print(f"\nHost: {host}{name} ({data['status']})")
+        not_shown = {state: count for state, count in store.state_counts(host, brief=True).items() if state != "open"}
+        if not_shown:
+            print(f"  Not shown: {', '.join(f'{count} {state}' for state, count in sorted(not_shown.items(), key=lambda item: -item[1]))}")
         if data.get("ports"):
-            print("  PORT     STATE   SERVICE    BANNER")
+            print("  PORT       STATE   SERVICE    BANNER")
             for p_info in data["ports"]:
-                banner_snip = p_info.get('banner', '')[:40]
-                if len(p_info.get('banner', '')) > 40: banner_snip += "..."
-                print(f"  {str(p_info['port']).ljust(7)} {p_info['status'].ljust(7)} {p_info.get('service', 'unknown').ljust(10)} {banner_snip}")
+                banner_text = p_info.get('version') or p_info.get('banner', '') # Prefer the fingerprinted version
+                banner_snip = banner_text[:40]
+                if len(banner_text) > 40: banner_snip += "..."
+                print(f"  {(str(p_info['port']) + '/' + p_info.get('proto', 'tcp')).ljust(10)} {p_info['status'].ljust(7)} {p_info.get('service', 'unknown').ljust(10)} {banner_snip}")
+                if "tls" in p_info:
+                    print(f"  |_ tls: {describe_tls(p_info['tls'])}")
+                if "http" in p_info:
+                    print(f"  |_ http: {describe_http(p_info['http'])}")
         else:
             if data.get("status", "").startswith("up"): # Only say "no open ports" if host was up
                 print("  No open ports found (or service detection disabled for closed ports).")
 
+    close_outputs()
     if args.output_json:
-        with open(args.output_json, 'w') as f:
-            json.dump(scan_results, f, indent=4)
+        store.write_json(args.output_json)
         print(f"\n[+] Full results saved to {args.output_json}")
 
     end_time = datetime.now()
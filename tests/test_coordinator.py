@@ -0,0 +1,191 @@
+import json
+import socket
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from netscan_pro import IntRangeSet, ScanCoordinator, make_leases, run_worker
+
+ENGINE = {"engine": "thread", "scan": "connect", "timeout": 1.0, "threads": 8, "concurrency": 8, "max_per_host": 0}
+WORKER_CONFIG = {"engine": ENGINE, "adaptive": False, "min_rtt_timeout": 0.1, "max_rtt_timeout": 1.0, "max_rate": 0, "min_rate": None}
+
+
+def coordinator(hosts, ports, lease_size=4, lease_timeout=60):
+    return ScanCoordinator(("127.0.0.1", 0), hosts, ports, {}, lease_size, lease_timeout)
+
+
+def pairs_of(lease):
+    return [(host, port) for port in lease["port_set"] for host in lease["hosts"]]
+
+
+def drain_results(coord):
+    results = []
+    while not coord.results.empty():
+        results.append(coord.results.get_nowait())
+    return results
+
+
+def test_leases_cover_every_pair_once():
+    hosts = [f"10.0.0.{i}" for i in range(1, 4)]
+    leases = list(make_leases(hosts, IntRangeSet(range(1, 11)), lease_size=4))
+    covered = [pair for lease in leases for pair in pairs_of(lease)]
+    assert sorted(covered) == sorted((h, p) for h in hosts for p in range(1, 11))
+    assert all(lease["size"] == len(pairs_of(lease)) for lease in leases)
+
+
+def test_stalled_lease_is_reissued_and_results_deduplicated():
+    coord = coordinator(["a", "b"], range(1, 3), lease_size=4, lease_timeout=0.05)
+    first_worker, second_worker = object(), object()
+    lease = coord._next_lease(first_worker)
+    coord._record(lease["id"], [["a", 1, "open"]]) # Partial progress, then silence
+    assert coord._next_lease(second_worker) is None # Everything is handed out
+    time.sleep(0.1)
+    coord._expire()
+    assert coord.reissued == 1
+    again = coord._next_lease(second_worker)
+    assert again["id"] == lease["id"] and again["owner"] is second_worker
+    coord._record(again["id"], [[h, p, "closed"] for h, p in pairs_of(again)])
+    coord._record(lease["id"], [["b", 2, "late duplicate"]]) # The first worker comes back
+    assert sorted(drain_results(coord)) == [("a", 1, "open"), ("a", 2, "closed"), ("b", 1, "closed"), ("b", 2, "closed")]
+    assert coord._finished()
+
+
+def test_disconnected_worker_releases_its_lease():
+    coord = coordinator(["a"], range(1, 9), lease_size=4)
+    worker = object()
+    first = coord._next_lease(worker)
+    coord._release(worker)
+    assert coord.reissued == 1
+    assert coord._next_lease(object())["id"] == first["id"] # Requeued leases go out first
+
+
+def test_results_outside_the_lease_are_ignored():
+    coord = coordinator(["a"], range(1, 3), lease_size=4)
+    lease = coord._next_lease(object())
+    coord._record(lease["id"], [["a", 1, "open"], ["evil", 1, "open"], ["a", 99, "open"]])
+    assert drain_results(coord) == [("a", 1, "open")]
+    assert not coord._finished()
+
+
+def test_finished_lease_is_not_reissued():
+    coord = coordinator(["a"], range(1, 3), lease_size=4)
+    worker = object()
+    lease = coord._next_lease(worker)
+    coord._record(lease["id"], [["a", 1, "closed"], ["a", 2, "closed"]])
+    coord._release(worker)
+    assert coord.reissued == 0
+    assert coord._next_lease(object()) is None
+    assert coord._finished()
+
+
+@pytest.fixture
+def loopback_target():
+    """(ports to scan, the open one) on 127.0.0.1: one listener and a run of closed ports."""
+    listener = socket.create_server(("127.0.0.1", 0), backlog=64)
+    closed = []
+    for _ in range(15):
+        probe = socket.create_server(("127.0.0.1", 0))
+        closed.append(probe.getsockname()[1])
+        probe.close()
+    open_port = listener.getsockname()[1]
+    yield IntRangeSet(closed + [open_port]), open_port
+    listener.close()
+
+
+class RunningScan:
+    """Drives ScanCoordinator.scan() on a thread, as main() would, collecting its results."""
+
+    def __init__(self, coord):
+        self.coord = coord
+        self.results = []
+        self._thread = threading.Thread(target=lambda: self.results.extend(coord.scan()), daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 5
+        while coord.address[1] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert coord.address[1], "coordinator never started listening"
+
+    def start_worker(self):
+        exits = []
+        thread = threading.Thread(target=lambda: exits.append(run_worker(self.coord.address, connect_timeout=5)), daemon=True)
+        thread.start()
+        return thread, exits
+
+    def join(self, seconds=20):
+        self._thread.join(seconds)
+        assert not self._thread.is_alive(), "scan never finished"
+        return self.results
+
+
+def assert_each_pair_once(results, hosts, ports, open_port):
+    counts = Counter((host, port) for host, port, _ in results)
+    assert set(counts) == {(host, port) for host in hosts for port in ports}
+    assert set(counts.values()) == {1}
+    assert {(host, port) for host, port, state in results if state == "open"} == {("127.0.0.1", open_port)}
+
+
+def test_workers_over_loopback_report_every_pair_once(loopback_target):
+    ports, open_port = loopback_target
+    hosts = ["127.0.0.1", "127.0.0.2"] # Nothing listens on .2, so all of its ports are closed
+    scan = RunningScan(ScanCoordinator(("127.0.0.1", 0), hosts, ports, WORKER_CONFIG, lease_size=6))
+    workers = [scan.start_worker() for _ in range(2)]
+    results = scan.join()
+    for thread, exits in workers:
+        thread.join(5)
+        assert exits == [0]
+    assert_each_pair_once(results, hosts, ports, open_port)
+    assert scan.coord.reissued == 0
+
+
+def test_accept_thread_ends_with_the_scan(loopback_target):
+    ports, _ = loopback_target
+    scan = RunningScan(ScanCoordinator(("127.0.0.1", 0), ["127.0.0.1"], ports, WORKER_CONFIG))
+    thread, exits = scan.start_worker()
+    scan.join()
+    thread.join(5)
+    deadline = time.monotonic() + 2
+    while any(t.name == "coordinator-accept" for t in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(t.name == "coordinator-accept" for t in threading.enumerate())
+
+
+def test_killed_workers_lease_is_reissued(loopback_target):
+    ports, open_port = loopback_target
+    scan = RunningScan(ScanCoordinator(("127.0.0.1", 0), ["127.0.0.1"], ports, WORKER_CONFIG, lease_size=4))
+    with socket.create_connection(scan.coord.address) as doomed: # Takes a lease, then dies without scanning it
+        rfile = doomed.makefile("rb")
+        doomed.sendall(b'{"type": "hello"}\n{"type": "next"}\n')
+        assert json.loads(rfile.readline())["type"] == "config"
+        assert json.loads(rfile.readline())["type"] == "lease"
+        rfile.close()
+    thread, exits = scan.start_worker()
+    results = scan.join()
+    thread.join(5)
+    assert exits == [0]
+    assert scan.coord.reissued == 1
+    assert_each_pair_once(results, ["127.0.0.1"], ports, open_port)
+
+
+@pytest.mark.parametrize("replies", [
+    b"", # Hangs up straight away
+    b'{"type": "con', # Cut off mid-line
+    b'{"type": "config", "engine": {"engine": "thread", "scan": "connect", "timeout": 1.0, "threads": 1, "concurrency": 1, '
+    b'"max_per_host": 0}, "adaptive": false, "min_rtt_timeout": 0.1, "max_rtt_timeout": 1.0, "max_rate": 0, "min_rate": null}\n'
+    b'{"type": "lea', # Gone while sending the first lease
+])
+def test_worker_exits_cleanly_when_the_coordinator_goes_away(replies):
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def coordinator():
+        conn, _ = server.accept()
+        conn.recv(1024)
+        conn.sendall(replies)
+        conn.close()
+
+    threading.Thread(target=coordinator, daemon=True).start()
+    try:
+        assert run_worker(server.getsockname(), connect_timeout=5) == 1
+    finally:
+        server.close()
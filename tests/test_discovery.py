@@ -0,0 +1,94 @@
+import socket
+import struct
+import time
+
+import pytest
+
+import netscan_pro
+from netscan_pro import ArpSweep, IcmpSweep, RttTracker, icmp_sweep_available, ping_sweep, scapy_ping_available
+
+needs_raw_icmp = pytest.mark.skipif(not icmp_sweep_available(), reason="needs raw ICMP sockets (root or CAP_NET_RAW)")
+
+
+def ipv6_loopback_available():
+    try:
+        socket.socket(socket.AF_INET6, socket.SOCK_DGRAM).close()
+        return socket.has_ipv6
+    except OSError:
+        return False
+
+
+@needs_raw_icmp
+def test_icmp_sweep_on_loopback():
+    rtt = RttTracker(1.0)
+    hosts = ["127.0.0.1", "127.0.0.2"] + (["::1"] if ipv6_loopback_available() else [])
+    results = list(IcmpSweep(1.0, rtt=rtt).sweep(hosts))
+    assert sorted(results) == sorted((host, True, None) for host in hosts)
+    assert rtt.srtt("127.0.0.1") is not None # Replies seed the port scan's timeouts
+
+
+@needs_raw_icmp
+def test_icmp_sweep_reports_silent_hosts_after_one_timeout():
+    class DroppingSweep(IcmpSweep):
+        def send_probe(self, sock, host, probe):
+            if host != "127.0.0.3": # As if the probe or its reply were lost
+                super().send_probe(sock, host, probe)
+
+    start = time.monotonic()
+    results = dict((host, alive) for host, alive, _ in DroppingSweep(0.3).sweep(["127.0.0.1", "127.0.0.3", "127.0.0.4"]))
+    assert results == {"127.0.0.1": True, "127.0.0.3": False, "127.0.0.4": True}
+    assert time.monotonic() - start < 1.5 # One shared timeout, not one per host
+
+
+def echo_reply(sweep, host, ident=None, cookie=None):
+    cookie = cookie or sweep.cookie(host)
+    icmp = struct.pack("!BBHHH", 0, 0, 0, sweep.ident if ident is None else ident, int.from_bytes(cookie[:2], "big")) + cookie
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(icmp), 0, 0, 64, 1, 0,
+                       socket.inet_aton(host), socket.inet_aton("127.0.0.1")) + icmp
+
+
+def test_icmp_replies_are_matched_by_ident_and_cookie():
+    sweep = IcmpSweep(1.0)
+    assert sweep.parse_reply(echo_reply(sweep, "10.0.0.5"), ("10.0.0.5", 0), socket.AF_INET) == ("10.0.0.5", None)
+    assert sweep.parse_reply(echo_reply(sweep, "10.0.0.5", ident=sweep.ident ^ 1), ("10.0.0.5", 0), socket.AF_INET) is None
+    assert sweep.parse_reply(echo_reply(sweep, "10.0.0.5", cookie=sweep.cookie("10.0.0.6")), ("10.0.0.5", 0), socket.AF_INET) is None
+    request = bytearray(echo_reply(sweep, "10.0.0.5"))
+    request[20] = 8 # Our own echo request, seen on the raw socket
+    assert sweep.parse_reply(bytes(request), ("10.0.0.5", 0), socket.AF_INET) is None
+
+
+def test_icmp_probe_checksum():
+    packet = IcmpSweep(1.0).build_probe("10.0.0.5")
+    words = struct.unpack(f"!{len(packet) // 2}H", packet)
+    assert sum(words) % 0xFFFF == 0 # Ones' complement sum of a valid ICMP message
+
+
+def test_arp_request_and_reply():
+    mac = bytes.fromhex("020000000001")
+    sweep = ArpSweep("lo", "10.0.0.1", mac, 1.0)
+    request = sweep.build_probe("10.0.0.7")
+    assert request[:6] == b"\xff" * 6 and request[12:14] == b"\x08\x06" and request[20:22] == b"\x00\x01"
+    assert request[28:32] == socket.inet_aton("10.0.0.1") and request[38:42] == socket.inet_aton("10.0.0.7")
+    reply = (mac + bytes.fromhex("02000000aabb") + b"\x08\x06" + struct.pack("!HHBBH", 1, 0x0800, 6, 4, 2)
+             + bytes.fromhex("02000000aabb") + socket.inet_aton("10.0.0.7") + mac + socket.inet_aton("10.0.0.1"))
+    assert sweep.parse_reply(reply, None, None) == ("10.0.0.7", "02:00:00:00:aa:bb")
+    assert sweep.parse_reply(request, None, None) is None # Requests, including our own broadcast, are ignored
+
+
+def test_scapy_ping_is_used_without_raw_sockets(monkeypatch):
+    monkeypatch.setattr(netscan_pro, "icmp_sweep_available", lambda: False)
+    monkeypatch.setattr(netscan_pro, "icmp_ping", lambda host, timeout, rtt, limiter: host.endswith(".1"))
+    assert sorted(ping_sweep(["10.0.0.1", "10.0.0.2", "10.0.1.1"], 0.1, 4)) == [
+        ("10.0.0.1", True, None), ("10.0.0.2", False, None), ("10.0.1.1", True, None)]
+
+
+@pytest.mark.parametrize("platform, installed, expected", [
+    ("linux", True, False), # Scapy would need the raw sockets we just failed to open
+    ("darwin", True, True),
+    ("win32", True, True),
+    ("darwin", False, False),
+])
+def test_scapy_ping_availability(monkeypatch, platform, installed, expected):
+    monkeypatch.setattr(netscan_pro.sys, "platform", platform)
+    monkeypatch.setattr(netscan_pro.importlib.util, "find_spec", lambda name: object() if installed else None)
+    assert scapy_ping_available() == expected
@@ -0,0 +1,87 @@
+import errno
+import socket
+import struct
+
+import pytest
+
+import netscan_pro
+from netscan_pro import (SynScanner, _checksum_words, _fold_checksum, async_connect_scan, raw_sockets_available,
+                         scan_tcp_connect, syn_scan, thread_pool_scan)
+
+
+@pytest.fixture
+def loopback_ports():
+    """(open port, closed port) on 127.0.0.1."""
+    listener = socket.create_server(("127.0.0.1", 0), backlog=64)
+    probe = socket.create_server(("127.0.0.1", 0))
+    closed = probe.getsockname()[1]
+    probe.close()
+    yield listener.getsockname()[1], closed
+    listener.close()
+
+
+def states(results):
+    return {port: state for _, port, state in results}
+
+
+def test_syn_checksum_verifies_against_pseudo_header():
+    scanner = SynScanner(1.0)
+    segment = scanner.build_syn("127.0.0.1", 443)
+    pseudo = socket.inet_aton("127.0.0.1") * 2 + struct.pack("!BBH", 0, socket.IPPROTO_TCP, len(segment))
+    assert _fold_checksum(_checksum_words(pseudo + segment)) == 0
+    dport, seq = struct.unpack("!HI", segment[2:8])
+    assert dport == 443 and seq == scanner.cookie("127.0.0.1", 443)
+
+
+def test_syn_cookies_differ_per_port_and_per_scanner():
+    scanner = SynScanner(1.0)
+    assert scanner.cookie("10.0.0.1", 80) != scanner.cookie("10.0.0.1", 81)
+    assert scanner.cookie("10.0.0.1", 80) != SynScanner(1.0).cookie("10.0.0.1", 80)
+
+
+@pytest.mark.skipif(not raw_sockets_available(), reason="needs raw sockets (Linux, root)")
+def test_syn_scan_on_loopback(loopback_ports):
+    open_port, closed_port = loopback_ports
+    result = states(syn_scan([("127.0.0.1", open_port), ("127.0.0.1", closed_port)], 1.0))
+    assert result == {open_port: "open", closed_port: "closed"}
+
+
+
+def test_async_engine_on_loopback(loopback_ports):
+    open_port, closed_port = loopback_ports
+    result = states(async_connect_scan([("127.0.0.1", open_port), ("127.0.0.1", closed_port)], 1.0, concurrency=8))
+    assert result == {open_port: "open", closed_port: "closed"}
+
+
+def test_thread_engine_on_loopback(loopback_ports):
+    open_port, closed_port = loopback_ports
+    result = states(thread_pool_scan(scan_tcp_connect, [("127.0.0.1", open_port), ("127.0.0.1", closed_port)], 1.0, 4))
+    assert result == {open_port: "open", closed_port: "closed"}
+
+
+@pytest.mark.parametrize("error, expected", [
+    (errno.EAGAIN, "filtered (timeout)"),
+    (errno.EWOULDBLOCK, "filtered (timeout)"),
+    (errno.ETIMEDOUT, "filtered (timeout)"),
+    (errno.ECONNREFUSED, "closed"),
+    (errno.EHOSTUNREACH, "closed"),
+])
+def test_connect_errors_are_classified(monkeypatch, error, expected):
+    class FakeSocket:
+        def __init__(self, *args):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def settimeout(self, timeout):
+            pass
+
+        def connect_ex(self, address):
+            return error
+
+    monkeypatch.setattr(netscan_pro.socket, "socket", FakeSocket)
+    assert scan_tcp_connect("192.0.2.1", 80, 0.1) == expected
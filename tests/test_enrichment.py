@@ -0,0 +1,179 @@
+import http.server
+import shutil
+import socket
+import subprocess
+import ssl
+import threading
+import time
+
+import pytest
+
+from netscan_pro import ServiceEnricher, ServiceFingerprintDB, parse_certificate, parse_http_response
+
+
+@pytest.fixture(scope="session")
+def certificate(tmp_path_factory):
+    """(certificate, key) paths for a self-signed netscan.test certificate, made at test time
+    so no key material lives in the repo. Valid past 2049 so notAfter is a GeneralizedTime."""
+    openssl = shutil.which("openssl")
+    if not openssl:
+        pytest.skip("openssl is not available to make a test certificate")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = directory / "server.pem", directory / "server.key"
+    command = [openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "40000",
+               "-keyout", str(key), "-out", str(cert), "-subj", "/CN=netscan.test/O=NetScan Tests",
+               "-addext", "subjectAltName=DNS:netscan.test,DNS:www.netscan.test,IP:127.0.0.1"]
+    try:
+        subprocess.run(command, capture_output=True, check=True, timeout=60)
+    except (OSError, subprocess.SubprocessError) as e:
+        pytest.skip(f"could not make a test certificate: {e}")
+    return str(cert), str(key)
+
+
+def certificate_der(certificate):
+    with open(certificate[0]) as f:
+        return ssl.PEM_cert_to_DER_cert(f.read())
+
+
+class TitleHandler(http.server.BaseHTTPRequestHandler):
+    delay = 0
+
+    def do_GET(self):
+        self.server.hosts.append(self.headers.get("Host"))
+        with self.server.lock:
+            self.server.active += 1
+            self.server.peak = max(self.server.peak, self.server.active)
+        time.sleep(self.delay)
+        body = b"<html><head><title>Inventory &amp; more</title></head></html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler=TitleHandler, certificate=None):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.hosts, server.active, server.peak, server.lock, server.sni = [], 0, 0, threading.Lock(), []
+    if certificate:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        context.sni_callback = lambda sock, name, ctx: server.sni.append(name)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def https_server(certificate):
+    server = serve(certificate=certificate)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def http_server():
+    server = serve()
+    yield server
+    server.shutdown()
+
+
+def silent_detection():
+    return {"banner": "(banner grab timeout)", "service": "", "version": ""}
+
+
+def test_parse_certificate(certificate):
+    info = parse_certificate(certificate_der(certificate))
+    assert info["subject"] == "CN=netscan.test, O=NetScan Tests"
+    assert info["issuer"] == info["subject"]
+    assert info["san"] == ["netscan.test", "www.netscan.test", "127.0.0.1"]
+    assert info["not_before"].startswith("20") and info["not_before"].endswith("Z") # UTCTime
+    assert int(info["not_after"][:4]) > 2049 and info["not_after"].endswith("Z") # GeneralizedTime
+
+
+def test_parse_http_response():
+    info = parse_http_response(b"HTTP/1.1 301 Moved Permanently\r\nServer: nginx\r\nLocation: https://x/\r\n\r\n"
+                               b"<HTML><TITLE>\n  Moved &lt;here&gt;\n</TITLE>")
+    assert info == {"status": 301, "server": "nginx", "location": "https://x/", "title": "Moved <here>"}
+    assert parse_http_response(b"HTTP/1.0 200 OK\r\n\r\n") == {"status": 200}
+    assert parse_http_response(b"SSH-2.0-OpenSSH_9.6\r\n") is None
+    assert parse_http_response(b"") is None
+
+
+def test_tls_service_gets_certificate_and_http_details(https_server):
+    port = https_server.server_address[1]
+    enricher = ServiceEnricher(ServiceFingerprintDB.load(), names={"127.0.0.1": "www.netscan.test"})
+    detection = enricher.enrich("127.0.0.1", port, silent_detection(), b"", 2)
+    assert detection["service"] == "https"
+    assert detection["tls"]["subject"] == "CN=netscan.test, O=NetScan Tests"
+    assert "www.netscan.test" in detection["tls"]["san"]
+    assert detection["http"]["status"] == 200
+    assert detection["http"]["title"] == "Inventory & more"
+    assert detection["version"].startswith("BaseHTTP") # Server header run through the fingerprints
+    assert https_server.sni == ["www.netscan.test"]
+    assert https_server.hosts == ["www.netscan.test"]
+
+
+def test_no_sni_for_targets_given_as_addresses(https_server):
+    enricher = ServiceEnricher()
+    detection = enricher.enrich("127.0.0.1", https_server.server_address[1], silent_detection(), b"", 2)
+    assert detection["service"] == "https"
+    assert https_server.sni == [None]
+    assert https_server.hosts == ["127.0.0.1"]
+
+
+def test_http_on_a_non_standard_port_is_found(http_server):
+    detection = ServiceEnricher().enrich("127.0.0.1", http_server.server_address[1], silent_detection(), b"", 2)
+    assert "tls" not in detection
+    assert detection["service"] == "http"
+    assert detection["http"]["title"] == "Inventory & more"
+    assert detection["banner"].startswith("HTTP/1.0 200")
+
+
+def test_silent_service_stays_unknown():
+    listener = socket.create_server(("127.0.0.1", 0))
+    try:
+        start = time.monotonic()
+        detection = ServiceEnricher().enrich("127.0.0.1", listener.getsockname()[1], silent_detection(), b"", 0.3)
+        assert time.monotonic() - start < 1.5 # Handshake timed out: no plain HTTP attempt after it
+    finally:
+        listener.close()
+    assert detection == silent_detection()
+
+
+def test_other_services_are_left_alone():
+    detection = {"banner": "SSH-2.0-x", "service": "ssh", "version": ""}
+    assert ServiceEnricher().enrich("127.0.0.1", 1, dict(detection), b"SSH-2.0-x\r\n", 1) == detection
+
+
+def test_connections_are_bounded_per_host():
+    class SlowHandler(TitleHandler):
+        delay = 0.1
+
+    server = serve(SlowHandler)
+    try:
+        enricher = ServiceEnricher(per_host=2)
+        port = server.server_address[1]
+        detection = {"banner": "", "service": "http", "version": ""}
+        threads = [threading.Thread(target=enricher.enrich, args=("127.0.0.1", port, dict(detection), b"x", 2)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.shutdown()
+    assert len(server.hosts) == 6
+    assert server.peak <= 2
+
+
+def test_tls_probe_ports_go_straight_to_the_enricher():
+    db = ServiceFingerprintDB.load()
+    enricher = ServiceEnricher(db)
+    assert enricher.replaces(db.probe_for_port(443))
+    assert not enricher.replaces(db.probe_for_port(80))
+    assert not enricher.replaces(None)
@@ -0,0 +1,76 @@
+import json
+import re
+
+import pytest
+
+from netscan_bench import BANNER_CORPUS, linear_match, pad_database
+from netscan_pro import ServiceFingerprintDB, _regex_first_bytes, format_version
+
+
+@pytest.mark.parametrize("pattern, expected", [
+    ("^SSH-([\\d.]+)", {ord("S")}),
+    ("^\\+OK ", {ord("+")}),
+    ("^\\x16\\x03", {0x16}),
+    ("^HTTP/1\\.[01] (a|b)", {ord("H")}), # Alternation inside a group doesn't matter
+    ("^x[a|b]", {ord("x")}),
+])
+def test_first_bytes_of_literal_prefixes(pattern, expected):
+    assert _regex_first_bytes(pattern) == expected
+
+
+@pytest.mark.parametrize("pattern", [
+    "SSH-", # Unanchored
+    "^.", "^\\d+", "^[AB]", "^(a|b)", "^a?b", "^a*", "^a{0,1}",
+    "^a|^b", "^220 x|^230 y", "^a(b)|c", # Top-level alternation
+])
+def test_no_first_bytes_when_the_prefix_is_not_fixed(pattern):
+    assert _regex_first_bytes(pattern) is None
+
+
+def test_first_bytes_ignore_case():
+    assert _regex_first_bytes("^ssh", ignore_case=True) == {ord("s"), ord("S")}
+
+
+@pytest.fixture
+def probe_db(tmp_path):
+    def load(entries):
+        path = tmp_path / "probes.json"
+        path.write_text(json.dumps({"version": 1, "probes": entries}))
+        return ServiceFingerprintDB.load(str(path))
+    return load
+
+
+def test_alternation_matches_every_branch(probe_db):
+    db = probe_db([{"name": "NULL", "send": "", "ports": [], "matches": [
+        {"service": "either", "pattern": "^alpha|^beta"}]}])
+    assert db.match(None, b"alpha 1")["service"] == "either"
+    assert db.match(None, b"beta 2")["service"] == "either"
+    assert db.match(None, b"gamma") is None
+
+
+def test_shipped_database_identifies_common_banners():
+    db = ServiceFingerprintDB.load()
+    ssh = db.match(db.probe_for_port(22), b"SSH-2.0-OpenSSH_9.6p1 Ubuntu-3ubuntu13\r\n")
+    assert (ssh["service"], ssh["product"], ssh["version"]) == ("ssh", "OpenSSH", "9.6p1")
+    http = db.match(db.probe_for_port(80), b"HTTP/1.1 200 OK\r\nServer: nginx/1.25.3\r\n\r\n")
+    assert format_version(http) == "nginx 1.25.3"
+    # A greeting in reply to a probe for another service still matches via the NULL probe
+    assert db.match(db.probe_for_port(80), b"220 (vsFTPd 3.0.5)\r\n")["service"] == "ftp"
+
+
+def test_shipped_database_patterns_all_compile():
+    db = ServiceFingerprintDB.load()
+    assert db.matcher_count() > 0
+    for probe in db.probes:
+        for matcher in probe.matchers:
+            assert isinstance(matcher["regex"], re.Pattern)
+
+
+@pytest.mark.parametrize("pad", [0, 600])
+def test_indexed_and_linear_matching_agree_on_the_corpus(pad):
+    db = ServiceFingerprintDB.load()
+    pad_database(db, pad)
+    for port, data in BANNER_CORPUS:
+        probe = db.probe_for_port(port)
+        assert db.match(probe, data) == linear_match(db, probe, data), (port, data)
+    assert sum(1 for port, data in BANNER_CORPUS if db.match(db.probe_for_port(port), data)) == len(BANNER_CORPUS) - 1
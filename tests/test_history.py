@@ -0,0 +1,66 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+from netscan_pro import ScanHistory, parse_since, port_state_changed
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "netscan_pro.py")
+
+
+def test_second_run_sees_what_the_first_recorded(tmp_path):
+    path = str(tmp_path / "history.db")
+    first = ScanHistory(path)
+    assert first.record_port("10.0.0.1", 22, "open", "ssh", "SSH-2.0-x", "OpenSSH 9.6") is None
+    assert first.record_port("10.0.0.1", 23, "closed") is None # Never open: not stored
+    assert first.record_port("10.0.0.1", 80, "open", "http") is None
+    first.close()
+
+    second = ScanHistory(path)
+    try:
+        assert second.last_run == first.started
+        since = parse_since("last", second)
+        assert {host: list(ports) for host, ports in second.open_ports_since(since).items()} == {"10.0.0.1": [22, 80]}
+        assert second.open_ports_since(since, proto="udp") == {}
+        previous = second.record_port("10.0.0.1", 22, "closed")
+        assert previous == ("open", "ssh", "OpenSSH 9.6")
+        assert port_state_changed(previous, "closed")
+        previous = second.record_port("10.0.0.1", 80, "open", "http", "", "nginx 1.25")
+        assert not port_state_changed(previous, "open", "http", "nginx 1.25") # First version seen is not a change
+        assert port_state_changed(None, "open") # Newly opened
+        assert not port_state_changed(None, "closed")
+        second.flush()
+        assert list(second.open_ports_since(since)["10.0.0.1"]) == [22, 80] # Changed since, so still probed first
+    finally:
+        second.close()
+
+
+def test_version_change_on_an_open_port_is_reported():
+    assert port_state_changed(("open", "http", "nginx 1.24"), "open", "http", "nginx 1.25")
+    assert not port_state_changed(("open", "http", "nginx 1.24"), "open", "http", "") # Not identified this time
+    assert not port_state_changed(("open", "unknown", ""), "open", "http", "")
+
+
+def free_port():
+    with socket.create_server(("127.0.0.1", 0)) as probe:
+        return probe.getsockname()[1]
+
+
+def scan(*args):
+    result = subprocess.run([sys.executable, SCRIPT, "-t", "127.0.0.1", *args], capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def test_diff_since_reports_opened_and_closed_ports(tmp_path):
+    history, changes = str(tmp_path / "history.db"), tmp_path / "changes.ndjson"
+    first_port, second_port = free_port(), free_port()
+    ports = f"{first_port},{second_port}"
+    with socket.create_server(("127.0.0.1", first_port)):
+        scan("-p", ports, "--history", history)
+    with socket.create_server(("127.0.0.1", second_port)):
+        output = scan("-p", ports, "--history", history, "--diff-since", "last", "--diff-sample", "1", "-oN", str(changes))
+    records = sorted((r["port"], r["previous"], r["state"]) for r in map(json.loads, changes.read_text().splitlines()))
+    assert records == sorted([(first_port, "open", "closed"), (second_port, "unseen", "open")])
+    assert "--- Changes since" in output
@@ -0,0 +1,44 @@
+from ipaddress import ip_address, ip_network
+
+from netscan_pro import MAX_IPV6_EXPANSION, expand_targets, iter_ips
+
+
+def addresses(targets):
+    return [ip_address(host) for host in iter_ips(targets)]
+
+
+def test_a_64_is_sampled_not_enumerated():
+    network = ip_network("2001:db8:1:2::/64")
+    hosts = addresses(expand_targets(str(network), ipv6_sample=500))
+    assert 256 < len(hosts) <= 256 + 500 # Lowest 256 after the anycast address, plus the draw (repeats collapse)
+    assert all(host in network for host in hosts)
+    assert hosts[:256] == [network[i] for i in range(1, 257)] # Routers and hand-numbered hosts first
+    assert ip_address("2001:db8:1:2::") not in hosts # Subnet-router anycast
+
+
+def test_sample_size_bounds_the_target_count():
+    for sample in (0, 100, 2000):
+        assert len(expand_targets("2001:db8::/64", ipv6_sample=sample)) <= 256 + sample
+    huge = expand_targets("2001:db8::/32", ipv6_sample=1000)
+    assert len(huge) <= 256 + 1000
+    assert all(host in ip_network("2001:db8::/32") for host in addresses(huge))
+
+
+def test_sampling_is_repeatable_for_resume():
+    assert list(expand_targets("2001:db8::/64", ipv6_sample=300)) == list(expand_targets("2001:db8::/64", ipv6_sample=300))
+    assert list(expand_targets("2001:db8::/64", ipv6_sample=300)) != list(expand_targets("2001:db8:0:1::/64", ipv6_sample=300))
+
+
+def test_wide_prefixes_also_sample_low_interface_ids_in_random_64s():
+    hosts = addresses(expand_targets("2001:db8::/48", ipv6_sample=400))
+    low = [host for host in hosts[256:] if int(host) & ((1 << 64) - 1) < 256]
+    assert len(low) >= 150 # About half the draw
+    assert len({int(host) >> 64 for host in low}) > 100 # Spread over many /64s
+
+
+def test_small_ipv6_ranges_are_enumerated_and_mixed_with_ipv4():
+    targets = expand_targets("fd00::1-fd00::10,10.0.0.1,fd00::/120")
+    hosts = [str(host) for host in addresses(targets)]
+    assert hosts[0] == "10.0.0.1"
+    assert len(hosts) == 1 + 256 # fd00::1-fd00::10 lies inside fd00::/120
+    assert 256 <= MAX_IPV6_EXPANSION
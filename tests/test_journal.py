@@ -0,0 +1,57 @@
+from netscan_pro import ScanJournal
+
+ENRICHED = {"fingerprint": {"product": "nginx", "version": "1.25.3"},
+            "tls": {"subject": "CN=example.test", "san": ["example.test"], "not_after": "2030-01-01T00:00:00Z"},
+            "http": {"status": 200, "server": "nginx/1.25.3", "title": "Welcome"}}
+
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / "scan.journal")
+    journal = ScanJournal(path)
+    journal.record_host("10.0.0.1", "up (ICMP)")
+    journal.record_host("10.0.0.2", "down (ICMP)")
+    journal.record_port("10.0.0.1", 22, "open", "ssh", "SSH-2.0-x", "OpenSSH 9.6")
+    journal.record_port("10.0.0.1", 80, "open", "http", "HTTP/1.1 200 OK")
+    journal.record_port("10.0.0.1", 443, "open", "https", "(no TLS or HTTP response)", "nginx 1.25.3", ENRICHED)
+    for port in (1, 2, 3, 444):
+        journal.record_port("10.0.0.1", port, "closed")
+    journal.record_port("10.0.0.1", 8080, "filtered (timeout)")
+    journal.close()
+    with open(path, "a") as f:
+        f.write('["P", "10.0.0.1", 9999, "clo') # Torn last line from a crash
+
+    resumed = ScanJournal(path)
+    try:
+        assert resumed.host_status == {"10.0.0.1": "up (ICMP)", "10.0.0.2": "down (ICMP)"}
+        assert resumed.probes_done() == 8
+        assert resumed.is_done("10.0.0.1", 444) and not resumed.is_done("10.0.0.1", 9999)
+        assert resumed.open_ports["10.0.0.1"] == [
+            {"port": 22, "status": "open", "service": "ssh", "banner": "SSH-2.0-x", "version": "OpenSSH 9.6"},
+            {"port": 80, "status": "open", "service": "http", "banner": "HTTP/1.1 200 OK"},
+            dict({"port": 443, "status": "open", "service": "https", "banner": "(no TLS or HTTP response)",
+                  "version": "nginx 1.25.3"}, **ENRICHED)]
+        states = resumed.port_states["10.0.0.1"]
+        assert {state: list(ports) for state, ports in states.items()} == {"closed": [1, 2, 3, 444], "filtered (timeout)": [8080]}
+    finally:
+        resumed.close()
+
+
+def test_journal_buffers_until_flushed(tmp_path):
+    path = tmp_path / "scan.journal"
+    journal = ScanJournal(str(path))
+    journal.record_port("h", 1, "closed")
+    assert path.read_text() == "" # Batched
+    journal.flush()
+    assert path.read_text() == '["P", "h", 1, "closed", "", ""]\n'
+    journal.close()
+    journal.close() # Safe to call twice (atexit and explicit)
+
+
+def test_journal_written_before_details_still_loads(tmp_path):
+    path = tmp_path / "scan.journal"
+    path.write_text('["P", "h", 22, "open", "ssh", "SSH-2.0-x", "OpenSSH 9.6"]\n["P", "h", 80, "open", "http", ""]\n')
+    journal = ScanJournal(str(path))
+    journal.close()
+    assert journal.open_ports["h"] == [
+        {"port": 22, "status": "open", "service": "ssh", "banner": "SSH-2.0-x", "version": "OpenSSH 9.6"},
+        {"port": 80, "status": "open", "service": "http", "banner": ""}]
@@ -0,0 +1,75 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from netscan_pro import MetricsServer, RateLimiter, ScanMetrics
+
+
+@pytest.fixture
+def served():
+    metrics = ScanMetrics(total=10, limiter=RateLimiter(500))
+    server = MetricsServer(("127.0.0.1", 0), metrics)
+    yield metrics, f"http://127.0.0.1:{server.address[1]}"
+    server.close()
+
+
+def scrape(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.headers["Content-Type"], response.read().decode()
+
+
+def parse_samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_endpoint_serves_prometheus_text(served):
+    metrics, url = served
+    for state in ("open", "closed", "closed", "filtered (timeout)"):
+        metrics.record(state)
+    metrics.observe_rtt(0.003)
+    metrics.observe_rtt(0.2)
+    kind, body = scrape(url + "/metrics")
+    assert kind.startswith("text/plain")
+    samples = parse_samples(body)
+    assert samples['netscan_probes_total{state="open"}'] == 1
+    assert samples['netscan_probes_total{state="closed"}'] == 2
+    assert samples['netscan_probes_total{state="filtered"}'] == 1 # Grouped by first word
+    assert samples["netscan_targets"] == 10
+    assert samples["netscan_rate_limit"] == 500
+    assert samples['netscan_rtt_seconds_bucket{le="0.0025"}'] == 0
+    assert samples['netscan_rtt_seconds_bucket{le="0.005"}'] == 1 # Buckets are cumulative
+    assert samples['netscan_rtt_seconds_bucket{le="+Inf"}'] == 2
+    assert samples["netscan_rtt_seconds_count"] == 2
+    assert samples["netscan_rtt_seconds_sum"] == pytest.approx(0.203)
+    assert "# TYPE netscan_rtt_seconds histogram" in body
+
+
+def test_metrics_follow_the_scan_between_scrapes(served):
+    metrics, url = served
+    before = parse_samples(scrape(url + "/metrics")[1])
+    assert not any(name.startswith("netscan_probes_total") for name in before)
+    assert "netscan_probes_in_flight" not in before # Unknown until an engine is tracked
+    list(metrics.track(iter([("h", 1), ("h", 2), ("h", 3)])))
+    metrics.record("open")
+    after = parse_samples(scrape(url + "/metrics")[1])
+    assert after['netscan_probes_total{state="open"}'] == 1
+    assert after["netscan_probes_in_flight"] == 2
+
+
+def test_metrics_json_and_unknown_paths(served):
+    metrics, url = served
+    metrics.record("closed")
+    kind, body = scrape(url + "/metrics.json")
+    assert kind == "application/json"
+    snapshot = json.loads(body)
+    assert snapshot["completed"] == 1 and snapshot["states"] == {"closed": 1} and snapshot["total"] == 10
+    with pytest.raises(urllib.error.HTTPError) as error:
+        scrape(url + "/")
+    assert error.value.code == 404
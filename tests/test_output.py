@@ -0,0 +1,125 @@
+import json
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import netscan_pro
+from netscan_pro import GrepableWriter, NdjsonWriter, ResultStore, XmlWriter, parse_ports
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_ndjson_one_object_per_result(tmp_path):
+    path = tmp_path / "scan.ndjson"
+    writer = NdjsonWriter(str(path))
+    writer.port("10.0.0.1", 22, "open", info={"service": "ssh", "banner": "SSH-2.0-x", "version": "OpenSSH 9.6"})
+    writer.port("10.0.0.1", 23, "closed")
+    writer.port("10.0.0.1", 443, "open", info={"service": "https", "banner": "", "tls": {"subject": "CN=x"}})
+    writer.port("10.0.0.1", 53, "open|filtered", proto="udp", previous="closed")
+    writer.close()
+    records = read_lines(path)
+    assert [(r["port"], r["state"], r["service"]) for r in records] == [
+        (22, "open", "ssh"), (23, "closed", ""), (443, "open", "https"), (53, "open|filtered", "")]
+    assert records[0]["version"] == "OpenSSH 9.6" and "version" not in records[1]
+    assert records[2]["tls"] == {"subject": "CN=x"}
+    assert records[3]["proto"] == "udp" and records[3]["previous"] == "closed"
+    assert all("time" in r for r in records)
+
+
+def test_ndjson_is_readable_while_the_scan_runs(tmp_path):
+    path = tmp_path / "scan.ndjson"
+    writer = NdjsonWriter(str(path))
+    try:
+        writer.port("10.0.0.1", 80, "closed")
+        deadline = time.monotonic() + 2
+        while not path.read_text() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [r["port"] for r in read_lines(path)] == [80] # Flushed once the writer caught up, not at close
+    finally:
+        writer.close()
+    writer.close() # Safe to call twice
+
+
+def scanned_store():
+    """10.0.0.1 with two identified services, one closed and three silent ports; 10.0.0.2 down."""
+    store = ResultStore(parse_ports("1-10"))
+    store.set_status("10.0.0.1", "up (ICMP)")
+    store.set_hostname("10.0.0.1", "box.example")
+    store.record("10.0.0.1", 2, "open", {"port": 2, "status": "open", "service": "ssh", "banner": "SSH-2.0-OpenSSH_9.6",
+                                         "version": "OpenSSH 9.6 (protocol 2.0)",
+                                         "fingerprint": {"product": "OpenSSH", "version": "9.6", "info": "protocol 2.0"}})
+    store.record("10.0.0.1", 8, "open", {"port": 8, "status": "open", "service": "http", "banner": "HTTP/1.1 200 OK",
+                                         "version": "nginx", "http": {"status": 200, "title": "Hi"}}) # e.g. from an older journal
+    store.record("10.0.0.1", 9, "open", {"port": 9, "status": "open", "service": "unknown", "banner": ""})
+    store.record("10.0.0.1", 1, "closed")
+    for port in (3, 4, 5):
+        store.record("10.0.0.1", port, "filtered (timeout)")
+    store.set_status("10.0.0.2", "down (ICMP)")
+    return store
+
+
+def write_output(writer_class, path, store, scan="connect"):
+    writer = writer_class(str(path))
+    writer.begin({"args": "netscan_pro.py -t 10.0.0.1-10.0.0.2 -p 1-10", "start": datetime(2024, 5, 6, 10, 0), "scan": scan,
+                  "proto": "tcp", "ports": parse_ports("1-10"), "verbose": 0})
+    for host in ("10.0.0.1", "10.0.0.2"):
+        writer.host(host, store.host_record(host))
+    writer.finish({"hosts_up": 1, "hosts_total": 2, "elapsed": 1.5})
+    writer.close()
+    return path.read_text()
+
+
+def test_xml_output_parses_as_nmap_xml(tmp_path):
+    root = ET.fromstring(write_output(XmlWriter, tmp_path / "scan.xml", scanned_store()))
+    assert root.tag == "nmaprun" and root.get("scanner") == "netscan_pro"
+    assert root.find("scaninfo").attrib == {"type": "connect", "protocol": "tcp", "numservices": "10", "services": "1-10"}
+    up, down = root.findall("host")
+    assert up.find("status").get("state") == "up" and up.find("status").get("reason") == "echo-reply"
+    assert up.find("address").attrib == {"addr": "10.0.0.1", "addrtype": "ipv4"}
+    assert up.find("hostnames/hostname").get("name") == "box.example"
+    assert down.find("status").get("state") == "down" and down.find("ports") is None
+    assert root.find("runstats/hosts").attrib == {"up": "1", "down": "1", "total": "2"}
+
+
+def test_xml_extraports_count_every_other_state(tmp_path):
+    root = ET.fromstring(write_output(XmlWriter, tmp_path / "scan.xml", scanned_store()))
+    extra = {e.get("state"): e for e in root.findall("host/ports/extraports")}
+    assert {state: e.get("count") for state, e in extra.items()} == {"closed": "1", "filtered": "3"}
+    assert extra["closed"].find("extrareasons").get("reason") == "conn-refused"
+    assert extra["filtered"].find("extrareasons").attrib == {"reason": "no-response", "count": "3", "proto": "tcp"}
+
+
+def test_xml_service_splits_product_version_and_extrainfo(tmp_path):
+    root = ET.fromstring(write_output(XmlWriter, tmp_path / "scan.xml", scanned_store()))
+    ports = {int(p.get("portid")): p for p in root.findall("host/ports/port")}
+    assert sorted(ports) == [2, 8, 9]
+    assert ports[2].find("state").attrib == {"state": "open", "reason": "syn-ack", "reason_ttl": "0"}
+    ssh = ports[2].find("service").attrib
+    assert (ssh["name"], ssh["product"], ssh["version"], ssh["extrainfo"], ssh["method"]) == ("ssh", "OpenSSH", "9.6", "protocol 2.0", "probed")
+    http = ports[8].find("service").attrib
+    assert http["product"] == "nginx" and "version" not in http and "extrainfo" not in http # No fingerprint: joined string as product
+    assert {s.get("id"): s.get("output") for s in ports[8].findall("script")} == {"banner": "HTTP/1.1 200 OK", "http-title": '200 "Hi"'}
+    assert ports[9].find("service").attrib == {"name": "unknown", "method": "table", "conf": "3"}
+
+
+def test_xml_escapes_banners():
+    value = netscan_pro._xml_attr('a<b & "c"\x00')
+    assert ET.fromstring("<x a=" + value + "/>").get("a") == 'a<b & "c"\\x00' # XML 1.0 can't carry NUL at all
+
+
+def test_grepable_ports_field(tmp_path):
+    lines = write_output(GrepableWriter, tmp_path / "scan.gnmap", scanned_store()).splitlines()
+    assert lines[0].startswith("# NetScan Pro scan initiated ") and lines[-1].startswith("# NetScan Pro done at ")
+    body = [line.split("\t") for line in lines[1:-1]]
+    assert body[0] == ["Host: 10.0.0.1 (box.example)", "Status: Up"]
+    assert body[1][0] == "Host: 10.0.0.1 (box.example)"
+    assert body[1][1] == ("Ports: 2/open/tcp//ssh//OpenSSH 9.6 (protocol 2.0)/, 8/open/tcp//http//nginx/, 9/open/tcp//unknown///")
+    assert body[1][2] == "Ignored State: filtered (3)" # The most common other state
+    assert body[2] == ["Host: 10.0.0.2 ()", "Status: Down"]
+    assert len(body) == 3
+
+
+def test_grepable_fields_cannot_break_the_layout():
+    assert GrepableWriter._field("Apache/2.4, mod_ssl\tx\n") == "Apache|2.4  mod_ssl x "
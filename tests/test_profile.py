@@ -0,0 +1,88 @@
+import os
+import pstats
+import socket
+import subprocess
+import sys
+import time
+
+import netscan_pro
+from netscan_pro import PoolStats, ScanProfile, StackSampler, worker_pool
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "netscan_pro.py")
+
+
+def test_stages_are_timed_in_order():
+    profile = ScanProfile()
+    profile.enter("targets")
+    profile.enter("port scan")
+    time.sleep(0.05)
+    profile.enter("output")
+    profile._close_stage()
+    assert [stage[0] for stage in profile.stages] == ["targets", "port scan", "output"]
+    assert profile.stages[1][1] >= 0.05
+
+
+def test_timed_results_passes_results_through_and_counts_them():
+    profile = ScanProfile()
+    assert list(profile.timed_results(iter([1, 2, 3]))) == [1, 2, 3]
+    assert profile.results == 3
+
+
+def test_pool_stats_track_tasks_and_utilisation():
+    stats = PoolStats("probe", 1)
+    queued = time.perf_counter()
+    assert stats.run(queued, lambda x: x * 2, 21) == 42
+    assert stats.tasks == 1 and stats.busy >= 0 and stats.wait >= 0
+    assert 0 < stats.utilisation() <= 1.0
+    assert PoolStats("idle", 4).utilisation() == 0.0
+
+
+def test_worker_pool_is_instrumented_only_while_profiling(monkeypatch):
+    profile = ScanProfile()
+    monkeypatch.setattr(netscan_pro, "_profile", profile)
+    with worker_pool(2, "probe") as pool:
+        assert sorted(pool.map(abs, [-1, -2, -3])) == [1, 2, 3]
+    assert profile.pools["probe"].tasks == 3
+    monkeypatch.setattr(netscan_pro, "_profile", None)
+    with worker_pool(2, "plain") as pool:
+        assert list(pool.map(abs, [-1])) == [1]
+    assert "plain" not in profile.pools
+
+
+def test_stack_sampler_writes_folded_stacks(tmp_path):
+    path = tmp_path / "stacks.folded"
+    sampler = StackSampler(str(path), interval=0.001)
+    time.sleep(0.1)
+    sampler.close()
+    stacks = dict(line.rsplit(" ", 1) for line in path.read_text().splitlines())
+    assert all(int(count) > 0 for count in stacks.values())
+    assert any(stack.startswith("MainThread;") and "test_stack_sampler_writes_folded_stacks" in stack for stack in stacks)
+
+
+def profiled_scan(output):
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        ports = f"1-2000,{listener.getsockname()[1]}" # Enough closed ports for the sampler to catch the scan
+        result = subprocess.run([sys.executable, SCRIPT, "-t", "127.0.0.1", "-p", ports, "--profile-output", str(output)],
+                                capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout.split("--- Profile ---", 1)[1]
+
+
+def test_profile_output_after_a_short_scan_writes_folded_stacks(tmp_path):
+    output = tmp_path / "scan.folded"
+    report = profiled_scan(output)
+    for stage in ("targets", "port scan", "output"):
+        assert f"\n  {stage.ljust(18)} " in report
+    assert "Result loop:" in report
+    assert f"Folded stack samples written to {output}" in report
+    stacks = [line.rsplit(" ", 1) for line in output.read_text().splitlines()]
+    assert stacks and all(count.isdigit() for _, count in stacks)
+    assert any(stack.startswith("MainThread;") for stack, _ in stacks)
+
+
+def test_profile_output_to_prof_writes_cprofile_statistics(tmp_path):
+    output = tmp_path / "scan.prof"
+    report = profiled_scan(output)
+    assert f"cProfile statistics (main thread) written to {output}" in report
+    functions = {name for _, _, name in pstats.Stats(str(output)).stats}
+    assert "expand_targets" in functions # Called by main() after the profiler starts
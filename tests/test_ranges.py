@@ -0,0 +1,78 @@
+import pytest
+
+import netscan_pro
+from netscan_pro import IntRangeSet, iter_values, parse_ports, permuted_indices
+
+
+def test_adjacent_and_overlapping_ranges_merge():
+    values = IntRangeSet()
+    values.add(10, 20)
+    values.add(21, 25) # Touching
+    values.add(15, 30) # Overlapping
+    values.add(40)
+    assert list(values.ranges()) == [(10, 30), (40, 40)]
+    assert len(values) == 22
+    assert 30 in values and 31 not in values and 40 in values
+
+
+def test_duplicates_are_counted_once():
+    values = IntRangeSet([5, 5, 6, 5])
+    assert len(values) == 2
+    assert list(values) == [5, 6]
+
+
+def test_getitem_and_index_are_inverse_over_scattered_ranges():
+    values = IntRangeSet()
+    for start in range(0, 3000, 7):
+        values.add(start, start + 2)
+    expected = list(values)
+    assert [values[i] for i in range(len(values))] == expected
+    assert all(values.index(v) == i for i, v in enumerate(expected))
+    assert values[-1] == expected[-1]
+
+
+def test_lookups_see_later_additions():
+    values = IntRangeSet([1, 2, 3])
+    assert values[2] == 3
+    values.add(0)
+    assert values[0] == 0 and values.index(3) == 3
+
+
+def test_getitem_out_of_range():
+    values = IntRangeSet([1, 2])
+    with pytest.raises(IndexError):
+        values[2]
+    with pytest.raises(IndexError):
+        values[-3]
+    with pytest.raises(ValueError):
+        values.index(5)
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 10, 97, 1000])
+def test_permuted_indices_is_a_permutation(n):
+    assert sorted(permuted_indices(n, seed=1)) == list(range(n))
+
+
+def test_permuted_indices_is_reproducible_with_a_seed():
+    assert list(permuted_indices(500, seed=7)) == list(permuted_indices(500, seed=7))
+    assert list(permuted_indices(500, seed=7)) != list(range(500))
+
+
+def test_randomized_iteration_covers_every_value():
+    values = IntRangeSet()
+    for start in range(0, 100000, 10):
+        values.add(start, start + 3)
+    shuffled = list(iter_values(values, randomize=True))
+    assert shuffled != list(values)
+    assert sorted(shuffled) == list(values)
+
+
+def test_parse_ports(capsys):
+    ports = parse_ports("22, 80,0-3,65530-70000,70000,0,abc")
+    assert list(ports.ranges()) == [(1, 3), (22, 22), (80, 80), (65530, 65535)]
+    out = capsys.readouterr().out
+    assert "Invalid port specified: 70000" in out
+    assert "Invalid port specified: 0" in out
+    assert "Invalid port specified: abc" in out
+    assert len(parse_ports("all")) == 65535
+    assert list(parse_ports("", top_n=3)) == sorted(netscan_pro.COMMON_TCP_PORTS)[:3]
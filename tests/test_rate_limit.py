@@ -0,0 +1,94 @@
+import pytest
+
+from netscan_pro import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def run_window(limiter, clock, replies, timeouts):
+    """One congestion-control window's worth of outcomes; the last one closes the window."""
+    outcomes = ["filtered (timeout)"] * timeouts + ["closed"] * replies
+    for state in outcomes[:-1]:
+        limiter.observe(state)
+    clock.now += limiter.WINDOW
+    limiter.observe(outcomes[-1])
+
+
+def test_bucket_starts_full_then_paces_at_the_rate(clock):
+    limiter = RateLimiter(100, clock=clock)
+    depth = int(100 * limiter.BURST)
+    assert [limiter.reserve() for _ in range(depth)] == [0.0] * depth # A burst's worth is ready
+    assert limiter.reserve() == pytest.approx(0.01) # Then one token per 1/rate seconds
+    assert limiter.reserve() == pytest.approx(0.02) # Debt accumulates for queued callers
+
+
+def test_tokens_refill_at_the_target_rate(clock):
+    limiter = RateLimiter(200, clock=clock)
+    while limiter.reserve() == 0:
+        pass # Leaves the bucket one token in debt
+    clock.now += 0.0125 # 2.5 tokens at 200/s
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == pytest.approx(0.5 / 200)
+    clock.now += 10 # A long idle spell refills the bucket only to its depth
+    ready = 0
+    while limiter.reserve() == 0:
+        ready += 1
+    assert ready == int(200 * limiter.BURST)
+
+
+def test_loss_cuts_the_rate_multiplicatively_down_to_the_floor(clock):
+    limiter = RateLimiter(100, min_rate=10, clock=clock)
+    run_window(limiter, clock, replies=20, timeouts=0) # Sets the baseline
+    assert limiter.rate == 100
+    rates = []
+    for _ in range(5):
+        run_window(limiter, clock, replies=4, timeouts=16)
+        rates.append(limiter.rate)
+    assert rates == [50, 25, 12.5, 10, 10]
+    assert limiter.decreases == 5
+
+
+def test_healthy_windows_recover_additively_to_the_cap(clock):
+    limiter = RateLimiter(100, min_rate=10, clock=clock)
+    run_window(limiter, clock, replies=20, timeouts=0)
+    run_window(limiter, clock, replies=0, timeouts=20)
+    run_window(limiter, clock, replies=0, timeouts=20)
+    assert limiter.rate == 25
+    rates = []
+    for _ in range(20):
+        run_window(limiter, clock, replies=20, timeouts=0)
+        rates.append(limiter.rate)
+    assert rates[:3] == [30, 35, 40] # INCREASE * max_rate per window
+    assert rates[-1] == 100 and max(rates) == 100
+
+
+def test_steady_loss_is_the_baseline_not_congestion(clock):
+    limiter = RateLimiter(100, clock=clock)
+    for _ in range(10):
+        run_window(limiter, clock, replies=5, timeouts=15) # A host that drops most ports
+    assert limiter.rate == 100 and limiter.decreases == 0
+
+
+def test_windows_need_time_and_samples(clock):
+    limiter = RateLimiter(100, clock=clock)
+    run_window(limiter, clock, replies=20, timeouts=0)
+    for _ in range(50):
+        limiter.observe("filtered (timeout)") # Plenty of samples, but the window hasn't elapsed
+    assert limiter.rate == 100
+    clock.now += limiter.WINDOW
+    for _ in range(5):
+        limiter.observe("error (permission)") # Local failures don't count
+    assert limiter.rate == 100
+    limiter.observe("filtered (timeout)")
+    assert limiter.rate == 50
@@ -0,0 +1,104 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import netscan_pro
+from netscan_pro import Resolver
+
+
+@pytest.fixture
+def fake_dns(monkeypatch):
+    """Replaces the system resolver: names in `zone` resolve, anything else fails. Counts lookups."""
+    zone = {"app.example": "192.0.2.10", "db.example": "192.0.2.20"}
+    calls = []
+    gate = threading.Event()
+    gate.set()
+
+    def getaddrinfo(name, port, family, kind):
+        calls.append(name)
+        gate.wait(5)
+        if name not in zone:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(family, kind, 6, "", (zone[name], 0))]
+
+    def gethostbyaddr(address):
+        calls.append(address)
+        return "ptr.example", [], [address]
+
+    monkeypatch.setattr(netscan_pro.socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(netscan_pro.socket, "gethostbyaddr", gethostbyaddr)
+    return calls, gate
+
+
+def test_answers_and_failures_are_cached(fake_dns):
+    calls, _ = fake_dns
+    resolver = Resolver(threads=4)
+    try:
+        assert resolver.resolve("app.example").result() == "192.0.2.10"
+        assert resolver.resolve("app.example").result() == "192.0.2.10"
+        assert resolver.resolve("nope.example").result() is None
+        assert resolver.resolve("nope.example").result() is None # Negative answers are cached too
+        assert resolver.reverse("192.0.2.10").result() == "ptr.example"
+    finally:
+        resolver.close()
+    assert calls == ["app.example", "nope.example", "192.0.2.10"]
+    assert resolver.cached == 2
+
+
+def test_concurrent_requests_share_one_lookup(fake_dns):
+    calls, gate = fake_dns
+    gate.clear() # Hold the first lookup in flight
+    resolver = Resolver(threads=4)
+    try:
+        futures = [resolver.resolve("db.example") for _ in range(5)]
+        gate.set()
+        assert {future.result() for future in futures} == {"192.0.2.20"}
+    finally:
+        resolver.close()
+    assert calls == ["db.example"]
+
+
+def test_cache_file_is_reused_until_entries_expire(fake_dns, tmp_path):
+    calls, _ = fake_dns
+    cache = tmp_path / "dns.json"
+    path = str(cache)
+    first = Resolver(ttl=0.5, cache_file=path)
+    first.resolve("app.example").result()
+    first.close()
+    assert [entry[:4] for entry in json.loads(cache.read_text())["entries"]] == [["A", "app.example", socket.AF_INET, "192.0.2.10"]]
+
+    reloaded = Resolver(ttl=0.5, cache_file=path)
+    assert reloaded.resolve("app.example").result() == "192.0.2.10"
+    reloaded.close()
+    assert calls == ["app.example"] and reloaded.cached == 1 # Hit straight from the file
+
+    time.sleep(0.6)
+    expired = Resolver(ttl=0.5, cache_file=path)
+    assert expired.resolve("app.example").result() == "192.0.2.10"
+    expired.close()
+    assert calls == ["app.example", "app.example"] and expired.cached == 0
+
+
+def test_submitted_names_come_out_once(fake_dns):
+    resolver = Resolver(threads=4)
+    try:
+        for name in ("app.example", "db.example", "app.example", "nope.example"):
+            resolver.submit(name)
+        assert resolver.pending() == 3
+        assert sorted(resolver.completed()) == [("app.example", "192.0.2.10"), ("db.example", "192.0.2.20"), ("nope.example", None)]
+        assert resolver.pending() == 0
+    finally:
+        resolver.close()
+
+
+def test_unreadable_cache_file_is_ignored(fake_dns, tmp_path, capsys):
+    path = tmp_path / "dns.json"
+    path.write_text("{not json")
+    resolver = Resolver(cache_file=str(path))
+    assert resolver.resolve("app.example").result() == "192.0.2.10"
+    resolver.close()
+    assert "Ignoring unreadable DNS cache" in capsys.readouterr().out
+    assert json.loads(path.read_text())["entries"] # Rewritten on close
@@ -0,0 +1,77 @@
+import json
+
+from netscan_pro import ResultStore, parse_ports
+
+
+def scan_host(store, host, ports, open_ports=()):
+    for port in ports:
+        if port in open_ports:
+            store.record(host, port, "open", {"port": port, "status": "open", "service": "http", "banner": ""})
+        else:
+            store.record(host, port, "filtered (timeout)" if port % 2 else "closed")
+
+
+def test_host_record_and_counts():
+    store = ResultStore(parse_ports("1-10"))
+    store.set_status("10.0.0.1", "up (ICMP)")
+    scan_host(store, "10.0.0.1", range(1, 11), open_ports={8, 4})
+    store.set_hostname("10.0.0.1", "box.example")
+    record = store.host_record("10.0.0.1")
+    assert record["status"] == "up (ICMP)"
+    assert [p["port"] for p in record["ports"]] == [4, 8]
+    assert record["hostname"] == "box.example"
+    assert record["port_states"] == {"closed": 3, "filtered (timeout)": 5}
+    assert store.state_counts(brief=True) == {"closed": 3, "filtered": 5, "open": 2}
+
+
+def test_repeated_result_for_a_port_replaces_the_old_one():
+    store = ResultStore(parse_ports("1-3"))
+    store.record("h", 1, "filtered (timeout)")
+    store.record("h", 1, "closed")
+    assert store.state_counts("h") == {"closed": 1}
+
+
+def test_hosts_without_results_take_no_matrix_space():
+    store = ResultStore(parse_ports("all"))
+    for i in range(1000):
+        store.set_status(f"10.0.{i // 256}.{i % 256}", "down (ICMP)")
+    assert len(store) == 1000
+    assert len(store._matrix) == 0
+    assert store.state_counts("10.0.0.1") == {}
+    assert store.status("10.0.0.1") == "down (ICMP)"
+    assert store.status("192.0.2.1", "unknown") == "unknown"
+
+
+def test_hosts_past_the_matrix_cap_keep_counts():
+    store = ResultStore(parse_ports("1-100"), max_matrix=250)
+    for host in ("a", "b", "c", "d"):
+        scan_host(store, host, range(1, 101), open_ports={22})
+    assert len(store._matrix) == 200 # Two dense rows; "c" and "d" only count
+    expected = {"open": 1, "closed": 49, "filtered (timeout)": 50}
+    assert all(store.state_counts(host) == expected for host in "abcd")
+    assert store.state_counts(brief=True) == {"open": 4, "closed": 196, "filtered": 200}
+    assert store.host_record("d")["ports"][0]["port"] == 22
+
+
+def test_ports_outside_the_scan_are_kept_only_if_open():
+    store = ResultStore(parse_ports("1-10"))
+    store.record("h", 8080, "open", {"port": 8080, "status": "open"})
+    store.record("h", 9090, "closed")
+    assert store.state_counts("h") == {}
+    assert [p["port"] for p in store.open_ports("h")] == [8080]
+
+
+def test_write_json(tmp_path):
+    store = ResultStore(parse_ports("1-4"))
+    store.set_status("10.0.0.1", "up (ICMP)")
+    scan_host(store, "10.0.0.1", range(1, 5), open_ports={2})
+    store.set_status("10.0.0.2", "down (ICMP)")
+    path = tmp_path / "out.json"
+    store.write_json(str(path))
+    data = json.loads(path.read_text())
+    assert data["10.0.0.2"] == {"status": "down (ICMP)", "ports": []}
+    assert data["10.0.0.1"]["port_states"] == {"filtered (timeout)": 2, "closed": 1}
+    empty = tmp_path / "empty.json"
+    ResultStore().write_json(str(empty))
+    assert json.loads(empty.read_text()) == {}
+
@@ -0,0 +1,57 @@
+from netscan_pro import PairScheduler, interleave_pairs
+
+
+def drain(scheduler):
+    pairs = []
+    while True:
+        pair = scheduler.next_pair()
+        if pair is None:
+            return pairs
+        pairs.append(pair)
+
+
+def test_scheduler_caps_probes_per_host():
+    scheduler = PairScheduler(interleave_pairs(["a", "b"], range(1, 6)), max_per_host=2)
+    first = drain(scheduler)
+    assert sorted(first) == [("a", 1), ("a", 2), ("b", 1), ("b", 2)]
+    assert scheduler.in_flight == {"a": 2, "b": 2}
+    assert not scheduler.finished() # The rest are parked
+
+
+def test_scheduler_releases_parked_pairs_in_order_as_slots_free():
+    scheduler = PairScheduler(interleave_pairs(["a", "b"], range(1, 6)), max_per_host=2)
+    drain(scheduler)
+    scheduler.done("a")
+    assert scheduler.next_pair() == ("a", 3)
+    assert scheduler.next_pair() is None # "a" is full again and "b" hasn't freed a slot
+    scheduler.done("b")
+    scheduler.done("b")
+    assert drain(scheduler) == [("b", 3), ("b", 4)]
+
+
+def test_scheduler_hands_out_every_pair_once():
+    pairs = list(interleave_pairs([f"h{i}" for i in range(5)], range(1, 50)))
+    scheduler = PairScheduler(iter(pairs), max_per_host=3)
+    sent = []
+    while not scheduler.finished():
+        batch = drain(scheduler)
+        assert batch or scheduler.in_flight
+        assert all(count <= 3 for count in scheduler.in_flight.values())
+        sent += batch
+        for host, _ in batch:
+            scheduler.done(host)
+    assert sorted(sent) == sorted(pairs)
+
+
+def test_scheduler_without_a_cap_never_defers():
+    scheduler = PairScheduler([("a", port) for port in range(100)], max_per_host=0)
+    assert len(drain(scheduler)) == 100
+    assert scheduler.finished()
+
+
+def test_scheduler_stops_reading_ahead_when_too_much_is_parked(monkeypatch):
+    monkeypatch.setattr(PairScheduler, "MAX_DEFERRED", 5)
+    scheduler = PairScheduler([("a", port) for port in range(100)], max_per_host=1)
+    assert drain(scheduler) == [("a", 0)]
+    assert scheduler._deferred_count == 5
+
@@ -0,0 +1,51 @@
+import threading
+
+import netscan_pro
+
+
+def wait_with_deadline(stage, seconds=5):
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(stage.wait()), daemon=True)
+    waiter.start()
+    waiter.join(seconds)
+    assert result, "wait() never returned"
+    return result[0]
+
+
+def test_failed_detection_still_reports_a_result(monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(netscan_pro, "detect_service", broken)
+    stage = netscan_pro.ServiceDetectionStage(2, lambda host: 0.1)
+    try:
+        stage.submit("127.0.0.1", 1)
+        host, port, detection = wait_with_deadline(stage)
+    finally:
+        stage.shutdown()
+    assert (host, port) == ("127.0.0.1", 1)
+    assert detection["banner"] == "(banner grab error)"
+    assert "boom" in detection["error"]
+    assert stage.outstanding == 0
+
+
+def test_detection_results_pair_with_submits(monkeypatch):
+    calls = iter([RuntimeError("first"), None, RuntimeError("third")])
+
+    def flaky(host, port, *args):
+        error = next(calls)
+        if error:
+            raise error
+        return {"banner": "ok", "service": "", "version": ""}
+
+    monkeypatch.setattr(netscan_pro, "detect_service", flaky)
+    stage = netscan_pro.ServiceDetectionStage(1, lambda host: 0.1)
+    try:
+        for port in (1, 2, 3):
+            stage.submit("127.0.0.1", port)
+        results = sorted(wait_with_deadline(stage) for _ in range(3))
+    finally:
+        stage.shutdown()
+    assert [port for _, port, _ in results] == [1, 2, 3]
+    assert [d["banner"] for _, _, d in results] == ["(banner grab error)", "ok", "(banner grab error)"]
+    assert stage.outstanding == 0
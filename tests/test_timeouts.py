@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+import netscan_pro
+from netscan_pro import RttTracker, icmp_ping
+
+
+def test_rtt_tracker_uses_initial_timeout_without_samples():
+    rtt = RttTracker(1.5)
+    assert rtt.timeout("10.0.0.1") == 1.5
+    assert rtt.srtt("10.0.0.1") is None
+
+
+def test_rtt_tracker_follows_rfc6298():
+    rtt = RttTracker(1.0, min_timeout=0.0, max_timeout=10.0)
+    rtt.observe("h", 0.1)
+    assert rtt.srtt("h") == pytest.approx(0.1)
+    assert rtt.timeout("h") == pytest.approx(0.1 + 4 * 0.05)
+    rtt.observe("h", 0.3)
+    rttvar = 0.75 * 0.05 + 0.25 * 0.2
+    srtt = 0.875 * 0.1 + 0.125 * 0.3
+    assert rtt.srtt("h") == pytest.approx(srtt)
+    assert rtt.timeout("h") == pytest.approx(srtt + 4 * rttvar)
+
+
+def test_rtt_tracker_clamps_and_backs_off():
+    rtt = RttTracker(1.0, min_timeout=0.2, max_timeout=2.0)
+    rtt.observe("fast", 0.001)
+    assert rtt.timeout("fast") == 0.2
+    assert rtt.retry_timeout("fast") == 0.4
+    rtt.observe("slow", 5.0)
+    assert rtt.timeout("slow") == 2.0
+    assert rtt.retry_timeout("slow") == 2.0
+
+
+def test_rtt_tracker_notifies_listener():
+    seen = []
+    rtt = RttTracker(1.0)
+    rtt.listener = seen.append
+    rtt.observe("h", 0.05)
+    assert seen == [0.05]
+
+
+class FakePacket:
+    def __init__(self, *layers, **fields):
+        self.layers = layers
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __truediv__(self, other):
+        return self
+
+    def haslayer(self, layer):
+        return layer in self.layers
+
+    def __getitem__(self, layer):
+        return self
+
+
+def fake_scapy(answered):
+    """Just enough of scapy.all for icmp_ping; sr() answers with the (sent, received) pairs given."""
+    scapy = SimpleNamespace(ICMP=type("ICMP", (), {}), ICMPv6EchoReply=type("ICMPv6EchoReply", (), {}))
+    scapy.IP = lambda dst: FakePacket()
+    scapy.sr = lambda pkt, timeout, verbose: (answered(scapy), [])
+    return scapy
+
+
+def test_icmp_ping_seeds_rtt_from_the_sent_copy(monkeypatch):
+    scapy = fake_scapy(lambda scapy: [(FakePacket(sent_time=10.0), FakePacket(scapy.ICMP, type=0, time=10.25))])
+    monkeypatch.setattr(netscan_pro, "load_scapy", lambda: scapy)
+    rtt = RttTracker(1.0)
+    assert icmp_ping("192.0.2.1", 1.0, rtt=rtt)
+    assert rtt.srtt("192.0.2.1") == pytest.approx(0.25)
+
+
+def test_icmp_ping_without_a_reply(monkeypatch):
+    monkeypatch.setattr(netscan_pro, "load_scapy", lambda: fake_scapy(lambda scapy: []))
+    rtt = RttTracker(1.0)
+    assert not icmp_ping("192.0.2.1", 1.0, rtt=rtt)
+    assert rtt.srtt("192.0.2.1") is None
@@ -0,0 +1,84 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from netscan_pro import UDP_RETRIES, udp_errors_available, udp_scan
+
+needs_errqueue = pytest.mark.skipif(not udp_errors_available(), reason="needs Linux IP_RECVERR/MSG_ERRQUEUE")
+
+
+class UdpServer:
+    """A UDP socket on 127.0.0.1 that echoes datagrams back, or with echo=False just counts them."""
+
+    def __init__(self, echo=True):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.received = 0
+        self.echo = echo
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while self._running:
+            try:
+                data, peer = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            self.received += 1
+            if self.echo:
+                self.sock.sendto(data or b"\x00", peer)
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def udp_server():
+    servers = []
+
+    def start(echo=True):
+        servers.append(UdpServer(echo))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def closed_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@needs_errqueue
+def test_echo_is_open_and_port_unreachable_is_closed(udp_server):
+    echo, closed = udp_server().port, closed_udp_port()
+    start = time.monotonic()
+    result = {port: state for _, port, state in udp_scan([("127.0.0.1", echo), ("127.0.0.1", closed)], 2.0)}
+    assert result == {echo: "open", closed: "closed"} # "closed" only comes from the ICMP error queue
+    assert time.monotonic() - start < 1.5 # Both answered; nothing waited out the timeout
+
+
+@needs_errqueue
+def test_silence_is_open_or_filtered_after_the_timeout(udp_server):
+    silent = udp_server(echo=False)
+    start = time.monotonic()
+    assert list(udp_scan([("127.0.0.1", silent.port)], 0.3)) == [("127.0.0.1", silent.port, "open|filtered")]
+    assert time.monotonic() - start >= 0.3
+    assert silent.received == 1 # A host that never answered gets no retries
+
+
+@needs_errqueue
+def test_silent_port_on_a_host_that_answers_is_retried(udp_server):
+    silent, closed = udp_server(echo=False), closed_udp_port()
+    result = {port: state for _, port, state in udp_scan([("127.0.0.1", closed), ("127.0.0.1", silent.port)], 0.2)}
+    assert result == {closed: "closed", silent.port: "open|filtered"}
+    assert silent.received == 1 + UDP_RETRIES # Its ICMP error may have been rationed